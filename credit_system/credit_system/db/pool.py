@@ -0,0 +1,189 @@
+"""
+A blocking, thread-safe pool of DB-API connections
+
+Used by the pooled_postgresql backend: Django "closes" its connection at
+the end of every request (CONN_MAX_AGE = 0) and the pool keeps the
+physical connection open for the next request, so the TCP and auth
+handshake is paid once per connection instead of once per request.
+
+- at most `max_size` connections; a checkout beyond that waits up to
+  `timeout` seconds for one to come back, then raises PoolTimeout
+- connections older than `max_lifetime` seconds are closed instead of
+  being reused, so the server side is recycled now and then
+- acquire() is given the function that opens a new connection, so the
+  pool knows nothing about psycopg2
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """No connection came back within the pool timeout"""
+
+
+# Handed to a waiter instead of a connection: "a slot is free, open one"
+NEW_SLOT = object()
+
+
+class ConnectionPool:
+
+    def __init__(self, max_size=10, timeout=30.0, max_lifetime=3600.0):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._lock = threading.Lock()
+        self._idle = deque()  # (connection, created_at), most recently used last
+        self._waiters = deque()  # [event, handed over connection], oldest first
+        self._created_at = {}  # id(connection) -> monotonic time it was opened
+        self._size = 0  # open connections plus slots reserved for opening one
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+        }
+
+    def acquire(self, connect):
+        """
+        An open connection, reused or new (opened with `connect()`)
+        Blocks while the pool is exhausted; waiters are served in arrival
+        order, a returned connection goes straight to the oldest one
+        """
+        waiter = None
+        with self._lock:
+            connection = None if self._waiters else self._pop_idle()
+            if connection is not None:
+                self._stats['checkouts'] += 1
+                return connection
+            if not self._waiters and self._size < self.max_size:
+                self._size += 1  # reserve a slot, connect outside the lock
+                self._stats['checkouts'] += 1
+            else:
+                waiter = [threading.Event(), None]
+                self._waiters.append(waiter)
+                self._stats['waits'] += 1
+
+        if waiter is not None:
+            connection = self._wait(waiter)
+            if connection is not NEW_SLOT:
+                return connection
+        return self._open(connect)
+
+    def release(self, connection, reusable=True):
+        """Give a connection back; closed, broken or expired ones are dropped"""
+        with self._lock:
+            created_at = self._created_at.get(id(connection), 0.0)
+            if not reusable or getattr(connection, 'closed', False) or self._expired(created_at):
+                self._discard(connection)
+                self._free_slot()
+            elif self._waiters:
+                self._hand_over(connection)
+            else:
+                self._idle.append((connection, created_at))
+
+    def close_all(self):
+        """Close the idle connections (checked out ones are closed on release)"""
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(
+                max_size=self.max_size,
+                size=self._size,
+                idle=len(self._idle),
+                checked_out=self._size - len(self._idle),
+                waiting=len(self._waiters),
+            )
+        stats['wait_time_ms'] = round(stats.pop('wait_time') * 1000, 3)
+        return stats
+
+    def _wait(self, waiter):
+        started = time.monotonic()
+        waiter[0].wait(self.timeout)
+        with self._lock:
+            self._stats['wait_time'] += time.monotonic() - started
+            if waiter[1] is None:
+                self._waiters.remove(waiter)
+                self._stats['timeouts'] += 1
+                raise PoolTimeout(f"no connection available after {self.timeout}s ({self.max_size} in use)")
+            self._stats['checkouts'] += 1
+            return waiter[1]
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._lock:
+                self._stats['checkouts'] -= 1
+                self._size -= 1
+                self._free_slot()
+            raise
+        with self._lock:
+            self._created_at[id(connection)] = time.monotonic()
+            self._stats['connections_created'] += 1
+        return connection
+
+    # The helpers below are called with the lock held
+
+    def _pop_idle(self):
+        while self._idle:
+            connection, created_at = self._idle.pop()
+            if getattr(connection, 'closed', False) or self._expired(created_at):
+                self._discard(connection)
+                continue
+            return connection
+        return None
+
+    def _hand_over(self, connection):
+        waiter = self._waiters.popleft()
+        waiter[1] = connection
+        waiter[0].set()
+
+    def _free_slot(self):
+        """A slot became free: the oldest waiter gets to open a connection"""
+        if self._waiters and self._size < self.max_size:
+            self._size += 1
+            self._hand_over(NEW_SLOT)
+
+    def _expired(self, created_at):
+        return self.max_lifetime is not None and time.monotonic() - created_at > self.max_lifetime
+
+    def _discard(self, connection):
+        self._size -= 1
+        self._created_at.pop(id(connection), None)
+        self._stats['connections_discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, **options):
+    """
+    The pool of a database alias in this process, created on first use
+    A forked worker gets a fresh pool instead of the parent's sockets
+    """
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+def pool_stats():
+    """{alias: stats} for the pools of this process"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = {alias: pool for (owner, alias), pool in _pools.items() if owner == pid}
+    return {alias: pool.stats() for alias, pool in pools.items()}
@@ -0,0 +1,60 @@
+"""
+PostgreSQL backend with an in-process connection pool
+
+    'ENGINE': 'credit_system.db.pooled_postgresql',
+    'CONN_MAX_AGE': 0,
+    'POOL': {'MAX_SIZE': 10, 'TIMEOUT': 30, 'MAX_LIFETIME': 3600},
+
+Identical to django.db.backends.postgresql (psycopg2), except that opening
+a connection checks one out of the process-wide pool (credit_system.db.pool)
+and closing it gives it back. Keep CONN_MAX_AGE at 0 so every request
+returns its connection; a connection is handed back only after any open
+transaction is rolled back, and a broken one is dropped instead.
+"""
+from django.db.backends.postgresql import base as postgresql
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from credit_system.db.pool import get_pool
+
+POOL_DEFAULTS = {'MAX_SIZE': 10, 'TIMEOUT': 30.0, 'MAX_LIFETIME': 3600.0}
+
+
+class DatabaseWrapper(postgresql.DatabaseWrapper):
+
+    @property
+    def pool(self):
+        options = {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+        return get_pool(
+            self.alias,
+            max_size=int(options['MAX_SIZE']),
+            timeout=float(options['TIMEOUT']),
+            max_lifetime=float(options['MAX_LIFETIME']) if options['MAX_LIFETIME'] is not None else None,
+        )
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # The parent sets this when it opens a connection; a reused one
+        # still needs it on this wrapper
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            self.pool.release(self.connection, reusable=self._reset_for_reuse(self.connection))
+
+    def _reset_for_reuse(self, connection):
+        """Roll back whatever the request left open; False if the connection is unusable"""
+        if connection.closed:
+            return False
+        try:
+            if connection.get_transaction_status() != postgresql.Database.extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            if not connection.autocommit:
+                connection.autocommit = True
+        except postgresql.Database.Error:
+            return False
+        return connection.get_transaction_status() == postgresql.Database.extensions.TRANSACTION_STATUS_IDLE
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loans.middleware.MetricsMiddleware',
+    'loans.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,15 +78,99 @@ WSGI_APPLICATION = 'credit_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'credit_system_db',      # Database name
-        'USER': 'postgres',      # Your PostgreSQL username
-        'PASSWORD': '12345678',  # Your PostgreSQL password
-        'HOST': 'localhost',      # Usually 'localhost'
-        'PORT': '5432',      # Usually '5432'
+# Configured from the environment; the defaults are the local development
+# PostgreSQL database.
+#
+#   DB_PROFILE          'postgres' (default) or 'sqlite' (local benchmarking,
+#                       file from SQLITE_PATH)
+#   DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#   CONN_MAX_AGE        seconds a thread keeps its connection open between
+#                       requests (0 = close after every request)
+#   CONN_HEALTH_CHECKS  '1' to check a persistent connection before reusing it
+#   DB_POOL             '1' to use the in-process pool in credit_system/db
+#                       (keep CONN_MAX_AGE at 0: requests hand connections
+#                       back to the pool instead of closing them)
+#   DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_LIFETIME
+#
+# Pool statistics are served at /api/debug-db-pool/.
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'postgres')
+
+if DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': (
+                'credit_system.db.pooled_postgresql' if os.environ.get('DB_POOL') == '1'
+                else 'django.db.backends.postgresql'
+            ),
+            'NAME': os.environ.get('DB_NAME', 'credit_system_db'),      # Database name
+            'USER': os.environ.get('DB_USER', 'postgres'),      # Your PostgreSQL username
+            'PASSWORD': os.environ.get('DB_PASSWORD', '12345678'),  # Your PostgreSQL password
+            'HOST': os.environ.get('DB_HOST', 'localhost'),      # Usually 'localhost'
+            'PORT': os.environ.get('DB_PORT', '5432'),      # Usually '5432'
+            'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', '0')),
+            'CONN_HEALTH_CHECKS': os.environ.get('CONN_HEALTH_CHECKS') == '1',
+            'POOL': {
+                'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+                'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600')),
+            },
+        }
+    }
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# 'credit_scores' holds computed credit scores (see loans/score_cache.py).
+# MAX_ENTRIES bounds its size; the least recently used entries are culled
+# first. LocMemCache is per process - point this at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) so the web workers
+# benefit from `manage.py warm_score_cache`.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'credit_scores': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'credit-scores',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 10,  # drop 1/10 of the entries when full
+        },
+    },
+}
+
+CREDIT_SCORE_CACHE = 'credit_scores'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+#
+# JSON is rendered and parsed with orjson (loans/renderers.py); the bodies
+# are byte-identical to DRF's JSONRenderer. Internal callers can ask for
+# MessagePack with `Accept: application/msgpack`. Compare them with `manage.py benchmark render-json`.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'loans.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'loans.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'loans.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
@@ -146,4 +233,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # concentrated around 2020-2027. We use 2026-02-09 as a reference point
 # that makes the credit scoring meaningful for the demo data.
 
-SYSTEM_REFERENCE_DATE = '2026-02-09'  # Set to None for production
\ No newline at end of file
+SYSTEM_REFERENCE_DATE = '2026-02-09'  # Set to None for production
+
+# Maximum number of applications accepted by /check-eligibility-batch/ in one call
+ELIGIBILITY_BATCH_MAX_ITEMS = 5000
+
+# /view-loans/<customer_id>/: default and largest ?page_size, and loans
+# fetched (and written) per step with ?stream=1
+VIEW_LOANS_PAGE_SIZE = 100
+VIEW_LOANS_MAX_PAGE_SIZE = 1000
+VIEW_LOANS_STREAM_CHUNK_SIZE = 500
+
+# Maximum number of loans in one /loan-schedules/ export
+LOAN_SCHEDULE_BATCH_MAX_LOANS = 10000
+
+# Rows fetched per database round trip (and written per CSV chunk or
+# Parquet row group) by /portfolio-export/
+PORTFOLIO_EXPORT_CHUNK_SIZE = 5000
+
+# Serve /view-loan/, /view-loans/ and /check-eligibility/ with the async
+# views in loans/async_views.py (run under ASGI, e.g. uvicorn
+# credit_system.asgi:application); compare with `manage.py loadtest`
+LOANS_ASYNC_VIEWS = os.environ.get('LOANS_ASYNC_VIEWS', '') == '1'
+
+# Idempotency-Key header on /create-loan/ and /register/ (see loans/idempotency.py)
+# Use 'loans.idempotency.MemoryIdempotencyStore' for a single worker process
+IDEMPOTENCY_STORE = 'loans.idempotency.DatabaseIdempotencyStore'
+IDEMPOTENCY_TTL = 24 * 60 * 60       # seconds a stored response is replayed
+IDEMPOTENCY_PENDING_TIMEOUT = 60     # seconds before an unfinished claim can be taken over
+IDEMPOTENCY_WAIT_TIMEOUT = 10        # seconds a duplicate waits for the first request
+
+# Request metrics served at /metrics (see loans/metrics.py)
+# With several worker processes, set METRICS_MULTIPROCESS_DIR to a directory
+# shared by all of them and empty it before they start
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1.0  # seconds between writes of a worker's file
+
+# Opt-in request profiling (see loans/profiling.py): requests under
+# PROFILING_PATHS with a token from `manage.py profiling_token` in the
+# X-Profile-Token header, plus a PROFILING_SAMPLE_RATE share of the others
+PROFILING_PATHS = ['/api/']
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_TOKEN_MAX_AGE = 60 * 60    # seconds a token is accepted
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_PROFILES = 100         # oldest profiles are deleted beyond this
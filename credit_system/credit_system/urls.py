@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from loans.views import prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('loans.urls')),
     path('api-auth/', include('loans.urls')),  # For DRF's login/logout views
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
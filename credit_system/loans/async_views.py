@@ -0,0 +1,142 @@
+"""
+Async versions of the read and eligibility endpoints
+
+Used instead of the DRF views in views.py when settings.LOANS_ASYNC_VIEWS
+is True (see urls.py). Under an ASGI server, e.g.
+
+    uvicorn credit_system.asgi:application --workers 4
+
+a request waiting on the database no longer ties up a worker thread.
+
+These are plain Django async views: DRF 3.14 has no async support. Input
+is still validated with the DRF serializers (they do no I/O), loans are
+shaped by loans.fast_serializers like in the sync views, and responses go
+through the sync views' renderer (loans.renderers.ORJSONRenderer), so the
+bodies match byte for byte. Request bodies must be JSON.
+"""
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+
+from . import metrics
+from .models import Customer, Loan
+from .renderers import ORJSONRenderer
+from .score_cache import aget_credit_snapshot
+from .fast_serializers import CUSTOMER_FIELDS, aserialize_loan, customer_dict, loan_dict, loan_rows
+from .serializers import LoanEligibilityRequestSerializer
+from .views import eligibility_result, loan_page_params
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Same body as a DRF Response rendered with ORJSONRenderer"""
+    return HttpResponse(ORJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+@require_GET
+async def view_loan(request, loan_id):
+    """
+    API endpoint: /view-loan/<loan_id>
+    Method: GET
+    Returns: Loan details with customer info
+    """
+    try:
+        data = await aserialize_loan(loan_id)
+    except Loan.DoesNotExist:
+        return json_response({"error": "Loan not found."}, status.HTTP_404_NOT_FOUND)
+
+    return json_response(data)
+
+
+@require_GET
+async def view_loans(request, customer_id):
+    """
+    API endpoint: /view-loans/<customer_id>
+    Method: GET
+    Returns: List of all loans for a customer
+    Supports ?page_size / ?cursor and ?stream=1 like views.view_loans
+    """
+    try:
+        cursor, page_size = loan_page_params(request.GET)
+    except ValueError as error:
+        return json_response({"error": str(error)}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        customer = customer_dict(await Customer.objects.values(*CUSTOMER_FIELDS).aget(id=customer_id))
+    except Customer.DoesNotExist:
+        return json_response({"error": "Customer not found."}, status.HTTP_404_NOT_FOUND)
+
+    loans = Loan.objects.filter(customer_id=customer_id)
+
+    if request.GET.get('stream') == '1':
+        loans = loans.order_by('id')
+        if cursor is not None:
+            loans = loans.filter(id__gt=cursor)
+        return StreamingHttpResponse(astream_loans_json(loans, customer), content_type='application/json')
+
+    if page_size is not None:
+        rows = [row async for row in loan_rows(loans.filter(id__gt=cursor or 0).order_by('id'))[:page_size + 1]]
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        return json_response({
+            "results": [loan_dict(row, customer) for row in rows],
+            "next_cursor": rows[-1]['id'] if has_more else None,
+        })
+
+    return json_response([loan_dict(row, customer) async for row in loan_rows(loans)])
+
+
+async def astream_loans_json(loans, customer):
+    """views.stream_loans_json for async views"""
+    chunk_size = getattr(settings, 'VIEW_LOANS_STREAM_CHUNK_SIZE', 500)
+    renderer = ORJSONRenderer()
+    chunk = [b'[']
+    separator = b''
+    count = 0
+    async for row in loan_rows(loans).aiterator(chunk_size=chunk_size):
+        chunk.append(separator)
+        chunk.append(renderer.render(loan_dict(row, customer)))
+        separator = b','
+        count += 1
+        if count % chunk_size == 0:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
+@csrf_exempt
+@require_POST
+async def check_eligibility(request):
+    """
+    API endpoint: /check-eligibility
+    Method: POST
+    Input: customer_id, loan_amount, interest_rate, tenure
+    Output: approval decision with corrected interest rate and EMI
+    """
+    # Step 1: Validate input
+    try:
+        data = json.loads(request.body)
+    except ValueError as error:
+        return json_response({"detail": f"JSON parse error - {error}"}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = LoanEligibilityRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    validated_data = serializer.validated_data
+
+    # Step 2: Get customer (with its credit profile)
+    try:
+        customer = await Customer.objects.select_related('credit_profile').aget(id=validated_data['customer_id'])
+    except Customer.DoesNotExist:
+        return json_response({"error": "Customer not found"}, status.HTTP_404_NOT_FOUND)
+
+    # Step 3: Score and decide
+    credit = await aget_credit_snapshot(customer)
+    result = eligibility_result(customer, credit, validated_data)
+    metrics.record_decision('check_eligibility', result['approval'])
+    return json_response(result)
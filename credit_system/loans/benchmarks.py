@@ -0,0 +1,434 @@
+"""
+Micro-benchmarks of the hot paths
+
+Each benchmark is a function registered with @benchmark(name). It runs
+against the current database (load_data first) and returns a list of
+results, one per variant:
+
+    {'name': 'serialize-loans', 'variant': 'lean', 'unit': 'us/loan', 'value': 4.2}
+
+`value` is the best of `repeat` runs, so lower is better. Run them with
+`manage.py benchmark [name ...]`.
+
+With `--sizes 100,1000,10000` the command runs them on a throwaway test
+database (in memory with DB_PROFILE=sqlite) filled by populate_portfolio()
+with that many customers, and every result gets a 'size'. `--output`
+writes the results as JSON; `--baseline` compares them with such a file
+and fails when any value is more than `--threshold` slower (see
+compare_with_baseline).
+"""
+import io
+import json
+import math
+import random
+import time
+from decimal import Decimal
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.test import Client
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .emi import emi_paise_array, monthly_emi
+from .fast_serializers import get_customer_dict, loan_dict, loan_rows, serialize_loan, serialize_loans
+from .models import Customer, Loan
+from .profiles import rebuild_profiles
+from .renderers import MessagePackRenderer, ORJSONParser, ORJSONRenderer, msgpack
+from .schedules import amortize, load_schedule_inputs
+from .score_cache import score_cache
+from .scoring import calculate_credit_score, compute_aggregates, months_between, score_from_aggregates
+from .serializers import LoanListSerializer, LoanSerializer
+from .utils import get_current_date
+from .views import calculate_emi
+
+BENCHMARKS = {}
+
+
+def benchmark(name, compare=True):
+    """
+    Register a benchmark function under `name`
+    compare=False when its variants are different things (e.g. different
+    endpoints) rather than alternatives for the same work
+    """
+    def register(func):
+        func.compare = compare
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def best_time(func, repeat=5, min_time=0.02):
+    """
+    Fastest of `repeat` measurements of func(), in seconds per call
+    Calls that take less than `min_time` are timed in loops of that length
+    """
+    started = time.perf_counter()
+    func()
+    first = time.perf_counter() - started
+    number = max(1, math.ceil(min_time / first)) if first > 0 else 1
+
+    best = first
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def result(name, variant, unit, value, **extra):
+    return {'name': name, 'variant': variant, 'unit': unit, 'value': round(value, 3), **extra}
+
+
+def result_key(run):
+    return (run['name'], run['variant'], run.get('size'))
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    Results more than `threshold` (0.25 = 25%) slower than the baseline
+    result with the same name, variant and size, as
+    {'name', 'variant', 'size', 'unit', 'baseline', 'value', 'change'}
+    Results missing from the baseline are not compared
+    """
+    previous = {result_key(run): run for run in baseline}
+    regressions = []
+    for run in results:
+        before = previous.get(result_key(run))
+        if before is None or before['value'] <= 0:
+            continue
+        change = run['value'] / before['value'] - 1
+        if change > threshold:
+            regressions.append({
+                'name': run['name'], 'variant': run['variant'], 'size': run.get('size'), 'unit': run['unit'],
+                'baseline': before['value'], 'value': run['value'], 'change': round(change, 3),
+            })
+    return regressions
+
+
+def populate_portfolio(customers, seed=0, as_of=None):
+    """
+    Insert `customers` synthetic customers with 0-6 loans each (2.6 on
+    average, like the sample data) and build their credit profiles
+    The same seed gives the same portfolio
+    Returns (customer count, loan count)
+    """
+    rng = random.Random(seed)
+    as_of = as_of or get_current_date()
+
+    created = Customer.objects.bulk_create([
+        Customer(
+            first_name=f'Customer{index}', last_name='Bench', age=rng.randint(21, 65),
+            phone_number=str(9000000000 + index),
+            monthly_salary=Decimal(salary), approved_limit=Decimal(round(36 * salary / 100000) * 100000),
+        )
+        for index, salary in ((index, rng.randrange(25000, 300000, 1000)) for index in range(customers))
+    ], batch_size=1000)
+    customer_ids = [customer.pk for customer in created]
+
+    loans = []
+    for customer_id in customer_ids:
+        for _ in range(rng.choice([0, 1, 1, 2, 2, 3, 3, 4, 5, 6])):
+            amount = Decimal(rng.randrange(100000, 2000000, 1000))
+            rate = Decimal(rng.randrange(800, 1800)) / 100
+            tenure = rng.choice([6, 12, 24, 36, 48, 60, 84, 120, 180])
+            approved = as_of - relativedelta(months=rng.randint(0, 120), days=rng.randint(0, 27))
+            elapsed = max(min(months_between(approved, as_of), tenure), 0)
+            loans.append(Loan(
+                customer_id=customer_id, loan_amount=amount, tenure=tenure, interest_rate=rate,
+                monthly_payment=monthly_emi(amount, rate, tenure),
+                emis_paid_on_time=rng.randint(max(elapsed - 3, 0), elapsed),
+                date_of_approval=approved, end_date=approved + relativedelta(months=tenure),
+            ))
+    Loan.objects.bulk_create(loans, batch_size=2000)
+    rebuild_profiles(as_of, customer_ids=customer_ids)
+    return len(customer_ids), len(loans)
+
+
+@benchmark('serialize-loans')
+def serialize_loans_benchmark(repeat=5):
+    """
+    Turning already fetched loans into response data, per loan:
+    LoanListSerializer (customer re-serialized for each loan) against
+    loan_dict over values() rows with one shared customer dict
+    """
+    customers = list(Customer.objects.prefetch_related('loans'))
+    rows = {customer.id: list(loan_rows(Loan.objects.filter(customer_id=customer.id))) for customer in customers}
+    shared = {customer.id: get_customer_dict(customer.id) for customer in customers}
+    loan_count = sum(len(customer_rows) for customer_rows in rows.values()) or 1
+
+    def drf():
+        for customer in customers:
+            LoanListSerializer(customer.loans.all(), many=True).data
+
+    def lean():
+        for customer_id, customer_rows in rows.items():
+            [loan_dict(row, shared[customer_id]) for row in customer_rows]
+
+    return [
+        result('serialize-loans', variant, 'us/loan', best_time(func, repeat) / loan_count * 1e6, loans=loan_count)
+        for variant, func in [('drf', drf), ('lean', lean)]
+    ]
+
+
+@benchmark('view-loans-body')
+def view_loans_body_benchmark(repeat=5):
+    """
+    The whole /view-loans/ body for every customer, per loan: queries,
+    serialization and JSON rendering
+    """
+    customer_ids = list(Customer.objects.values_list('id', flat=True))
+    loan_count = Loan.objects.count() or 1
+    render = JSONRenderer().render
+
+    def drf():
+        for customer_id in customer_ids:
+            customer = Customer.objects.get(id=customer_id)
+            render(LoanListSerializer(customer.loans.all(), many=True).data)
+
+    def lean():
+        for customer_id in customer_ids:
+            render(serialize_loans(Loan.objects.filter(customer_id=customer_id), get_customer_dict(customer_id)))
+
+    return [
+        result('view-loans-body', variant, 'us/loan', best_time(func, repeat) / loan_count * 1e6, loans=loan_count)
+        for variant, func in [('drf', drf), ('lean', lean)]
+    ]
+
+
+@benchmark('view-loan-body')
+def view_loan_body_benchmark(repeat=5, sample=200):
+    """
+    The /view-loan/ body for `sample` loans: get() plus the lazy customer
+    query and LoanSerializer, against one values() query joining the customer
+    """
+    loan_ids = list(Loan.objects.order_by('id').values_list('id', flat=True)[:sample])
+    count = len(loan_ids) or 1
+    render = JSONRenderer().render
+
+    def drf():
+        for loan_id in loan_ids:
+            render(LoanSerializer(Loan.objects.get(id=loan_id)).data)
+
+    def lean():
+        for loan_id in loan_ids:
+            render(serialize_loan(loan_id))
+
+    return [
+        result('view-loan-body', variant, 'us/loan', best_time(func, repeat) / count * 1e6, loans=count)
+        for variant, func in [('drf', drf), ('lean', lean)]
+    ]
+
+
+def _renderers():
+    """(variant, renderer) pairs: DRF's JSONRenderer first, then ours"""
+    renderers = [('drf', JSONRenderer()), ('orjson', ORJSONRenderer())]
+    if msgpack is not None:
+        renderers.append(('msgpack', MessagePackRenderer()))
+    return renderers
+
+
+@benchmark('render-json')
+def render_json_benchmark(repeat=5):
+    """
+    Rendering response data to bytes, per loan: the /view-loans/ bodies of
+    every customer (decimals as strings) and a /debug-emis/-style entry per
+    loan (raw Decimal and date values)
+    """
+    bodies = [
+        serialize_loans(Loan.objects.filter(customer_id=customer_id), get_customer_dict(customer_id))
+        for customer_id in Customer.objects.values_list('id', flat=True)
+    ]
+    debug_entries = [
+        {
+            'loan_id': loan.id,
+            'loan_amount': loan.loan_amount,
+            'monthly_payment': loan.monthly_payment,
+            'emis_paid': loan.emis_paid_on_time,
+            'date_of_approval': loan.date_of_approval,
+            'end_date': loan.end_date,
+        }
+        for loan in Loan.objects.order_by('id')
+    ]
+    loan_count = len(debug_entries) or 1
+
+    def run(render):
+        def func():
+            for body in bodies:
+                render(body)
+            render(debug_entries)
+        return func
+
+    return [
+        result('render-json', variant, 'us/loan', best_time(run(renderer.render), repeat) / loan_count * 1e6, loans=loan_count)
+        for variant, renderer in _renderers()
+    ]
+
+
+@benchmark('parse-json')
+def parse_json_benchmark(repeat=5, items=5000):
+    """
+    Parsing a /check-eligibility-batch/ request body of `items`
+    applications, per application
+    """
+    body = json.dumps([
+        {'customer_id': index + 1, 'loan_amount': 250000.5, 'interest_rate': 11.5, 'tenure': 24}
+        for index in range(items)
+    ]).encode()
+
+    def run(parser):
+        return lambda: parser.parse(io.BytesIO(body), 'application/json', {'encoding': 'utf-8'})
+
+    return [
+        result('parse-json', variant, 'us/item', best_time(run(parser), repeat) / items * 1e6, items=items)
+        for variant, parser in [('drf', JSONParser()), ('orjson', ORJSONParser())]
+    ]
+
+
+@benchmark('amortize')
+def amortize_benchmark(repeat=5, loans=10000):
+    """
+    Full amortization schedules of `loans` loans (the portfolio's loans
+    repeated), per loan: a month-by-month Python loop against
+    schedules.amortize
+    """
+    inputs = load_schedule_inputs(Loan.objects.all())
+    if not len(inputs['loan_id']):
+        return []
+    picks = np.arange(loans) % len(inputs['loan_id'])
+    principal, annual_rate, tenure = inputs['principal'][picks], inputs['annual_rate'][picks], inputs['tenure'][picks]
+    batch = list(zip(principal.tolist(), annual_rate.tolist(), tenure.tolist()))
+
+    def loop():
+        for amount, rate, months in batch:
+            monthly_rate = rate / 12 / 100
+            emi = round(amount * monthly_rate / (1 - (1 + monthly_rate) ** -months)) if monthly_rate else round(amount / months)
+            balance = amount
+            for _ in range(months):
+                interest = round(balance * monthly_rate)
+                balance -= emi - interest
+
+    def vectorized():
+        amortize(principal, annual_rate, tenure)
+
+    return [
+        result('amortize', variant, 'us/loan', best_time(func, repeat) / loans * 1e6, loans=loans,
+               installments=int(tenure.sum()))
+        for variant, func in [('loop', loop), ('numpy', vectorized)]
+    ]
+
+
+@benchmark('emi')
+def emi_benchmark(repeat=5):
+    """
+    EMI of every loan in the portfolio from Decimal inputs, per loan:
+    calculate_emi against monthly_emi (annuity-factor table, warm) and
+    emi_paise_array over the whole portfolio
+    """
+    loans = list(Loan.objects.values_list('loan_amount', 'interest_rate', 'tenure'))
+    count = len(loans) or 1
+    principal = np.array([int(amount * 100) for amount, _, _ in loans], dtype=np.int64)
+    annual_rate = np.array([float(rate) for _, rate, _ in loans], dtype=np.float64)
+    tenure = np.array([months for _, _, months in loans], dtype=np.int64)
+
+    def formula():
+        for amount, rate, months in loans:
+            calculate_emi(amount, rate, months)
+
+    def table():
+        for amount, rate, months in loans:
+            monthly_emi(amount, rate, months)
+
+    def array():
+        emi_paise_array(principal, annual_rate, tenure)
+
+    return [
+        result('emi', variant, 'us/loan', best_time(func, repeat) / count * 1e6, loans=count)
+        for variant, func in [('formula', formula), ('table', table), ('array', array)]
+    ]
+
+
+@benchmark('credit-score')
+def credit_score_benchmark(repeat=5):
+    """
+    calculate_credit_score for every customer, per customer: folding all of
+    the customer's loans (the original path) against the stored profile
+    """
+    as_of = get_current_date()
+    customers = list(Customer.objects.select_related('credit_profile').prefetch_related('loans'))
+    count = len(customers) or 1
+
+    def from_loans():
+        for customer in customers:
+            score_from_aggregates(compute_aggregates(customer.loans.all(), as_of), customer.approved_limit)
+
+    def from_profile():
+        for customer in customers:
+            calculate_credit_score(customer, customer.credit_profile)
+
+    return [
+        result('credit-score', variant, 'us/customer', best_time(func, repeat) / count * 1e6, customers=count)
+        for variant, func in [('loans', from_loans), ('profile', from_profile)]
+    ]
+
+
+@benchmark('months-between')
+def months_between_benchmark(repeat=5):
+    """scoring.months_between(date_of_approval, as_of) for every loan, per loan"""
+    as_of = get_current_date()
+    dates = list(Loan.objects.values_list('date_of_approval', flat=True))
+    count = len(dates) or 1
+
+    def relativedelta_months():
+        for approved in dates:
+            months_between(approved, as_of)
+
+    return [result('months-between', 'relativedelta', 'us/loan', best_time(relativedelta_months, repeat) / count * 1e6, loans=count)]
+
+
+@benchmark('views', compare=False)
+def views_benchmark(repeat=5, sample=50):
+    """
+    Each endpoint through the Django test client (routing, middleware,
+    DRF, rendering), for `sample` customers or loans, per request
+    """
+    client = Client(SERVER_NAME='localhost')
+    customer_ids = list(Customer.objects.order_by('id').values_list('id', flat=True)[:sample])
+    loan_ids = list(Loan.objects.order_by('id').values_list('id', flat=True)[:sample])
+
+    def get(paths):
+        def func():
+            for path in paths:
+                client.get(path)
+        return func
+
+    def post(path, bodies):
+        def func():
+            for body in bodies:
+                client.post(path, body, content_type='application/json')
+        return func
+
+    eligibility = [
+        {'customer_id': customer_id, 'loan_amount': 250000, 'interest_rate': 11.5, 'tenure': 24}
+        for customer_id in customer_ids
+    ]
+    endpoints = [
+        ('view-loan', get([f'/api/view-loan/{loan_id}/' for loan_id in loan_ids])),
+        ('view-loans', get([f'/api/view-loans/{customer_id}/' for customer_id in customer_ids])),
+        ('check-eligibility', post('/api/check-eligibility/', eligibility)),
+        ('loan-offers', post('/api/loan-offers/', [
+            {'customer_id': customer_id, 'interest_rate': 11.5} for customer_id in customer_ids
+        ])),
+        ('loan-schedule', get([f'/api/loan-schedule/{loan_id}/' for loan_id in loan_ids])),
+        ('debug-emis', get([f'/api/debug-emis/{customer_id}/' for customer_id in customer_ids])),
+    ]
+
+    results = []
+    for variant, func in endpoints:
+        requests = len(loan_ids) if variant in ('view-loan', 'loan-schedule') else len(customer_ids)
+        if not requests:
+            continue
+        score_cache().clear()
+        results.append(result('views', variant, 'us/request', best_time(func, repeat) / requests * 1e6, requests=requests))
+    return results
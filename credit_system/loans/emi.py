@@ -0,0 +1,137 @@
+"""
+EMI kernel backed by a memoized annuity-factor table
+
+    EMI = P * A(r, n),    A(r, n) = r (1 + r)^n / ((1 + r)^n - 1),  r = annual rate / 12 / 100
+
+Interest rates are quoted with two decimals (percent), i.e. on a grid of
+0.01% steps, and tenures are whole months, so the factor only depends on
+(rate in basis points, tenure). Factors are computed once per key, with
+40 significant digits, and memoized (bounded LRU):
+
+- monthly_emi(): one EMI as a Decimal rounded to the paisa (half to even,
+  like the Decimal(...).quantize(Decimal('0.01')) create_loan stored before).
+  It is within half a paisa (0.005) of calculate_emi() in views.py for the
+  same inputs; calculate_emi is unrounded and works at the default 28
+  digit precision.
+- emi_paise_array(): EMIs of many loans at once, in integer paise, from
+  a float64 table with a row per rate seen so far (every tenure up to
+  TABLE_MAX_TENURE). Equal to monthly_emi() except, rarely, by one paisa
+  when the exact EMI lies on a half paisa.
+
+Rates off the 0.01% grid are rounded to it.
+"""
+import threading
+from decimal import ROUND_HALF_EVEN, Context, Decimal
+from functools import lru_cache
+
+import numpy as np
+
+PAISA = Decimal('0.01')
+
+# Longest tenure (months) held in the float table used by emi_paise_array;
+# longer ones are computed directly
+TABLE_MAX_TENURE = 600
+
+_CONTEXT = Context(prec=40)
+
+# float64 table for emi_paise_array: one row per rate in _table_rates
+# (sorted basis points), A(r, n) for n = 0..TABLE_MAX_TENURE
+_table_rates = np.empty(0, dtype=np.int64)
+_table = np.empty((0, TABLE_MAX_TENURE + 1), dtype=np.float64)
+_table_lock = threading.Lock()
+
+
+def rate_key(annual_rate):
+    """Annual rate in percent -> integer basis points (0.01% steps)"""
+    if isinstance(annual_rate, float):
+        return int(round(annual_rate * 100))
+    return int((Decimal(annual_rate) * 100).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+@lru_cache(maxsize=65536)
+def annuity_factor(rate_bp, tenure):
+    """
+    A(r, n) as a Decimal for a rate in basis points and a tenure in months
+    (1 / n for a zero rate)
+    """
+    if tenure <= 0:
+        raise ValueError("tenure must be at least one month")
+    if rate_bp == 0:
+        return _CONTEXT.divide(1, tenure)
+    monthly_rate = _CONTEXT.divide(rate_bp, 120000)
+    growth = _CONTEXT.power(_CONTEXT.add(1, monthly_rate), tenure)
+    return _CONTEXT.divide(_CONTEXT.multiply(monthly_rate, growth), _CONTEXT.subtract(growth, 1))
+
+
+@lru_cache(maxsize=65536)
+def _factor(annual_rate, tenure):
+    """annuity_factor keyed by the rate as given (Decimal('12.00') == 12 == 12.0)"""
+    return annuity_factor(rate_key(annual_rate), int(tenure))
+
+
+def monthly_emi(loan_amount, annual_rate, tenure):
+    """
+    EMI of a loan as a Decimal rounded to the paisa
+    loan_amount: rupees, annual_rate: percent, tenure: months
+    """
+    if isinstance(loan_amount, float):
+        loan_amount = Decimal(str(loan_amount))
+    emi = _CONTEXT.multiply(loan_amount, _factor(annual_rate, tenure))
+    return emi.quantize(PAISA, rounding=ROUND_HALF_EVEN, context=_CONTEXT)
+
+
+def _factors(monthly_rate, tenure):
+    """float64 A(r, n) for arrays of monthly rates and tenures"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.expm1(tenure * np.log1p(monthly_rate))  # (1 + r)^n - 1
+        return np.where(monthly_rate != 0, monthly_rate * (growth + 1) / growth, 1 / tenure)
+
+
+def _table_rows(rate_bp):
+    """Indexes into _table of each rate, adding rows for rates not seen yet"""
+    global _table, _table_rates
+    rates, table = _table_rates, _table
+    rows = np.minimum(np.searchsorted(rates, rate_bp), max(len(rates) - 1, 0))
+    if len(rates) and (rates[rows] == rate_bp).all():
+        return table, rows
+
+    with _table_lock:
+        missing = np.setdiff1d(rate_bp, _table_rates)
+        if len(missing):
+            tenures = np.arange(TABLE_MAX_TENURE + 1)
+            new_rows = _factors((missing / 120000)[:, None], tenures[None, :])
+            rates = np.concatenate([_table_rates, missing])
+            order = np.argsort(rates, kind='stable')
+            _table_rates, _table = rates[order], np.concatenate([_table, new_rows])[order]
+        rates, table = _table_rates, _table
+    return table, np.searchsorted(rates, rate_bp)
+
+
+def annuity_factor_array(annual_rate, tenure):
+    """
+    float64 A(r, n) for arrays of annual rates (percent) and tenures
+    (months); tenures below one month are treated as one month
+    """
+    rate_bp = np.rint(np.asarray(annual_rate, dtype=np.float64) * 100).astype(np.int64)
+    tenure = np.maximum(np.asarray(tenure, dtype=np.int64), 1)
+    if not len(tenure):
+        return np.empty(0, dtype=np.float64)
+
+    table, rows = _table_rows(rate_bp)
+    in_table = tenure <= TABLE_MAX_TENURE
+    if in_table.all():
+        return table[rows, tenure]
+    factors = np.empty(len(tenure), dtype=np.float64)
+    factors[in_table] = table[rows[in_table], tenure[in_table]]
+    factors[~in_table] = _factors(rate_bp[~in_table] / 120000, tenure[~in_table])
+    return factors
+
+
+def emi_paise_array(principal, annual_rate, tenure):
+    """
+    EMIs of many loans, in integer paise
+    principal: paise, annual_rate: percent, tenure: months (array-likes of
+    the same length)
+    """
+    principal = np.asarray(principal, dtype=np.int64)
+    return np.rint(principal * annuity_factor_array(annual_rate, tenure)).astype(np.int64)
@@ -0,0 +1,237 @@
+"""
+Streaming export of the whole portfolio
+
+One row per loan with its customer, the customer's credit score
+(Customer.objects.with_credit_score, computed by the database) and
+repayments_left; customers without loans get one row with empty loan
+columns.
+
+Customers (ordered by id) and loans (ordered by customer, id) are read
+with two .iterator(chunk_size=...) queries, server-side cursors on
+PostgreSQL, and merged on customer id as they arrive, so memory stays
+constant whatever the size of the portfolio. Rows are written in chunks:
+CSV text, or Parquet row groups (needs pyarrow).
+
+Used by `manage.py export_portfolio` (files, optionally one per approval
+year) and /api/portfolio-export/ (a streamed download).
+"""
+import csv
+import io
+
+from django.db.models import F
+
+from .models import Customer, Loan
+from .utils import chunked
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+CUSTOMER_EXPORT_FIELDS = [
+    'id', 'first_name', 'last_name', 'age', 'phone_number',
+    'monthly_salary', 'approved_limit', 'current_debt', 'credit_score',
+]
+LOAN_EXPORT_FIELDS = [
+    'id', 'loan_amount', 'tenure', 'interest_rate', 'monthly_payment',
+    'emis_paid_on_time', 'repayments_left', 'date_of_approval', 'end_date',
+]
+EXPORT_COLUMNS = (
+    ['customer_id'] + CUSTOMER_EXPORT_FIELDS[1:] + ['loan_id'] + LOAN_EXPORT_FIELDS[1:]
+)
+APPROVAL_DATE_COLUMN = EXPORT_COLUMNS.index('date_of_approval')
+
+_NO_LOAN = (None,) * len(LOAN_EXPORT_FIELDS)
+
+
+def export_rows(as_of=None, chunk_size=2000, approval_year=None):
+    """
+    Yield EXPORT_COLUMNS tuples for every loan (and loan-less customer),
+    ordered by customer id then loan id
+    approval_year: only loans approved that year (and their customers)
+    """
+    customers = Customer.objects.with_credit_score(as_of)
+    loans = Loan.objects.annotate(repayments_left=F('tenure') - F('emis_paid_on_time'))
+    if approval_year is not None:
+        loans = loans.filter(date_of_approval__year=approval_year)
+        customers = customers.filter(id__in=loans.values('customer_id'))
+
+    customer_rows = customers.order_by('id').values_list(*CUSTOMER_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    loan_rows = loans.order_by('customer_id', 'id').values_list(
+        'customer_id', *LOAN_EXPORT_FIELDS
+    ).iterator(chunk_size=chunk_size)
+
+    loan = next(loan_rows, None)
+    for customer in customer_rows:
+        customer_id = customer[0]
+        while loan is not None and loan[0] < customer_id:
+            loan = next(loan_rows, None)
+        if loan is None or loan[0] != customer_id:
+            if approval_year is None:
+                yield customer + _NO_LOAN
+            continue
+        while loan is not None and loan[0] == customer_id:
+            yield customer + loan[1:]
+            loan = next(loan_rows, None)
+
+
+def csv_chunks(rows, rows_per_chunk=5000, header=True):
+    """CSV text: the header, then `rows_per_chunk` rows per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for batch in chunked(rows, rows_per_chunk):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def arrow_schema():
+    """pyarrow schema of the export, decimals with the model's precision"""
+    if pa is None:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    def field_type(model, name):
+        if name in ('credit_score', 'repayments_left'):
+            return pa.int64()
+        field = model._meta.get_field(name)
+        internal_type = field.get_internal_type()
+        if internal_type == 'DecimalField':
+            return pa.decimal128(field.max_digits, field.decimal_places)
+        if internal_type == 'DateField':
+            return pa.date32()
+        if internal_type == 'CharField':
+            return pa.string()
+        return pa.int64()
+
+    types = (
+        [field_type(Customer, name) for name in CUSTOMER_EXPORT_FIELDS]
+        + [field_type(Loan, name) for name in LOAN_EXPORT_FIELDS]
+    )
+    return pa.schema(list(zip(EXPORT_COLUMNS, types)))
+
+
+def record_batch(rows, schema):
+    """A list of export rows as a pyarrow RecordBatch"""
+    columns = list(zip(*rows))
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting bytes until take() hands them out"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_chunks(rows, rows_per_group=50000):
+    """A Parquet file as bytes, one row group (`rows_per_group` rows) per chunk"""
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in chunked(rows, rows_per_group):
+            writer.write_batch(record_batch(batch, schema), row_group_size=len(batch))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def write_file(rows, path, file_format, rows_per_chunk):
+    """Write export rows to one .csv or .parquet file; returns the row count"""
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    if file_format == 'csv':
+        with open(path, 'w', newline='') as file:
+            for chunk in csv_chunks(counted(rows), rows_per_chunk):
+                file.write(chunk)
+    else:
+        with open(path, 'wb') as file:
+            for chunk in parquet_chunks(counted(rows), rows_per_chunk):
+                file.write(chunk)
+    return count
+
+
+def write_partitioned(rows, directory, file_format, rows_per_chunk):
+    """
+    Write export rows to directory/approval_year=<year>/part-0.<format>
+    (approval_year=none for customers without loans), holding at most
+    `rows_per_chunk` rows per year in memory
+    Returns {year: row count}
+    """
+    if file_format == 'parquet':
+        schema = arrow_schema()
+    outputs = {}   # year: (file, csv writer or ParquetWriter)
+    pending = {}   # year: rows not written yet
+    counts = {}
+
+    def flush(year):
+        file, writer = outputs[year]
+        if file_format == 'csv':
+            writer.writerows(pending[year])
+        else:
+            writer.write_batch(record_batch(pending[year], schema), row_group_size=len(pending[year]))
+        pending[year] = []
+
+    try:
+        for row in rows:
+            approved = row[APPROVAL_DATE_COLUMN]
+            year = approved.year if approved is not None else None
+            if year not in outputs:
+                partition = directory / f"approval_year={year if year is not None else 'none'}"
+                partition.mkdir(parents=True, exist_ok=True)
+                if file_format == 'csv':
+                    file = open(partition / 'part-0.csv', 'w', newline='')
+                    writer = csv.writer(file)
+                    writer.writerow(EXPORT_COLUMNS)
+                else:
+                    file, writer = None, pq.ParquetWriter(partition / 'part-0.parquet', schema)
+                outputs[year] = (file, writer)
+                pending[year] = []
+                counts[year] = 0
+            pending[year].append(row)
+            counts[year] += 1
+            if len(pending[year]) >= rows_per_chunk:
+                flush(year)
+        for year in outputs:
+            if pending[year]:
+                flush(year)
+    finally:
+        for file, writer in outputs.values():
+            if file is not None:
+                file.close()
+            else:
+                writer.close()
+    return counts
@@ -0,0 +1,110 @@
+"""
+Lean serialization of loans for the read endpoints
+
+Produces exactly the dicts LoanSerializer / LoanListSerializer produce
+(same keys, same order, decimals as fixed-point strings like DRF's
+DecimalField), without instantiating a DRF serializer per loan:
+
+- rows come from values() projections of just the output columns
+- repayments_left is computed by the database (tenure - emis_paid_on_time)
+- a customer is serialized once and the same dict is shared by all of its
+  loans
+
+Rendered with JSONRenderer, the responses are byte-identical to the
+ModelSerializer ones (see tests.LeanSerializationTests).
+"""
+from decimal import Decimal
+
+from django.db.models import F
+
+from .models import Customer, Loan
+
+# CustomerSerializer.Meta.fields
+CUSTOMER_FIELDS = ['id', 'first_name', 'last_name', 'phone_number', 'age']
+
+# (field, decimal places) of LoanSerializer.Meta.fields after 'customer'
+LOAN_DECIMAL_FIELDS = [
+    ('loan_amount', Loan._meta.get_field('loan_amount').decimal_places),
+    ('interest_rate', Loan._meta.get_field('interest_rate').decimal_places),
+    ('monthly_payment', Loan._meta.get_field('monthly_payment').decimal_places),
+]
+
+_QUANTUMS = {places: Decimal(1).scaleb(-places) for _, places in LOAN_DECIMAL_FIELDS}
+
+
+def format_decimal(value, places):
+    """DRF DecimalField output: fixed point with exactly `places` decimals"""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value).strip())
+    return '{:f}'.format(value.quantize(_QUANTUMS[places]))
+
+
+def customer_dict(values):
+    """CustomerSerializer output from a dict holding CUSTOMER_FIELDS"""
+    return {
+        'id': values['id'],
+        'first_name': str(values['first_name']),
+        'last_name': str(values['last_name']),
+        'phone_number': str(values['phone_number']),
+        'age': int(values['age']),
+    }
+
+
+def get_customer_dict(customer_id):
+    """
+    The serialized customer, from one narrow query
+    Raises Customer.DoesNotExist
+    """
+    return customer_dict(Customer.objects.values(*CUSTOMER_FIELDS).get(id=customer_id))
+
+
+def loan_rows(queryset):
+    """
+    values() projection of the LoanListSerializer columns, with
+    repayments_left computed in the query
+    """
+    return queryset.annotate(
+        repayments_left=F('tenure') - F('emis_paid_on_time')
+    ).values('id', 'loan_amount', 'interest_rate', 'monthly_payment', 'tenure', 'repayments_left')
+
+
+def loan_dict(row, customer, with_repayments_left=True):
+    """LoanListSerializer (or LoanSerializer) output for one loan_rows() row"""
+    data = {'id': row['id'], 'customer': customer}
+    for name, places in LOAN_DECIMAL_FIELDS:
+        data[name] = format_decimal(row[name], places)
+    data['tenure'] = int(row['tenure'])
+    if with_repayments_left:
+        data['repayments_left'] = int(row['repayments_left'])
+    return data
+
+
+def serialize_loans(queryset, customer):
+    """LoanListSerializer(queryset, many=True).data for loans of one customer"""
+    return [loan_dict(row, customer) for row in loan_rows(queryset)]
+
+
+def _loan_with_customer(loan_id):
+    """One loan's LoanSerializer columns with its customer's joined in"""
+    return Loan.objects.filter(id=loan_id).values(
+        'id', 'loan_amount', 'interest_rate', 'monthly_payment', 'tenure',
+        *(f'customer__{name}' for name in CUSTOMER_FIELDS)
+    )
+
+
+def _loan_with_customer_dict(row):
+    customer = customer_dict({name: row[f'customer__{name}'] for name in CUSTOMER_FIELDS})
+    return loan_dict(row, customer, with_repayments_left=False)
+
+
+def serialize_loan(loan_id):
+    """
+    LoanSerializer(loan).data, loan and customer read in one query
+    Raises Loan.DoesNotExist
+    """
+    return _loan_with_customer_dict(_loan_with_customer(loan_id).get())
+
+
+async def aserialize_loan(loan_id):
+    """serialize_loan for async views"""
+    return _loan_with_customer_dict(await _loan_with_customer(loan_id).aget())
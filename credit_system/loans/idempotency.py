@@ -0,0 +1,348 @@
+"""
+Idempotency-Key support for POST endpoints
+
+A client retrying a POST sends the same Idempotency-Key header each time.
+The first request with a key claims it and runs; its response (status and
+JSON body) is stored for settings.IDEMPOTENCY_TTL seconds, and every later
+request with the key gets the stored response back without running the
+view (no scoring, no second Loan or Customer). A duplicate that arrives
+while the first request is still running waits for it, up to
+IDEMPOTENCY_WAIT_TIMEOUT seconds, instead of running in parallel.
+
+- reusing a key with a different request body is rejected (422)
+- a 5xx response or an exception releases the key, so a retry runs again
+- a claim whose request died is taken over after IDEMPOTENCY_PENDING_TIMEOUT;
+  complete() and release() only act on the claim they are given, so a
+  request that was taken over cannot overwrite the new owner's response
+
+Two stores, picked with settings.IDEMPOTENCY_STORE:
+- DatabaseIdempotencyStore: IdempotencyRecord rows, shared by all workers
+  (claims are committed straight away, so do not enable ATOMIC_REQUESTS)
+- MemoryIdempotencyStore: a dict in this process, for a single worker
+
+Expired entries are removed by `manage.py sweep_idempotency_keys`, one
+bounded batch at a time.
+"""
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# What a store keeps per (scope, key); token identifies the claim that wrote it
+Entry = namedtuple('Entry', 'request_hash state status_code body expires_at token')
+# Held by the request that claimed a key, for complete() / release()
+Claim = namedtuple('Claim', 'scope key token')
+StoredResponse = namedtuple('StoredResponse', 'status_code body')
+
+
+class IdempotencyKeyMismatch(Exception):
+    """The key was already used with a different request"""
+
+
+class IdempotencyKeyInFlight(Exception):
+    """The first request with this key is still running"""
+
+
+def hash_request(data):
+    """Short digest of the parsed request body"""
+    canonical = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+class BaseIdempotencyStore:
+    """
+    claim() / complete() / release() / sweep(); subclasses implement the
+    storage in _try_claim, _wait and the other underscore methods
+    """
+    poll_interval = 0.05
+
+    @property
+    def ttl(self):
+        return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+    @property
+    def pending_timeout(self):
+        return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_PENDING_TIMEOUT', 60))
+
+    @property
+    def wait_timeout(self):
+        return getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 10)
+
+    def claim(self, scope, key, request_hash):
+        """
+        Claim the key for a new request
+        Returns a Claim when claimed (pass it to complete() or release()
+        afterwards), or the StoredResponse of the earlier request with this key
+        Raises IdempotencyKeyMismatch, IdempotencyKeyInFlight
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            entry = self._try_claim(scope, key, request_hash)
+            if isinstance(entry, Claim):
+                return entry
+            if entry.request_hash != request_hash:
+                raise IdempotencyKeyMismatch(key)
+            if entry.state == IdempotencyRecord.COMPLETED:
+                return StoredResponse(entry.status_code, entry.body)
+
+            # Still running: wait for it to complete (or give up the key)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyKeyInFlight(key)
+            self._wait(scope, key, min(remaining, self.poll_interval))
+
+    def complete(self, claim, status_code, body):
+        """
+        Store the response of the claimed request
+        Returns False when the claim was taken over in the meantime (nothing stored)
+        """
+        raise NotImplementedError
+
+    def release(self, claim):
+        raise NotImplementedError
+
+    def sweep(self, batch_size=1000, max_batches=None):
+        """
+        Delete expired entries, at most batch_size per step
+        Returns the number deleted
+        """
+        raise NotImplementedError
+
+    def _try_claim(self, scope, key, request_hash):
+        """Insert a pending entry; returns its Claim, or the live Entry already there"""
+        raise NotImplementedError
+
+    def _wait(self, scope, key, timeout):
+        time.sleep(timeout)
+
+
+class DatabaseIdempotencyStore(BaseIdempotencyStore):
+    """IdempotencyRecord rows; the (scope, key) unique constraint decides who claims"""
+
+    def _try_claim(self, scope, key, request_hash):
+        while True:
+            # Look first: a replay then costs a single SELECT
+            now = timezone.now()
+            record = IdempotencyRecord.objects.filter(scope=scope, key=key).first()
+            if record is not None and record.expires_at > now:
+                return Entry(
+                    record.request_hash, record.state, record.status_code,
+                    record.response_body, record.expires_at, record.pk,
+                )
+            if record is not None:
+                # expired, or a claim whose request died: drop it
+                IdempotencyRecord.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+
+            try:
+                with transaction.atomic():
+                    record = IdempotencyRecord.objects.create(
+                        scope=scope, key=key, request_hash=request_hash,
+                        expires_at=now + self.pending_timeout,
+                    )
+                # a claim taken over is deleted and inserted again: a new pk
+                return Claim(scope, key, record.pk)
+            except IntegrityError:
+                continue  # claimed by a concurrent request in the meantime
+
+    def complete(self, claim, status_code, body):
+        updated = IdempotencyRecord.objects.filter(pk=claim.token, state=IdempotencyRecord.PENDING).update(
+            state=IdempotencyRecord.COMPLETED,
+            status_code=status_code,
+            response_body=body,
+            expires_at=timezone.now() + self.ttl,
+        )
+        return updated == 1
+
+    def release(self, claim):
+        IdempotencyRecord.objects.filter(pk=claim.token, state=IdempotencyRecord.PENDING).delete()
+
+    def sweep(self, batch_size=1000, max_batches=None):
+        now = timezone.now()
+        expired = IdempotencyRecord.objects.filter(expires_at__lte=now)
+        deleted = batches = 0
+        while max_batches is None or batches < max_batches:
+            ids = list(expired.order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += expired.filter(pk__in=ids).delete()[0]
+            batches += 1
+            if len(ids) < batch_size:
+                break
+        return deleted
+
+
+class MemoryIdempotencyStore(BaseIdempotencyStore):
+    """
+    Entries in a dict guarded by a condition variable: duplicates wait on
+    it and are woken as soon as the first request completes
+    Expired entries are swept one batch every `sweep_every` claims
+    """
+    sweep_every = 1000
+
+    def __init__(self):
+        self._entries = {}
+        self._condition = threading.Condition()
+        self._claims = 0
+
+    def _try_claim(self, scope, key, request_hash):
+        now = timezone.now()
+        with self._condition:
+            self._claims += 1
+            entry = self._entries.get((scope, key))
+            if entry is None or entry.expires_at <= now:
+                # the claim counter doubles as the claim's token
+                self._entries[(scope, key)] = Entry(
+                    request_hash, IdempotencyRecord.PENDING, None, '', now + self.pending_timeout, self._claims
+                )
+                entry = Claim(scope, key, self._claims)
+            sweep_due = self._claims % self.sweep_every == 0
+        if sweep_due:
+            self.sweep(batch_size=self.sweep_every, max_batches=1)
+        return entry
+
+    def _wait(self, scope, key, timeout):
+        with self._condition:
+            entry = self._entries.get((scope, key))
+            if entry is not None and entry.state == IdempotencyRecord.PENDING:
+                self._condition.wait(timeout)
+
+    def complete(self, claim, status_code, body):
+        name = (claim.scope, claim.key)
+        with self._condition:
+            entry = self._entries.get(name)
+            owned = entry is not None and entry.token == claim.token and entry.state == IdempotencyRecord.PENDING
+            if owned:
+                self._entries[name] = Entry(
+                    entry.request_hash, IdempotencyRecord.COMPLETED, status_code, body,
+                    timezone.now() + self.ttl, entry.token,
+                )
+            self._condition.notify_all()
+        return owned
+
+    def release(self, claim):
+        name = (claim.scope, claim.key)
+        with self._condition:
+            entry = self._entries.get(name)
+            if entry is not None and entry.token == claim.token and entry.state == IdempotencyRecord.PENDING:
+                del self._entries[name]
+            self._condition.notify_all()
+
+    def sweep(self, batch_size=1000, max_batches=None):
+        now = timezone.now()
+        deleted = batches = 0
+        while max_batches is None or batches < max_batches:
+            # One batch per lock acquisition, so claims are not held up
+            with self._condition:
+                expired = []
+                for name, entry in self._entries.items():
+                    if entry.expires_at <= now:
+                        expired.append(name)
+                        if len(expired) == batch_size:
+                            break
+                for name in expired:
+                    del self._entries[name]
+            deleted += len(expired)
+            batches += 1
+            if len(expired) < batch_size:
+                break
+        return deleted
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """The store named by settings.IDEMPOTENCY_STORE (one instance per process)"""
+    path = getattr(settings, 'IDEMPOTENCY_STORE', 'loans.idempotency.DatabaseIdempotencyStore')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = import_string(path)()
+        return _stores[path]
+
+
+def idempotent(scope):
+    """
+    Honour the Idempotency-Key header on a DRF view
+    Goes between @api_view and the view function:
+
+        @api_view(['POST'])
+        @idempotent('create-loan')
+        def create_loan(request): ...
+
+    Requests without the header run the view as before
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return view(request, *args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            store = get_idempotency_store()
+            try:
+                claimed = store.claim(scope, key, hash_request(request.data))
+            except IdempotencyKeyMismatch:
+                return Response(
+                    {"error": f"{HEADER} was already used with a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            except IdempotencyKeyInFlight:
+                return Response(
+                    {"error": f"A request with this {HEADER} is still in progress"},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': '1'}
+                )
+
+            # Step 1: Replay the stored response
+            if isinstance(claimed, StoredResponse):
+                return Response(
+                    json.loads(claimed.body),
+                    status=claimed.status_code,
+                    headers={REPLAYED_HEADER: 'true'}
+                )
+
+            # Step 2: First request with this key: run the view and keep its response
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                store.release(claimed)
+                raise
+            if response.status_code >= 500:
+                store.release(claimed)
+            else:
+                body = json.dumps(response.data, cls=JSONEncoder, separators=(',', ':'))
+                if not store.complete(claimed, response.status_code, body):
+                    logger.warning("%s %r of %s was taken over while its request ran; response not stored",
+                                   HEADER, key, scope)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,191 @@
+"""
+Bulk ingestion helpers for the load_data management command.
+
+Rows are written chunk by chunk, one transaction per chunk. On PostgreSQL
+the rows go through COPY, everywhere else through bulk_create.
+
+The sync_* functions implement `load_data --sync`: every source row
+carries its source id and a content hash, and only new or changed rows
+are upserted.
+"""
+import csv
+import hashlib
+import io
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from .models import Customer, Loan
+
+CUSTOMER_SYNC_FIELDS = [
+    'first_name', 'last_name', 'age', 'phone_number',
+    'monthly_salary', 'approved_limit', 'current_debt',
+]
+LOAN_SYNC_FIELDS = [
+    'customer_id', 'loan_amount', 'tenure', 'interest_rate',
+    'monthly_payment', 'emis_paid_on_time', 'date_of_approval', 'end_date',
+]
+
+
+def copy_supported():
+    """COPY is only available on the PostgreSQL backend"""
+    return connection.vendor == 'postgresql'
+
+
+class BulkCreateWriter:
+    """
+    Writes rows with Model.objects.bulk_create
+    Each row is a dict of field attnames (customer_id, not customer)
+    """
+    name = 'bulk_create'
+
+    def write(self, model, rows):
+        objs = [model(**row) for row in rows]
+        with transaction.atomic():
+            model.objects.bulk_create(objs)
+        return [obj.pk for obj in objs]
+
+
+class CopyWriter:
+    """
+    Writes rows with PostgreSQL COPY FROM STDIN
+    COPY cannot return the generated ids, so they are reserved from the
+    table's sequence first and written explicitly.
+    """
+    name = 'copy'
+
+    def write(self, model, rows):
+        if not rows:
+            return []
+        table = model._meta.db_table
+        attnames = list(rows[0].keys())
+        columns = ['id'] + [model._meta.get_field(name).column for name in attnames]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, len(rows)]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for pk, row in zip(ids, rows):
+                writer.writerow([pk] + ['' if row[name] is None else row[name] for name in attnames])
+            buffer.seek(0)
+
+            quoted = ', '.join(connection.ops.quote_name(column) for column in columns)
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(table)} ({quoted}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        return ids
+
+
+def get_writer(use_copy=True):
+    """Pick COPY when the backend supports it, bulk_create otherwise"""
+    if use_copy and copy_supported():
+        return CopyWriter()
+    return BulkCreateWriter()
+
+
+def customer_source_id(row):
+    return row['customer_id']
+
+
+def loan_source_id(row):
+    # Loan ID is only unique per customer in the source data
+    return f"{row['customer_id']}:{row['loan_id']}"
+
+
+def row_hash(row, fields):
+    """
+    Content hash of the given fields of a source row (as returned by readers)
+    Decimals are normalized so 8.2 and 8.20 hash the same
+    """
+    digest = hashlib.sha256()
+    for field in fields:
+        value = row[field]
+        if isinstance(value, Decimal):
+            value = value.normalize()
+        digest.update(str(value).encode())
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def sync_customers(batch):
+    """
+    Upsert the new or changed customers of one batch
+    Returns (created, updated, customer_ids) - ids of the written customers
+    """
+    # Later rows win if a source id appears twice in the same batch
+    rows = {customer_source_id(row): row for row in batch}
+    existing = dict(
+        Customer.objects.filter(source_id__in=rows.keys()).values_list('source_id', 'source_hash')
+    )
+
+    changed = []
+    for source_id, row in rows.items():
+        digest = row_hash(row, CUSTOMER_SYNC_FIELDS)
+        if existing.get(source_id) == digest:
+            continue
+        changed.append(Customer(
+            source_id=source_id,
+            source_hash=digest,
+            **{field: row[field] for field in CUSTOMER_SYNC_FIELDS}
+        ))
+
+    if changed:
+        Customer.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['source_id'],
+            update_fields=CUSTOMER_SYNC_FIELDS + ['source_hash'],
+        )
+    created = sum(1 for obj in changed if obj.source_id not in existing)
+    return created, len(changed) - created, {obj.pk for obj in changed}
+
+
+def sync_loans(batch):
+    """
+    Upsert the new or changed loans of one batch
+    Customers are resolved by source id, so customers must be synced first
+    Returns (created, updated, orphans, customer_ids) - orphans have no
+    known customer, customer_ids are the customers whose loans changed
+    """
+    customer_ids = dict(
+        Customer.objects.filter(
+            source_id__in={row['customer_id'] for row in batch}
+        ).values_list('source_id', 'id')
+    )
+
+    rows = {}
+    orphans = 0
+    for row in batch:
+        if row['customer_id'] not in customer_ids:
+            orphans += 1
+            continue
+        rows[loan_source_id(row)] = row
+    existing = dict(
+        Loan.objects.filter(source_id__in=rows.keys()).values_list('source_id', 'source_hash')
+    )
+
+    changed = []
+    for source_id, row in rows.items():
+        # Hash the source customer id, not our primary key
+        digest = row_hash(row, LOAN_SYNC_FIELDS)
+        if existing.get(source_id) == digest:
+            continue
+        values = {field: row[field] for field in LOAN_SYNC_FIELDS}
+        values['customer_id'] = customer_ids[row['customer_id']]
+        changed.append(Loan(source_id=source_id, source_hash=digest, **values))
+
+    if changed:
+        Loan.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['source_id'],
+            update_fields=LOAN_SYNC_FIELDS + ['source_hash'],
+        )
+    created = sum(1 for obj in changed if obj.source_id not in existing)
+    return created, len(changed) - created, orphans, {obj.customer_id for obj in changed}
@@ -0,0 +1,139 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from loans.benchmarks import BENCHMARKS, compare_with_baseline, populate_portfolio
+from loans.models import Customer, CustomerCreditProfile, Loan
+from loans.score_cache import score_cache
+
+
+class Command(BaseCommand):
+    help = 'Run the micro-benchmarks in loans/benchmarks.py against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help=f'Benchmarks to run (default: all of {", ".join(sorted(BENCHMARKS))})'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs per measurement; the fastest one is reported'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON'
+        )
+        parser.add_argument(
+            '--sizes',
+            help='Comma-separated portfolio sizes (customers): run on a throwaway test database '
+                 'filled with that many synthetic customers, once per size'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed of the synthetic portfolios (with --sizes)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file (usable as a --baseline later)'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON results file to compare with; fail if anything regressed past --threshold'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.25,
+            help='Allowed slowdown against the baseline before failing (0.25 = 25%%)'
+        )
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        if options['threshold'] < 0:
+            raise CommandError('--threshold must not be negative')
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')] if options['sizes'] else None
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {error}")
+
+        if sizes is None:
+            results = self.run(names, options)
+        else:
+            results = self.run_sizes(names, sizes, options)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        if baseline is not None:
+            regressions = compare_with_baseline(results, baseline, options['threshold'])
+            for regression in regressions:
+                size = f" [{regression['size']} customers]" if regression['size'] is not None else ''
+                self.stderr.write(
+                    f"REGRESSION {regression['name']} {regression['variant']}{size}: "
+                    f"{regression['baseline']} -> {regression['value']} {regression['unit']} "
+                    f"(+{regression['change']:.0%})"
+                )
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} result(s) regressed by more than {options['threshold']:.0%}"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"No regressions past {options['threshold']:.0%} against {options['baseline']}"
+            ))
+
+    def run(self, names, options, size=None):
+        results = []
+        for name in names:
+            runs = BENCHMARKS[name](repeat=options['repeat'])
+            if size is not None:
+                runs = [{**run, 'size': size} for run in runs]
+            results.extend(runs)
+            if not options['json']:
+                self.report(runs, BENCHMARKS[name].compare)
+        return results
+
+    def run_sizes(self, names, sizes, options):
+        """Each size on a freshly filled test database, destroyed afterwards"""
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = []
+            for size in sizes:
+                Loan.objects.all().delete()
+                CustomerCreditProfile.objects.all().delete()
+                Customer.objects.all().delete()
+                score_cache().clear()
+                customers, loans = populate_portfolio(size, seed=options['seed'])
+                if not options['json']:
+                    self.stdout.write(self.style.MIGRATE_HEADING(f'{customers} customers, {loans} loans'))
+                results.extend(self.run(names, options, size=size))
+            return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report(self, runs, compare):
+        baseline = runs[0]['value'] if runs else 0
+        for run in runs:
+            speedup = f"x{baseline / run['value']:.1f}" if compare and run is not runs[0] and run['value'] else ''
+            self.stdout.write(
+                f"{run['name']:<22} {run['variant']:<18} {run['value']:>12.3f} {run['unit']:<12} {speedup}"
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from loans.profiles import check_profiles
+
+
+class Command(BaseCommand):
+    help = 'Compare the stored credit profiles with a full recomputation from the loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Customers compared per batch'
+        )
+
+    def handle(self, *args, **options):
+        customers = set()
+        for customer_id, field, stored, expected in check_profiles(batch_size=options['batch_size']):
+            customers.add(customer_id)
+            self.stdout.write(f"Customer {customer_id}: {field} is {stored}, expected {expected}")
+
+        if customers:
+            raise CommandError(
+                f'{len(customers)} customers have inconsistent credit profiles '
+                f'(run rebuild_credit_profiles to fix them)'
+            )
+        self.stdout.write(self.style.SUCCESS('All credit profiles are consistent'))
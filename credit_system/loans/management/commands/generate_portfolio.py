@@ -0,0 +1,227 @@
+import multiprocessing
+import os
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from loans.ingest import get_writer
+from loans.models import Customer, Loan
+from loans import portfolio
+from loans.portfolio import (
+    CUSTOMER_HEADERS, LOAN_HEADERS, chunk_task, fit_sample, loan_counts, to_arrow,
+)
+from loans.profiles import rebuild_profiles
+from loans.schedules import format_paise
+from loans.score_cache import invalidate_credit_scores
+
+DEFAULT_DATA_DIR = settings.BASE_DIR.parent / 'Business_Records'
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic portfolio of customers and loans, fitted to the sample files, '
+            'into the database or into .csv / .parquet files for load_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customers',
+            type=int,
+            required=True,
+            help='Number of customers to generate'
+        )
+        parser.add_argument(
+            '--loans',
+            type=int,
+            help='Approximate number of loans (default: as many per customer as in the sample)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed; the same seed and --chunk-size give the same portfolio'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes generating chunks in parallel'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Customers per chunk (one worker task, one database transaction)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=['db', 'csv', 'parquet'],
+            default='db',
+            help='Write to the database, or to customer_data / loan_data files in --output-dir'
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Directory of the generated files (with --format csv or parquet)'
+        )
+        parser.add_argument(
+            '--sample-customers',
+            default=str(DEFAULT_DATA_DIR / 'customer_data.xlsx'),
+            help='Customer file the distributions are fitted to'
+        )
+        parser.add_argument(
+            '--sample-loans',
+            default=str(DEFAULT_DATA_DIR / 'loan_data.xlsx'),
+            help='Loan file the distributions are fitted to'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Use bulk_create even when PostgreSQL COPY is available (with --format db)'
+        )
+
+    def handle(self, *args, **options):
+        if options['customers'] < 0 or (options['loans'] is not None and options['loans'] < 0):
+            raise CommandError('--customers and --loans must not be negative')
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be at least 1')
+        if options['format'] == 'parquet' and portfolio.pa is None:
+            raise CommandError('Writing parquet files requires pyarrow (pip install pyarrow)')
+        started = time.perf_counter()
+
+        try:
+            model = fit_sample(options['sample_customers'], options['sample_loans'])
+        except (OSError, ValueError, ImportError) as exc:
+            raise CommandError(str(exc))
+
+        # Step 1: Loans per customer of every chunk, so each chunk knows its first Loan ID
+        total = options['customers']
+        loans_per_customer = options['loans'] / total if options['loans'] is not None and total else None
+        tasks = []
+        first_loan_id = 1
+        for chunk_index, first in enumerate(range(0, total, options['chunk_size'])):
+            size = min(options['chunk_size'], total - first)
+            counts = loan_counts(model, options['seed'], chunk_index, size, loans_per_customer)
+            tasks.append({
+                'model': model, 'seed': options['seed'], 'chunk_index': chunk_index,
+                'first_customer_id': first + 1, 'first_loan_id': first_loan_id, 'counts': counts,
+                'format': options['format'],
+            })
+            first_loan_id += int(counts.sum())
+
+        # Step 2: Generate the chunks in parallel, consume them in order
+        try:
+            customer_count, loan_count = self.write(options, self.generate(tasks, options['workers']))
+        except (OSError, ImportError) as exc:
+            raise CommandError(str(exc))
+
+        elapsed = time.perf_counter() - started
+        rate = (customer_count + loan_count) / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {customer_count} customers and {loan_count} loans in {elapsed:.2f}s ({rate:.0f} rows/s)'
+        ))
+
+    def generate(self, tasks, workers):
+        """Yield chunk_task() results in chunk order"""
+        if workers == 1 or len(tasks) < 2:
+            yield from map(chunk_task, tasks)
+            return
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with multiprocessing.Pool(min(workers, len(tasks)), initializer=django.setup) as pool:
+            yield from pool.imap(chunk_task, tasks)
+
+    def write(self, options, chunks):
+        if options['format'] == 'db':
+            return self.write_db(chunks, options)
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        if options['format'] == 'csv':
+            return self.write_csv(chunks, output_dir)
+        return self.write_parquet(chunks, output_dir)
+
+    def write_csv(self, chunks, output_dir):
+        customer_count = loan_count = 0
+        customer_path, loan_path = output_dir / 'customer_data.csv', output_dir / 'loan_data.csv'
+        with open(customer_path, 'w', newline='') as customer_file, open(loan_path, 'w', newline='') as loan_file:
+            customer_file.write(','.join(CUSTOMER_HEADERS) + '\n')
+            loan_file.write(','.join(LOAN_HEADERS) + '\n')
+            for customer_text, loan_text in chunks:
+                customer_file.write(customer_text)
+                loan_file.write(loan_text)
+                customer_count += customer_text.count('\n')
+                loan_count += loan_text.count('\n')
+                self.stdout.write(f"✓ Written {customer_count} customers, {loan_count} loans")
+        self.stdout.write(f"Load with: manage.py load_data --bulk --customers {customer_path} --loans {loan_path}")
+        return customer_count, loan_count
+
+    def write_parquet(self, chunks, output_dir):
+        import pyarrow.parquet as pq
+
+        customer_count = loan_count = 0
+        customer_path, loan_path = output_dir / 'customer_data.parquet', output_dir / 'loan_data.parquet'
+        customer_writer = loan_writer = None
+        try:
+            for customers, loans in chunks:
+                customer_table, loan_table = to_arrow(customers, loans)
+                customer_writer = customer_writer or pq.ParquetWriter(customer_path, customer_table.schema)
+                loan_writer = loan_writer or pq.ParquetWriter(loan_path, loan_table.schema)
+                customer_writer.write_table(customer_table)
+                loan_writer.write_table(loan_table)
+                customer_count += customer_table.num_rows
+                loan_count += loan_table.num_rows
+                self.stdout.write(f"✓ Written {customer_count} customers, {loan_count} loans")
+        finally:
+            for writer in (customer_writer, loan_writer):
+                if writer is not None:
+                    writer.close()
+        self.stdout.write(f"Load with: manage.py load_data --bulk --customers {customer_path} --loans {loan_path}")
+        return customer_count, loan_count
+
+    def write_db(self, chunks, options):
+        """
+        Insert every chunk in one transaction per table, then build the
+        credit profiles (bulk writes skip the signals, as in load_data --bulk)
+        """
+        writer = get_writer(use_copy=not options['no_copy'])
+        self.stdout.write(f"Inserting ({writer.name}, chunks of {options['chunk_size']} customers)...")
+
+        customer_ids = []
+        loan_count = 0
+        for customers, loans in chunks:
+            ids = writer.write(Customer, [
+                {
+                    'first_name': first_name, 'last_name': last_name, 'age': age, 'phone_number': str(phone_number),
+                    'monthly_salary': Decimal(str(salary)), 'approved_limit': Decimal(str(limit)), 'current_debt': Decimal(0),
+                }
+                for first_name, last_name, age, phone_number, salary, limit in zip(
+                    customers['first_name'].tolist(), customers['last_name'].tolist(), customers['age'].tolist(),
+                    customers['phone_number'].tolist(), customers['monthly_salary'].tolist(),
+                    customers['approved_limit'].tolist(),
+                )
+            ])
+            # generated Customer ID -> database id
+            first_customer_id = int(customers['customer_id'][0]) if len(ids) else 0
+            writer.write(Loan, [
+                {
+                    'customer_id': ids[customer_id - first_customer_id], 'loan_amount': Decimal(str(amount)),
+                    'tenure': tenure, 'interest_rate': Decimal(f'{rate:.2f}'), 'monthly_payment': Decimal(payment),
+                    'emis_paid_on_time': paid, 'date_of_approval': approved, 'end_date': end,
+                }
+                for customer_id, amount, tenure, rate, payment, paid, approved, end in zip(
+                    loans['customer_id'].tolist(), loans['loan_amount'].tolist(), loans['tenure'].tolist(),
+                    loans['interest_rate'].tolist(), format_paise(loans['monthly_payment']),
+                    loans['emis_paid_on_time'].tolist(), loans['date_of_approval'].tolist(),
+                    loans['end_date'].tolist(),
+                )
+            ])
+            customer_ids.extend(ids)
+            loan_count += len(loans['loan_id'])
+            self.stdout.write(f"✓ Created {len(customer_ids)} customers, {loan_count} loans")
+
+        self.stdout.write("Building credit profiles...")
+        rebuild_profiles(customer_ids=customer_ids, batch_size=options['chunk_size'])
+        invalidate_credit_scores(customer_ids)
+        return len(customer_ids), loan_count
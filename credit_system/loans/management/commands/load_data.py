@@ -1,63 +1,261 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
-from loans.models import Customer, Loan
-from django.db import transaction
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from loans.models import Customer, Loan, SyncCheckpoint
+from loans.ingest import (
+    CUSTOMER_SYNC_FIELDS, LOAN_SYNC_FIELDS, customer_source_id, get_writer, loan_source_id, row_hash,
+    sync_customers, sync_loans,
+)
+from loans.profiles import rebuild_profiles, refresh_profiles
+from loans.readers import CUSTOMER_COLUMNS, LOAN_COLUMNS, read_batches
+from loans.score_cache import invalidate_credit_scores
+
+DEFAULT_DATA_DIR = settings.BASE_DIR.parent / 'Business_Records'
+
 
 class Command(BaseCommand):
-    help = 'Load customer and loan data from Excel files'
+    help = 'Load customer and loan data from .xlsx, .csv or .parquet files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customers',
+            default=str(DEFAULT_DATA_DIR / 'customer_data.xlsx'),
+            help='Path to the customer data file'
+        )
+        parser.add_argument(
+            '--loans',
+            default=str(DEFAULT_DATA_DIR / 'loan_data.xlsx'),
+            help='Path to the loan data file'
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert rows in chunks with bulk_create (COPY on PostgreSQL) instead of one by one'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows read per batch (and written per transaction in bulk mode)'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Use bulk_create even when PostgreSQL COPY is available'
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Incremental sync: upsert only new or changed rows, resuming from the last checkpoint'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='With --sync, ignore any recorded checkpoint and start from the first row'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        try:
+            if options['sync']:
+                total_rows = self.load_sync(options)
+            elif options['bulk']:
+                total_rows = self.load_bulk(options)
+            else:
+                total_rows = self.load_rows(options)
+        except (OSError, ValueError, ImportError) as exc:
+            raise CommandError(str(exc))
+        except IntegrityError as exc:
+            # Rows of these files are already in the database (unique source_id)
+            raise CommandError(
+                f'These files were already loaded ({exc}). Run load_data --sync to add only '
+                f'new or changed rows, or --sync --restart to re-check every row from the start'
+            )
+
+        elapsed = time.perf_counter() - started
+        rate = total_rows / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Data loaded successfully! {total_rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s)'
+        ))
+
+    def load_bulk(self, options):
+        """
+        Build model instances in chunks and write each chunk in one transaction
+        Returns the number of rows written
+        """
+        chunk_size = options['chunk_size']
+        writer = get_writer(use_copy=not options['no_copy'])
+        self.stdout.write(f"Loading customers ({writer.name}, chunks of {chunk_size})...")
+
+        # {excel_customer_id: django_customer_id}
+        customer_map = {}
+        for batch in read_batches(options['customers'], CUSTOMER_COLUMNS, chunk_size):
+            rows = [
+                dict(
+                    {field: row[field] for field in CUSTOMER_SYNC_FIELDS},
+                    source_id=row['customer_id'],
+                    source_hash=row_hash(row, CUSTOMER_SYNC_FIELDS),
+                )
+                for row in batch
+            ]
+            ids = writer.write(Customer, rows)
+            for row, customer_id in zip(batch, ids):
+                customer_map[row['customer_id']] = customer_id
+            self.stdout.write(f"✓ Created {len(customer_map)} customers")
+
+        self.stdout.write("Loading loans...")
+        loan_count = 0
+        for batch in read_batches(options['loans'], LOAN_COLUMNS, chunk_size):
+            rows = [
+                dict(
+                    {field: row[field] for field in LOAN_SYNC_FIELDS},
+                    customer_id=customer_map[row['customer_id']],
+                    source_id=loan_source_id(row),
+                    source_hash=row_hash(row, LOAN_SYNC_FIELDS),
+                )
+                for row in batch
+            ]
+            writer.write(Loan, rows)
+            loan_count += len(rows)
+            self.stdout.write(f"✓ Created {loan_count} loans")
+
+        # bulk writes skip the signals that maintain credit profiles
+        self.stdout.write("Building credit profiles...")
+        rebuild_profiles(customer_ids=customer_map.values(), batch_size=chunk_size)
+        invalidate_credit_scores(customer_map.values())
+
+        return len(customer_map) + loan_count
 
-    def handle(self, *args, **kwargs):
+    def load_sync(self, options):
+        """
+        Upsert new and changed customers, then loans, batch by batch
+        Returns the number of source rows processed
+        """
+        processed = self.sync_file('customers', options['customers'], CUSTOMER_COLUMNS, options)
+        processed += self.sync_file('loans', options['loans'], LOAN_COLUMNS, options)
+        return processed
 
+    def sync_file(self, source, path, columns, options):
+        """
+        Sync one source file, committing a checkpoint with every batch
+        A rerun of the same file resumes after the last committed batch;
+        a changed file (size or mtime) starts over from the first row
+        """
+        stat = os.stat(path)
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        checkpoint, _ = SyncCheckpoint.objects.get_or_create(
+            source=source,
+            path=str(Path(path).resolve()),
+            defaults={'fingerprint': fingerprint}
+        )
+        if options['restart'] or checkpoint.fingerprint != fingerprint:
+            checkpoint.fingerprint = fingerprint
+            checkpoint.rows_done = 0
+            checkpoint.completed = False
+            checkpoint.save()
+
+        if checkpoint.completed:
+            self.stdout.write(f"{source}: {path} already synced, nothing to do")
+            return 0
+
+        skip = checkpoint.rows_done
+        if skip:
+            self.stdout.write(f"{source}: resuming after row {skip}")
+        else:
+            self.stdout.write(f"Syncing {source}...")
+
+        created = updated = orphans = 0
+        seen = 0
+        for batch in read_batches(path, columns, options['chunk_size']):
+            if seen + len(batch) <= skip:
+                seen += len(batch)
+                continue
+            pending = batch[max(skip - seen, 0):]
+            seen += len(batch)
+
+            with transaction.atomic():
+                if source == 'customers':
+                    batch_created, batch_updated, customer_ids = sync_customers(pending)
+                else:
+                    batch_created, batch_updated, batch_orphans, customer_ids = sync_loans(pending)
+                    orphans += batch_orphans
+                    # bulk upserts skip the signals that maintain credit profiles
+                    refresh_profiles(customer_ids)
+                checkpoint.rows_done = seen
+                checkpoint.save(update_fields=['rows_done', 'updated_at'])
+            invalidate_credit_scores(customer_ids)
+            created += batch_created
+            updated += batch_updated
+            self.stdout.write(f"✓ {source}: {seen} rows checked, {created} new, {updated} changed")
+
+        checkpoint.completed = True
+        checkpoint.save(update_fields=['completed', 'updated_at'])
+        if orphans:
+            self.stdout.write(self.style.WARNING(f"Skipped {orphans} loans with an unknown Customer ID"))
+        return seen - skip
+
+    def load_rows(self, options):
+        """
+        Original row-by-row loader, one INSERT per row
+        Returns the number of rows written
+        """
+        chunk_size = options['chunk_size']
         print("Loading customers...")
-        # Read customer_data.xlsx with pandas
-        # customer_df = pd.read_excel('path/to/file')
-        customer_df = pd.read_excel('C:\\Users\\project\\Documents\\Alemeno - Internship assigment\\Credit Approval System - Backend\\Business_Records\\customer_data.xlsx')
-        
+
         # Create a mapping dictionary
         # customer_map = {}  # {excel_customer_id: django_customer_object}
         customer_map = {}
-        
+
         # Loop through customers and create Customer objects
-        # for index, row in customer_df.iterrows():
-        #           customer = Customer.objects.create(...)
-        #           customer_map[row['Customer ID']] = customer
-        for index, row in customer_df.iterrows():
-            customer = Customer.objects.create(
-                first_name=row['First Name'],
-                last_name=row['Last Name'],
-                age=row['Age'],
-                phone_number=row['Phone Number'],
-                monthly_salary=row['Monthly Salary'],
-                approved_limit=row['Approved Limit'],
-                current_debt=row.get('Current Debt', 0)  # Default to 0 if not present
-            )
+        for batch in read_batches(options['customers'], CUSTOMER_COLUMNS, chunk_size):
+            for row in batch:
+                customer = Customer.objects.create(
+                    first_name=row['first_name'],
+                    last_name=row['last_name'],
+                    age=row['age'],
+                    phone_number=row['phone_number'],
+                    monthly_salary=row['monthly_salary'],
+                    approved_limit=row['approved_limit'],
+                    current_debt=row['current_debt'],  # Defaults to 0 if not present
+                    # Same source id and hash as --bulk / --sync, so a later
+                    # --sync recognizes these rows instead of duplicating them
+                    source_id=customer_source_id(row),
+                    source_hash=row_hash(row, CUSTOMER_SYNC_FIELDS)
+                )
+
+                customer_map[row['customer_id']] = customer
 
-            customer_map[row['Customer ID']] = customer
+                print(f"✓ Created {len(customer_map)} customers")
 
-            print(f"✓ Created {len(customer_map)} customers")
-        
         self.stdout.write(self.style.SUCCESS(f'Loaded {len(customer_map)} customers'))
-        
-        # Read loan_data.xlsx with pandas
-        loan_df = pd.read_excel('C:\\Users\\project\\Documents\\Alemeno - Internship assigment\\Credit Approval System - Backend\\Business_Records\\loan_data.xlsx')
-        
+
         # Loop through loans and create Loan objects
         # Use customer_map to get the correct customer object!
-        #       customer_obj = customer_map[row['Customer ID']]
-        for index, row in loan_df.iterrows():
-            customer_obj = customer_map[row['Customer ID']]
-            Loan.objects.create(
-                customer=customer_obj,
-                loan_amount=row['Loan Amount'],
-                tenure=row['Tenure'],
-                interest_rate=row['Interest Rate'],
-                monthly_payment=row['Monthly payment'],
-                emis_paid_on_time=row['EMIs paid on Time'],
-                date_of_approval=row['Date of Approval'].date(),
-                end_date=row['End Date'].date()
-            )
-            print(f"✓ Created loan for customer {customer_obj}")
-        print(f"✓ Created {len(loan_df)} loans")
+        #       customer_obj = customer_map[row['customer_id']]
+        loan_count = 0
+        for batch in read_batches(options['loans'], LOAN_COLUMNS, chunk_size):
+            for row in batch:
+                customer_obj = customer_map[row['customer_id']]
+                Loan.objects.create(
+                    customer=customer_obj,
+                    loan_amount=row['loan_amount'],
+                    tenure=row['tenure'],
+                    interest_rate=row['interest_rate'],
+                    monthly_payment=row['monthly_payment'],
+                    emis_paid_on_time=row['emis_paid_on_time'],
+                    date_of_approval=row['date_of_approval'],
+                    end_date=row['end_date'],
+                    source_id=loan_source_id(row),
+                    source_hash=row_hash(row, LOAN_SYNC_FIELDS)
+                )
+                loan_count += 1
+                print(f"✓ Created loan for customer {customer_obj}")
+        print(f"✓ Created {loan_count} loans")
         print("DONE!")
-        
-        self.stdout.write(self.style.SUCCESS('Data loaded successfully!'))
\ No newline at end of file
+
+        return len(customer_map) + loan_count
@@ -0,0 +1,189 @@
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from loans.models import Customer, Loan
+
+SCENARIOS = ['view-loan', 'view-loans', 'check-eligibility']
+
+
+def build_plan(scenario, count, loan_ids, customer_ids, rng):
+    """(method, path, body) for each request of a scenario"""
+    plan = []
+    for _ in range(count):
+        if scenario == 'view-loan':
+            plan.append(('GET', f'/api/view-loan/{rng.choice(loan_ids)}/', None))
+        elif scenario == 'view-loans':
+            plan.append(('GET', f'/api/view-loans/{rng.choice(customer_ids)}/', None))
+        else:
+            body = {
+                'customer_id': rng.choice(customer_ids),
+                'loan_amount': rng.randrange(50000, 1000000, 10000),
+                'interest_rate': rng.choice([8, 10, 12, 14, 16]),
+                'tenure': rng.choice([6, 12, 24, 36, 60]),
+            }
+            plan.append(('POST', '/api/check-eligibility/', json.dumps(body)))
+    return plan
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def run_load(base_url, plan, concurrency, timeout=30):
+    """
+    Send the planned requests from `concurrency` threads, each on its own
+    keep-alive connection
+    Returns {'requests', 'errors', 'seconds', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms'}
+    """
+    url = urlsplit(base_url)
+    connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+    prefix = url.path.rstrip('/')
+    next_index = itertools.count()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        connection = connection_class(url.hostname, url.port, timeout=timeout)
+        own_latencies = []
+        own_errors = 0
+        while True:
+            index = next(next_index)
+            if index >= len(plan):
+                break
+            method, path, body = plan[index]
+            headers = {'Content-Type': 'application/json'} if body else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, prefix + path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors += 1
+            except (OSError, HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = connection_class(url.hostname, url.port, timeout=timeout)
+            own_latencies.append(time.perf_counter() - started)
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrent load against running servers, e.g. the sync views under '
+        '`runserver`/gunicorn and the async ones under '
+        '`LOANS_ASYNC_VIEWS=1 uvicorn credit_system.asgi:application`. '
+        'Loan and customer ids are sampled from this database, so point the '
+        'servers at the same one. Reports requests/s and latency percentiles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='+',
+            help='Base URL of each server to compare, e.g. sync=http://127.0.0.1:8000 async=http://127.0.0.1:8001'
+        )
+        parser.add_argument(
+            '--scenario',
+            choices=SCENARIOS + ['all'],
+            default='all',
+            help='Endpoint to load (default: each in turn)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help='Simultaneous client connections'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Requests per scenario and server'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=100,
+            help='Requests sent (and not measured) before each run'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the sampled ids and application amounts'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+
+        servers = []
+        for argument in options['urls']:
+            label, _, url = argument.rpartition('=')
+            servers.append((label or url, url))
+
+        loan_ids = list(Loan.objects.values_list('id', flat=True))
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+        if not loan_ids:
+            raise CommandError('No loans in the database: run load_data first')
+
+        scenarios = SCENARIOS if options['scenario'] == 'all' else [options['scenario']]
+        results = []
+        for scenario in scenarios:
+            # The same requests, in the same order, for every server
+            rng = random.Random(options['seed'])
+            plan = build_plan(scenario, options['requests'], loan_ids, customer_ids, rng)
+            warmup = build_plan(scenario, options['warmup'], loan_ids, customer_ids, rng)
+            for label, url in servers:
+                if warmup:
+                    run_load(url, warmup, options['concurrency'])
+                result = run_load(url, plan, options['concurrency'])
+                result.update(server=label, scenario=scenario, concurrency=options['concurrency'])
+                results.append(result)
+                if not options['json']:
+                    self.stdout.write(
+                        f"{scenario:<18} {label:<12} {result['rps']:>8.1f} req/s  "
+                        f"p50 {result['p50_ms']:>7.2f} ms  p90 {result['p90_ms']:>7.2f} ms  "
+                        f"p99 {result['p99_ms']:>7.2f} ms  errors {result['errors']}"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from loans.profiling import TOKEN_HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed token that turns on profiling for the requests carrying it'
+
+    def handle(self, *args, **options):
+        token = make_token()
+        self.stdout.write(token)
+        self.stderr.write(
+            f'Send it as "{TOKEN_HEADER}: {token}"; valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds. '
+            f'Profiles are listed at /api/profiles/.'
+        )
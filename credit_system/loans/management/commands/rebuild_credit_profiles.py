@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from loans.profiles import rebuild_profiles
+
+
+class Command(BaseCommand):
+    help = 'Recompute the credit profile of every customer from their loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Customers recomputed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_profiles(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} credit profiles in {elapsed:.2f}s'))
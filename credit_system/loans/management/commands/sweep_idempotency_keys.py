@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from loans.idempotency import get_idempotency_store
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key entries in bounded batches (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Entries deleted per statement'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches (default: until none are left)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = get_idempotency_store().sweep(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys in {elapsed:.2f}s'))
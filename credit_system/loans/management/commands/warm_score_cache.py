@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from loans.score_cache import warm_credit_scores
+
+
+class Command(BaseCommand):
+    help = 'Compute and cache the credit score of every customer (run after deploy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Customers scored and written to the cache per batch'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = warm_credit_scores(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Cached {written} credit scores in {elapsed:.2f}s'))
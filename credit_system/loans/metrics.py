@@ -0,0 +1,278 @@
+"""
+Request metrics, exposed at /metrics in Prometheus text format
+
+Recorded by loans.middleware.MetricsMiddleware for every request:
+- credit_http_request_duration_seconds: latency histogram per route
+  (the URL pattern, e.g. 'api/view-loan/<int:loan_id>/'), method and
+  status code
+- credit_db_queries_total / credit_db_query_duration_seconds_total:
+  queries run and time spent in the database, per route and method
+and by the views:
+- credit_loan_decisions_total: approve/reject decisions of
+  /check-eligibility/ and /create-loan/
+
+Recording is lock-free: every thread adds to its own dicts, and
+collect() sums them when /metrics is scraped.
+
+Several worker processes (gunicorn): set settings.METRICS_MULTIPROCESS_DIR
+to a directory shared by the workers, emptied before they start. Every
+process then writes its totals there (at most every
+METRICS_FLUSH_INTERVAL seconds, and at exit) and /metrics, whichever
+worker serves it, adds up the files of all processes, including ones
+that have exited.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help, label names)
+METRICS = {
+    'credit_http_request_duration_seconds': (
+        'histogram', 'Request latency by route', ('route', 'method', 'status'),
+    ),
+    'credit_db_queries_total': (
+        'counter', 'Database queries run by requests', ('route', 'method'),
+    ),
+    'credit_db_query_duration_seconds_total': (
+        'counter', 'Time requests spent in database queries', ('route', 'method'),
+    ),
+    'credit_loan_decisions_total': (
+        'counter', 'Loan approve/reject decisions', ('endpoint', 'decision'),
+    ),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def latency_buckets():
+    return tuple(getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_LATENCY_BUCKETS))
+
+
+class _ThreadStore:
+    """
+    One thread's metrics
+    counters: {(name, labels): value}
+    histograms: {(name, labels): [count per bucket..., count above the last bucket, sum]}
+    """
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+# Every thread's store (threads that have exited included, their counts
+# still count); the lock only guards adding a thread
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+
+# Multiprocess mode: this process's file and when it was last written
+_process_file = None
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """A forked worker starts from zero (the parent keeps its own counts)"""
+    global _local, _stores, _stores_lock, _process_file, _last_flush, _flush_lock
+    _local = threading.local()
+    _stores = []
+    _stores_lock = threading.Lock()
+    _process_file = None
+    _last_flush = 0.0
+    _flush_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _store():
+    try:
+        return _local.store
+    except AttributeError:
+        store = _local.store = _ThreadStore()
+        with _stores_lock:
+            _stores.append(store)
+        return store
+
+
+def inc(name, labels, amount=1):
+    """Add `amount` to a counter; labels: tuple of label values"""
+    counters = _store().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, labels, value, buckets=None):
+    """Record one value in a histogram"""
+    histograms = _store().histograms
+    key = (name, labels)
+    buckets = buckets or latency_buckets()
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    histogram[bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+def record_request(route, method, status_code, duration, queries, query_time):
+    """Metrics of one request (MetricsMiddleware)"""
+    observe('credit_http_request_duration_seconds', (route, method, str(status_code)), duration)
+    if queries:
+        inc('credit_db_queries_total', (route, method), queries)
+        inc('credit_db_query_duration_seconds_total', (route, method), query_time)
+    maybe_flush()
+
+
+def record_decision(endpoint, approved):
+    """One approve/reject decision of a lending endpoint"""
+    inc('credit_loan_decisions_total', (endpoint, 'approved' if approved else 'rejected'))
+
+
+def _merge(totals, counters, histograms):
+    total_counters, total_histograms = totals
+    for key, value in counters:
+        total_counters[key] = total_counters.get(key, 0) + value
+    for key, histogram in histograms:
+        total = total_histograms.get(key)
+        if total is None or len(total) != len(histogram):
+            total_histograms[key] = list(histogram)
+        else:
+            total_histograms[key] = [a + b for a, b in zip(total, histogram)]
+
+
+def collect_process():
+    """
+    (counters, histograms) of this process, summed over its threads
+    """
+    totals = ({}, {})
+    with _stores_lock:
+        stores = list(_stores)
+    for store in stores:
+        # list() copies each dict in one step, while its thread may be adding keys
+        _merge(totals, list(store.counters.items()), [(key, list(h)) for key, h in list(store.histograms.items())])
+    return totals
+
+
+def _multiprocess_dir():
+    directory = getattr(settings, 'METRICS_MULTIPROCESS_DIR', None)
+    return Path(directory) if directory else None
+
+
+def flush():
+    """Multiprocess mode: write this process's totals to its file"""
+    global _process_file, _last_flush
+    directory = _multiprocess_dir()
+    if directory is None:
+        return
+    if _process_file is None:
+        # pid plus a random part: a later process with a recycled pid
+        # must not overwrite an exited one's counts
+        _process_file = f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+    counters, histograms = collect_process()
+    data = {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()],
+    }
+    path = directory / _process_file
+    temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+    _last_flush = time.monotonic()
+
+
+def maybe_flush():
+    """flush() if the last one is older than METRICS_FLUSH_INTERVAL seconds"""
+    if _multiprocess_dir() is None:
+        return
+    if time.monotonic() - _last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0):
+        return
+    if _flush_lock.acquire(blocking=False):
+        try:
+            flush()
+        finally:
+            _flush_lock.release()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:  # pragma: no cover - best effort while shutting down
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def collect():
+    """
+    (counters, histograms) of this process, plus the files of every other
+    process in multiprocess mode
+    """
+    totals = collect_process()
+    directory = _multiprocess_dir()
+    if directory is None:
+        return totals
+    for path in directory.glob('metrics-*.json'):
+        if path.name == _process_file:
+            continue
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # being replaced, or not ours
+        _merge(
+            totals,
+            [((name, tuple(labels)), value) for name, labels, value in data['counters']],
+            [((name, tuple(labels)), values) for name, labels, values in data['histograms']],
+        )
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    counters, histograms = collect()
+    buckets = latency_buckets()
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(label_names, labels)} {value}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name or len(values) != len(buckets) + 2:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                bucket_labels = _labels(label_names, labels, f'le="{bound}"')
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            count = cumulative + values[-2]
+            bucket_labels = _labels(label_names, labels, 'le="+Inf"')
+            lines.append(f'{name}_bucket{bucket_labels} {count}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {values[-1]}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {count}')
+    return '\n'.join(lines) + '\n'
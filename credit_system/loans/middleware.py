@@ -0,0 +1,122 @@
+"""
+Middleware of the loans app
+"""
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics, profiling
+
+# [queries, seconds] of the request MetricsMiddleware is handling. A
+# context variable rather than a wrapper per request: async views run
+# the ORM through sync_to_async, on other threads with their own
+# connections, and the context (so the same list) follows them there.
+_request_queries = ContextVar('loans_request_queries', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper adding every query to the current request's totals"""
+    totals = _request_queries.get()
+    if totals is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals[0] += 1
+        totals[1] += time.perf_counter() - started
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        # in front: connection.execute_wrapper() pops the last wrapper on exit
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database queries and database time of every
+    request in loans.metrics, labelled with the matched URL pattern
+
+    Put it first in MIDDLEWARE so the timing covers the other middleware.
+    For streaming responses only the time until the response object is
+    returned is measured. Runs natively under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def record(self, request, response, duration, queries):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        metrics.record_request(route, request.method, response.status_code, duration, queries[0], queries[1])
+
+
+class ProfilingMiddleware:
+    """
+    Runs requests that ask for it (signed X-Profile-Token header) or are
+    sampled (PROFILING_SAMPLE_RATE) under cProfile; see loans.profiling
+
+    Async-capable so it does not push ASGI requests through a thread, but
+    only profiles on the sync path (WSGI): cProfile records a whole
+    thread, and on the event loop that thread interleaves every
+    concurrent request, so async requests are passed through unprofiled.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if profiling.should_profile(request):
+            return profiling.profile_request(request, self.get_response)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
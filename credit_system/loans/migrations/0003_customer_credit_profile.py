@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_sync_source_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCreditProfile',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_profile', serialize=False, to='loans.customer')),
+                ('as_of', models.DateField()),
+                ('loan_count', models.IntegerField(default=0)),
+                ('active_loan_count', models.IntegerField(default=0)),
+                ('active_debt', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_emi_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('payment_ratio_sum', models.FloatField(default=0)),
+                ('current_year_loan_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_idempotency_record'),
+    ]
+
+    operations = [
+        # New index first, so customer_id stays indexed throughout
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'end_date'], name='loan_customer_active_idx'),
+        ),
+        migrations.AlterField(
+            model_name='loan',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='loans.customer'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 
+from .querysets import CustomerQuerySet, LoanQuerySet
+
 class Customer(models.Model):
     # Django auto-creates 'id' as primary key - you don't need to define it!
     
@@ -19,6 +21,13 @@ class Customer(models.Model):
     approved_limit = models.DecimalField(max_digits=12, decimal_places=2)
     current_debt = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    # Set by load_data: 'Customer ID' from the source file and a hash of the
+    # row, so incremental syncs can tell new / changed / unchanged rows apart
+    source_id = models.BigIntegerField(null=True, blank=True, unique=True)
+    source_hash = models.CharField(max_length=64, blank=True, default='')
+
+    objects = CustomerQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
@@ -34,7 +43,8 @@ class Loan(models.Model):
     # 6. emis_paid_on_time
     # 7. date_of_approval
     # 8. end_date
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans')
+    # Indexed through loan_customer_active_idx below (leftmost column)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans', db_index=False)
     loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
     tenure = models.IntegerField()
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
@@ -42,6 +52,95 @@ class Loan(models.Model):
     emis_paid_on_time = models.IntegerField()
     date_of_approval = models.DateField()
     end_date = models.DateField()
+
+    # Set by load_data: '<Customer ID>:<Loan ID>' from the source file
+    # (Loan ID alone is not unique) and a hash of the row
+    source_id = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    source_hash = models.CharField(max_length=64, blank=True, default='')
+
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Loans of a customer, and its active ones: customer_id = ? AND
+            # end_date >= ?. The EMI and debt totals come from
+            # CustomerCreditProfile, so no amount columns are carried along.
+            models.Index(fields=['customer', 'end_date'], name='loan_customer_active_idx'),
+        ]
     
     def __str__(self):
-        return f"Loan #{self.id} - Customer {self.customer.id}"
\ No newline at end of file
+        return f"Loan #{self.id} - Customer {self.customer.id}"
+
+class SyncCheckpoint(models.Model):
+    """
+    Progress of a `load_data --sync` run over one source file
+    Lets an interrupted sync resume after the last committed batch
+    """
+    source = models.CharField(max_length=20)  # 'customers' or 'loans'
+    path = models.CharField(max_length=500)
+    fingerprint = models.CharField(max_length=100)  # file size + mtime
+    rows_done = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('source', 'path')
+
+    def __str__(self):
+        return f"{self.source} sync of {self.path} ({self.rows_done} rows)"
+
+
+class CustomerCreditProfile(models.Model):
+    """
+    Loan aggregates of one customer, materialized for credit scoring
+    Values are as of `as_of` (a loan is active when end_date >= as_of) and
+    are maintained by loans.profiles whenever a loan is written
+    """
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name='credit_profile'
+    )
+    as_of = models.DateField()
+    loan_count = models.IntegerField(default=0)
+    active_loan_count = models.IntegerField(default=0)
+    active_debt = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    active_emi_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    payment_ratio_sum = models.FloatField(default=0)
+    current_year_loan_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    AGGREGATE_FIELDS = [
+        'loan_count', 'active_loan_count', 'active_debt', 'active_emi_total',
+        'payment_ratio_sum', 'current_year_loan_count',
+    ]
+
+    def aggregates(self):
+        """The stored values as a dict, as expected by loans.scoring"""
+        return {name: getattr(self, name) for name in self.AGGREGATE_FIELDS}
+
+    def __str__(self):
+        return f"Credit profile of customer {self.customer_id} as of {self.as_of}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Stored outcome of a POST made with an Idempotency-Key header
+    (see loans.idempotency). A record is 'pending' while the first request
+    runs and holds the response once it has finished; it is swept after
+    expires_at.
+    """
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+
+    scope = models.CharField(max_length=30)  # endpoint, e.g. 'create-loan'
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=32)
+    state = models.CharField(max_length=10, default=PENDING)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.TextField(blank=True, default='')  # compact JSON
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('scope', 'key')
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.state})"
@@ -0,0 +1,56 @@
+"""
+Largest approvable loan amount per tenure
+
+A loan is approved by check_eligibility when the customer's credit score
+is above 10 and its EMI fits in the remaining EMI capacity:
+
+    capacity = 50% of monthly salary - EMIs of the active loans
+
+The EMI is P * A(r, n) (see loans.emi), so for each tenure n the largest
+amount is capacity / A(r, n), taken at the corrected interest rate (the
+12% / 16% floors of correct_interest_rate): the EMI the customer would
+actually pay. That is never more than the EMI at the requested rate, so
+every offer also passes check_eligibility's capacity check.
+
+All tenures are solved at once from the annuity-factor table, then each
+amount is checked against monthly_emi (the Decimal EMI the views use) and
+moved by a paisa where rounding decides differently, so it is exactly the
+largest amount whose EMI fits.
+"""
+from decimal import ROUND_FLOOR, Decimal
+
+import numpy as np
+
+from .emi import PAISA, annuity_factor_array, emi_paise_array, monthly_emi
+
+
+def max_loan_amounts(capacity, annual_rate, tenures):
+    """
+    Largest loan amount (Decimal rupees, 0 if none) for each tenure whose
+    monthly_emi(amount, annual_rate, tenure) is at most `capacity`
+    """
+    tenures = np.asarray(tenures, dtype=np.int64)
+    capacity_paise = int((Decimal(capacity) * 100).to_integral_value(rounding=ROUND_FLOOR))
+    if capacity_paise <= 0 or not len(tenures):
+        return [Decimal(0)] * len(tenures)
+
+    # Closed form on the float table: the EMI of P paise is rint(P * A(r, n))
+    rates = np.full(len(tenures), float(annual_rate))
+    amounts = np.floor((capacity_paise + 0.5) / annuity_factor_array(rates, tenures)).astype(np.int64)
+    for _ in range(3):
+        over = emi_paise_array(amounts, rates, tenures) > capacity_paise
+        if not over.any():
+            break
+        amounts[over] -= 1
+
+    # Exact check with the Decimal EMI the views use
+    capacity = Decimal(capacity_paise) * PAISA
+    results = []
+    for amount, tenure in zip(amounts.tolist(), tenures.tolist()):
+        amount = Decimal(max(amount, 0)) * PAISA
+        while amount > 0 and monthly_emi(amount, annual_rate, tenure) > capacity:
+            amount -= PAISA
+        while monthly_emi(amount + PAISA, annual_rate, tenure) <= capacity:
+            amount += PAISA
+        results.append(amount)
+    return results
@@ -0,0 +1,240 @@
+"""
+Synthetic customer and loan portfolios for scale testing
+
+fit_sample() reads the sample files (Business_Records/*.xlsx or any file
+load_data accepts) and keeps, per column, the sorted sample values:
+
+- monthly salary, age, approved limit, loan amount, interest rate, the
+  share of the tenure paid on time and the approval date are drawn from
+  the sample's empirical distribution, interpolated between sample
+  points and rounded to the sample's granularity (e.g. salaries in
+  thousands, limits in lakhs)
+- tenure and loans per customer (including customers without loans)
+  are drawn from their observed frequencies
+- names come from the sample's first and last names
+
+Monthly payments are the EMI of the generated amount, rate and tenure
+(loans.emi) and end dates are the approval date plus the tenure, as for
+loans created through the API.
+
+Generation is split into chunks of customers. A chunk only depends on
+(seed, chunk index), so the output is the same whatever the number of
+worker processes. Loan counts are drawn first (loan_counts()), so every
+chunk knows its first Loan ID up front. Chunks can be rendered to CSV
+text (to_csv) or Arrow tables (to_arrow, needs pyarrow) with the sample
+files' headers, so the output loads with `load_data --bulk`.
+"""
+import csv
+import io
+from math import gcd
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+from .emi import emi_paise_array
+from .readers import CUSTOMER_COLUMNS, LOAN_COLUMNS, read_batches
+from .schedules import due_dates, format_paise
+
+# Source file headers, in the order of the sample files
+CUSTOMER_HEADERS = [column.header for name, column in CUSTOMER_COLUMNS.items() if name != 'current_debt']
+LOAN_HEADERS = [column.header for column in LOAN_COLUMNS.values()]
+
+
+def _granularity(values):
+    """Largest power of ten dividing every (whole) value"""
+    step = 0
+    for value in values:
+        step = gcd(step, int(value))
+    granularity = 1
+    while step and step % (granularity * 10) == 0:
+        granularity *= 10
+    return granularity
+
+
+def _continuous(values):
+    values = np.sort(np.asarray([float(value) for value in values], dtype=np.float64))
+    return {'values': values, 'step': _granularity(values) if np.all(values == np.round(values)) else 0}
+
+
+def _discrete(values):
+    choices, counts = np.unique(np.asarray(values, dtype=np.int64), return_counts=True)
+    return {'choices': choices, 'p': counts / counts.sum()}
+
+
+def fit_sample(customers_path, loans_path):
+    """
+    Distributions of the sample files, as a dict of plain arrays (cheap to
+    send to worker processes)
+    """
+    customers = [row for batch in read_batches(customers_path, CUSTOMER_COLUMNS) for row in batch]
+    loans = [row for batch in read_batches(loans_path, LOAN_COLUMNS) for row in batch]
+    if not customers or not loans:
+        raise ValueError("The sample files need at least one customer and one loan")
+
+    loans_per_customer = {row['customer_id']: 0 for row in customers}
+    for row in loans:
+        loans_per_customer[row['customer_id']] = loans_per_customer.get(row['customer_id'], 0) + 1
+
+    return {
+        'first_names': np.array(sorted({row['first_name'] for row in customers})),
+        'last_names': np.array(sorted({row['last_name'] for row in customers})),
+        'age': _continuous(row['age'] for row in customers),
+        'monthly_salary': _continuous(row['monthly_salary'] for row in customers),
+        'approved_limit': _continuous(row['approved_limit'] for row in customers),
+        'loans_per_customer': _discrete(list(loans_per_customer.values())),
+        'loan_amount': _continuous(row['loan_amount'] for row in loans),
+        'tenure': _discrete([row['tenure'] for row in loans]),
+        'interest_rate': _continuous(row['interest_rate'] for row in loans),
+        'paid_share': _continuous(row['emis_paid_on_time'] / row['tenure'] for row in loans),
+        'approval_day': _continuous(row['date_of_approval'].toordinal() for row in loans),
+    }
+
+
+def _draw(rng, distribution, size, decimals=None):
+    """Sample an empirical distribution, interpolating between sample points"""
+    values = distribution['values']
+    positions = rng.random(size) * (len(values) - 1)
+    drawn = np.interp(positions, np.arange(len(values)), values)
+    if decimals is not None:
+        return np.round(drawn, decimals)
+    step = distribution['step']
+    return np.rint(drawn / step) * step if step else drawn
+
+
+def _chunk_rng(seed, chunk_index, stream):
+    return np.random.default_rng([seed, chunk_index, stream])
+
+
+def loan_counts(model, seed, chunk_index, customers, loans_per_customer=None):
+    """
+    Loans of each customer of a chunk; with `loans_per_customer` the
+    sample's frequencies are scaled to that mean
+    """
+    distribution = model['loans_per_customer']
+    counts = _chunk_rng(seed, chunk_index, 0).choice(distribution['choices'], size=customers, p=distribution['p'])
+    if loans_per_customer is not None:
+        sample_mean = float(np.dot(distribution['choices'], distribution['p']))
+        factor = loans_per_customer / sample_mean if sample_mean else 0
+        # Randomized rounding keeps the requested mean
+        scaled = counts * factor
+        counts = np.floor(scaled + _chunk_rng(seed, chunk_index, 1).random(customers)).astype(np.int64)
+    return counts.astype(np.int64)
+
+
+def generate_chunk(model, seed, chunk_index, first_customer_id, first_loan_id, counts):
+    """
+    Customers and loans of one chunk as column arrays
+    counts: loan_counts() of the chunk
+    Returns (customers, loans), dicts keyed like CUSTOMER_COLUMNS / LOAN_COLUMNS
+    """
+    rng = _chunk_rng(seed, chunk_index, 2)
+    size = len(counts)
+
+    customer_ids = np.arange(first_customer_id, first_customer_id + size, dtype=np.int64)
+    customers = {
+        'customer_id': customer_ids,
+        'first_name': rng.choice(model['first_names'], size),
+        'last_name': rng.choice(model['last_names'], size),
+        'age': _draw(rng, model['age'], size).astype(np.int64),
+        'phone_number': rng.integers(9_000_000_000, 10_000_000_000, size, dtype=np.int64),
+        'monthly_salary': _draw(rng, model['monthly_salary'], size),
+        'approved_limit': _draw(rng, model['approved_limit'], size),
+    }
+
+    total = int(counts.sum())
+    tenure = rng.choice(model['tenure']['choices'], size=total, p=model['tenure']['p']).astype(np.int64)
+    loan_amount = _draw(rng, model['loan_amount'], total)
+    interest_rate = _draw(rng, model['interest_rate'], total, decimals=2)
+    approval = _draw(rng, model['approval_day'], total).astype(np.int64)
+    approval = (approval - 719163).astype('datetime64[D]')  # ordinal -> days since 1970-01-01
+    loans = {
+        'customer_id': np.repeat(customer_ids, counts),
+        'loan_id': np.arange(first_loan_id, first_loan_id + total, dtype=np.int64),
+        'loan_amount': loan_amount,
+        'tenure': tenure,
+        'interest_rate': interest_rate,
+        'monthly_payment': emi_paise_array(np.rint(loan_amount * 100), interest_rate, tenure),  # paise
+        'emis_paid_on_time': np.clip(np.rint(_draw(rng, model['paid_share'], total) * tenure), 0, tenure).astype(np.int64),
+        'date_of_approval': approval,
+        'end_date': due_dates(approval, tenure),
+    }
+    return customers, loans
+
+
+def _number_strings(values):
+    """Whole numbers without a trailing .0, others as they are"""
+    if np.all(values == np.round(values)):
+        return values.astype(np.int64).tolist()
+    return values.tolist()
+
+
+def to_csv(customers, loans):
+    """
+    (customer CSV text, loan CSV text) of a generate_chunk() result,
+    without header rows
+    """
+    customer_rows = zip(
+        customers['customer_id'].tolist(), customers['first_name'].tolist(), customers['last_name'].tolist(),
+        customers['age'].tolist(), customers['phone_number'].tolist(),
+        _number_strings(customers['monthly_salary']), _number_strings(customers['approved_limit']),
+    )
+    loan_rows = zip(
+        loans['customer_id'].tolist(), loans['loan_id'].tolist(), _number_strings(loans['loan_amount']),
+        loans['tenure'].tolist(), [f'{rate:.2f}' for rate in loans['interest_rate'].tolist()],
+        format_paise(loans['monthly_payment']), loans['emis_paid_on_time'].tolist(),
+        np.datetime_as_string(loans['date_of_approval']).tolist(), np.datetime_as_string(loans['end_date']).tolist(),
+    )
+    texts = []
+    for rows in (customer_rows, loan_rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        texts.append(buffer.getvalue())
+    return tuple(texts)
+
+
+def to_arrow(customers, loans):
+    """
+    (customer table, loan table) of a generate_chunk() result as pyarrow
+    Tables with the sample files' headers
+    """
+    if pa is None:
+        raise ImportError("Writing parquet files requires pyarrow (pip install pyarrow)")
+    customer_table = pa.table({
+        'Customer ID': customers['customer_id'],
+        'First Name': customers['first_name'].astype(str),
+        'Last Name': customers['last_name'].astype(str),
+        'Age': customers['age'],
+        'Phone Number': customers['phone_number'].astype(str),
+        'Monthly Salary': customers['monthly_salary'],
+        'Approved Limit': customers['approved_limit'],
+    })
+    loan_table = pa.table({
+        'Customer ID': loans['customer_id'],
+        'Loan ID': loans['loan_id'],
+        'Loan Amount': loans['loan_amount'],
+        'Tenure': loans['tenure'],
+        'Interest Rate': loans['interest_rate'],
+        'Monthly payment': loans['monthly_payment'] / 100,
+        'EMIs paid on Time': loans['emis_paid_on_time'],
+        'Date of Approval': loans['date_of_approval'],
+        'End Date': loans['end_date'],
+    })
+    return customer_table, loan_table
+
+
+def chunk_task(task):
+    """
+    Worker entry point: generate_chunk() for a task dict holding its
+    arguments, rendered with to_csv() when task['format'] is 'csv'
+    """
+    customers, loans = generate_chunk(
+        task['model'], task['seed'], task['chunk_index'],
+        task['first_customer_id'], task['first_loan_id'], task['counts'],
+    )
+    if task['format'] == 'csv':
+        return to_csv(customers, loans)
+    return customers, loans
@@ -0,0 +1,151 @@
+"""
+Maintenance of the CustomerCreditProfile table
+
+A profile holds the loan aggregates calculate_credit_score needs (see
+loans.scoring) for one customer as of one date. Profiles are kept current:
+
+- a new loan is added to its customer's profile with F() increments, in
+  the same transaction as the INSERT (see signals.py)
+- an updated or deleted loan triggers a recompute of that customer
+- the loader recomputes the customers it touched (bulk_create skips signals)
+- a profile built for another date is recomputed when it is read
+
+rebuild_profiles recomputes everything and check_profiles compares the
+stored rows with a full recomputation.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Customer, CustomerCreditProfile, Loan
+from .scoring import add_loan, empty_aggregates
+from .utils import chunked, get_current_date
+
+# Loan columns the scoring rules look at
+SCORING_LOAN_FIELDS = [
+    'customer_id', 'loan_amount', 'tenure', 'monthly_payment',
+    'emis_paid_on_time', 'date_of_approval', 'end_date',
+]
+
+
+def compute_profiles(customer_ids, as_of):
+    """
+    Aggregates recomputed from the loans of the given customers
+    Returns {customer_id: aggregates}
+    """
+    aggregates = {customer_id: empty_aggregates() for customer_id in customer_ids}
+    loans = (
+        Loan.objects.filter(customer_id__in=aggregates)
+        .order_by('customer_id', 'id')
+        .only(*SCORING_LOAN_FIELDS)
+    )
+    for loan in loans.iterator(chunk_size=2000):
+        add_loan(aggregates[loan.customer_id], loan, as_of)
+    return aggregates
+
+
+def refresh_profiles(customer_ids, as_of=None):
+    """
+    Recompute and upsert the profiles of the given customers
+    Returns {customer_id: CustomerCreditProfile}
+    """
+    as_of = as_of or get_current_date()
+    profiles = [
+        CustomerCreditProfile(customer_id=customer_id, as_of=as_of, **values)
+        for customer_id, values in compute_profiles(customer_ids, as_of).items()
+    ]
+    CustomerCreditProfile.objects.bulk_create(
+        profiles,
+        update_conflicts=True,
+        unique_fields=['customer'],
+        update_fields=['as_of', 'updated_at'] + CustomerCreditProfile.AGGREGATE_FIELDS,
+    )
+    return {profile.customer_id: profile for profile in profiles}
+
+
+def get_credit_profile(customer, as_of=None):
+    """
+    The customer's profile as of `as_of` (default: get_current_date())
+    No query when the profile was joined in with
+    select_related('credit_profile'), one otherwise, and a recompute when
+    the stored row is missing or was built for another date
+    """
+    as_of = as_of or get_current_date()
+    try:
+        profile = customer.credit_profile
+    except CustomerCreditProfile.DoesNotExist:
+        profile = None
+    if profile is None or profile.as_of != as_of:
+        profile = refresh_profiles([customer.pk], as_of)[customer.pk]
+    return profile
+
+
+def _fits_column(loan, name):
+    """True when the loan's value is stored without rounding"""
+    value = getattr(loan, name)
+    if isinstance(value, int):
+        return True
+    decimal_places = Loan._meta.get_field(name).decimal_places
+    return isinstance(value, Decimal) and value.as_tuple().exponent >= -decimal_places
+
+
+def record_new_loan(loan):
+    """
+    Add a freshly inserted loan to its customer's profile
+    Falls back to a recompute when there is no profile for today yet
+    """
+    as_of = get_current_date()
+    # The database rounds amounts to the column's decimal places; re-read
+    # them if the caller passed more precision than gets stored
+    if not all(_fits_column(loan, name) for name in ('loan_amount', 'monthly_payment')):
+        loan.refresh_from_db(fields=['loan_amount', 'monthly_payment'])
+    delta = add_loan(empty_aggregates(), loan, as_of)
+
+    updated = CustomerCreditProfile.objects.filter(
+        customer_id=loan.customer_id, as_of=as_of
+    ).update(**{name: F(name) + value for name, value in delta.items()})
+    if not updated:
+        refresh_profiles([loan.customer_id], as_of)
+
+
+def rebuild_profiles(as_of=None, batch_size=2000, customer_ids=None):
+    """
+    Recompute the profiles of all customers (or of `customer_ids`),
+    one transaction per batch of customers
+    Returns the number of profiles written
+    """
+    as_of = as_of or get_current_date()
+    if customer_ids is None:
+        customer_ids = Customer.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size)
+
+    written = 0
+    for batch in chunked(customer_ids, batch_size):
+        with transaction.atomic():
+            refresh_profiles(batch, as_of)
+        written += len(batch)
+    return written
+
+
+def check_profiles(batch_size=2000):
+    """
+    Compare every stored profile with a full recomputation for its own as_of
+    Yields (customer_id, field, stored, expected) for each difference;
+    customers without a profile are reported with field 'profile'
+    """
+    customer_ids = Customer.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size)
+    for batch in chunked(customer_ids, batch_size):
+        stored = CustomerCreditProfile.objects.in_bulk(batch)
+        by_date = {}
+        for customer_id in batch:
+            if customer_id not in stored:
+                yield customer_id, 'profile', None, 'missing'
+                continue
+            by_date.setdefault(stored[customer_id].as_of, []).append(customer_id)
+
+        for as_of, ids in by_date.items():
+            for customer_id, expected in compute_profiles(ids, as_of).items():
+                profile = stored[customer_id]
+                for name, value in expected.items():
+                    if getattr(profile, name) != value:
+                        yield customer_id, name, getattr(profile, name), value
@@ -0,0 +1,224 @@
+"""
+Opt-in per-request profiling
+
+loans.middleware.ProfilingMiddleware runs a request under cProfile when
+- it carries a valid X-Profile-Token header: a token signed with the
+  SECRET_KEY, from `manage.py profiling_token`, valid for
+  settings.PROFILING_TOKEN_MAX_AGE seconds, or
+- it is picked by settings.PROFILING_SAMPLE_RATE (0.0 - 1.0)
+and its path starts with one of settings.PROFILING_PATHS.
+
+A profiled response gets an X-Profile-Id header. The profile is written
+to settings.PROFILING_DIR as <id>.prof (pstats format: snakeviz,
+`python -m pstats`, ...) with <id>.json next to it holding the request,
+the response status, the duration and the time spent in each group of
+TAGS. Only the newest settings.PROFILING_MAX_PROFILES are kept.
+
+Admins list them at /api/profiles/ and download one at
+/api/profiles/<id>/ (?report=1 for the top of the pstats report).
+
+cProfile only sees the thread the middleware runs in, so the async
+views (LOANS_ASYNC_VIEWS) show up as time spent waiting on them. Under
+ASGI nothing is profiled: the event loop thread interleaves concurrent
+requests, so the middleware passes async requests through untouched.
+Profile behind WSGI (gunicorn, runserver).
+"""
+import cProfile
+import importlib
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_SALT = 'loans.profiling'
+
+PROFILE_ID = re.compile(r'[0-9]+-[0-9a-f]{8}')
+
+# Groups of functions whose time is reported on its own: dotted names of
+# functions, or of modules/packages (every function defined in them).
+# Time in nested calls within a group is only counted once.
+TAGS = {
+    'credit_score': [
+        'loans.scoring.calculate_credit_score',
+        'loans.scoring.score_from_aggregates',
+        'loans.score_cache.get_credit_snapshot',
+        'loans.score_cache.get_credit_snapshots',
+        'loans.score_cache.build_snapshot',
+    ],
+    'emi': [
+        'loans.views.calculate_emi',
+        'loans.emi.monthly_emi',
+        'loans.emi.emi_paise_array',
+    ],
+    'orm': ['django.db'],
+}
+
+
+def make_token():
+    """Signed value for the X-Profile-Token header"""
+    return signing.dumps('profile', salt=TOKEN_SALT)
+
+
+def valid_token(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+def should_profile(request):
+    """Does this request ask for (or get sampled for) profiling?"""
+    if not request.path.startswith(tuple(settings.PROFILING_PATHS)):
+        return False
+    token = request.headers.get(TOKEN_HEADER)
+    if token is not None:
+        return valid_token(token)
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _code_location(dotted_name):
+    """
+    (file, function name) of a function, or (directory or file, None) for
+    a module or package; None if it cannot be imported
+    """
+    try:
+        module = importlib.import_module(dotted_name)
+        path = Path(module.__file__)
+        return str(path.parent if path.name == '__init__.py' else path), None
+    except ImportError:
+        pass
+    module_name, _, function_name = dotted_name.rpartition('.')
+    try:
+        module = importlib.import_module(module_name)
+        code = getattr(module, function_name).__code__
+    except (ImportError, AttributeError):
+        return None
+    return code.co_filename, code.co_name
+
+
+def _in_group(function, locations):
+    filename, _, name = function
+    for location, function_name in locations:
+        if function_name is None:
+            if filename == location or filename.startswith(location + os.sep):
+                return True
+        elif filename == location and name == function_name:
+            return True
+    return False
+
+
+def tag_times(stats):
+    """
+    {tag: seconds} for a pstats.Stats: the cumulative time of every
+    function of the group, minus what they spent calling each other
+    """
+    times = {}
+    for tag, names in TAGS.items():
+        locations = [location for location in map(_code_location, names) if location is not None]
+        members = {function for function in stats.stats if _in_group(function, locations)}
+        total = 0.0
+        for function in members:
+            _, _, _, cumulative, callers = stats.stats[function]
+            from_group = sum(timing[3] for caller, timing in callers.items() if caller in members)
+            total += cumulative - from_group
+        times[tag] = round(total, 6)
+    return times
+
+
+def profile_directory():
+    return Path(settings.PROFILING_DIR)
+
+
+def save_profile(profiler, request, response, duration):
+    """
+    Write a finished profile and its summary, then drop the oldest ones
+    beyond PROFILING_MAX_PROFILES
+    Returns the profile id
+    """
+    directory = profile_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(directory / f'{profile_id}.prof')
+    summary = {
+        'id': profile_id,
+        'created': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration': round(duration, 6),
+        'tags': tag_times(stats),
+    }
+    (directory / f'{profile_id}.json').write_text(json.dumps(summary))
+
+    for stale in list_profiles()[settings.PROFILING_MAX_PROFILES:]:
+        for suffix in ('.json', '.prof'):
+            (directory / f"{stale['id']}{suffix}").unlink(missing_ok=True)
+    return profile_id
+
+
+def profile_request(request, get_response):
+    """Run get_response(request) under cProfile and save the profile"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler (or debugger) is active in this thread
+        return get_response(request)
+
+    started = time.perf_counter()
+    try:
+        response = get_response(request)
+    finally:
+        profiler.disable()
+    duration = time.perf_counter() - started
+
+    try:
+        response['X-Profile-Id'] = save_profile(profiler, request, response, duration)
+    except OSError:
+        logger.exception('Could not save the profile of %s %s', request.method, request.path)
+    return response
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first"""
+    directory = profile_directory()
+    if not directory.is_dir():
+        return []
+    summaries = []
+    for path in directory.glob('*.json'):
+        try:
+            summaries.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue  # removed or being written
+    summaries.sort(key=lambda summary: int(summary['id'].split('-')[0]), reverse=True)
+    return summaries
+
+
+def profile_path(profile_id):
+    """Path of a stored .prof file, or None"""
+    if not PROFILE_ID.fullmatch(profile_id):
+        return None
+    path = profile_directory() / f'{profile_id}.prof'
+    return path if path.is_file() else None
+
+
+def profile_report(path, limit=50):
+    """The `limit` functions with the most cumulative time, as pstats text"""
+    output = io.StringIO()
+    pstats.Stats(str(path), stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
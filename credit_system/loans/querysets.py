@@ -0,0 +1,153 @@
+"""
+Database-side credit scoring
+
+Customer.objects.with_credit_score(as_of=...) annotates every customer with
+its credit score, computed by the database in one GROUP BY statement. The
+expressions mirror loans.scoring rule for rule and work on PostgreSQL and
+SQLite:
+
+- months_between (relativedelta semantics) becomes month arithmetic on the
+  extracted year / month / day, with the as-of date folded in as constants
+- min(emis_paid / expected, 1.0) becomes a CASE on emis_paid >= expected
+- round() (half to even) is spelled out with FLOOR and MOD
+
+Only the payment-ratio SUM may add its terms in a different order than
+the Python path, which can matter for totals within 1e-12 of x.5.
+"""
+import calendar
+
+from django.db import models
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, ExtractDay, ExtractMonth, ExtractYear, Floor, Mod
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual, LessThan, LessThanOrEqual
+
+from .utils import get_current_date
+
+
+def _float(expression):
+    return Cast(expression, FloatField())
+
+
+def expected_emis_expression(as_of):
+    """months_between(loans__date_of_approval, as_of) as a SQL expression"""
+    as_of_month = as_of.year * 12 + as_of.month - 1
+    months = Value(as_of_month) - (
+        ExtractYear('loans__date_of_approval') * 12 + ExtractMonth('loans__date_of_approval') - 1
+    )
+    # relativedelta steps back a month when the approval day (clamped to
+    # the as-of month's length) has not been reached yet; on the last day
+    # of the month it always has
+    days_in_month = calendar.monthrange(as_of.year, as_of.month)[1]
+    if as_of.day < days_in_month:
+        months = months - Case(
+            When(GreaterThan(ExtractDay('loans__date_of_approval'), as_of.day), then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    return Case(
+        When(loans__date_of_approval__gt=as_of, then=Value(0)),
+        default=months,
+        output_field=IntegerField(),
+    )
+
+
+def payment_ratio_expression(as_of):
+    """scoring.payment_ratio for the joined loan as a SQL expression"""
+    expected = expected_emis_expression(as_of)
+    emis_paid = F('loans__emis_paid_on_time')
+    return Case(
+        When(loans__end_date__lt=as_of, then=_float(emis_paid) / _float(F('loans__tenure'))),
+        When(LessThanOrEqual(expected, 0), then=Value(1.0)),
+        When(GreaterThanOrEqual(emis_paid, expected), then=Value(1.0)),
+        default=_float(emis_paid) / _float(expected),
+        output_field=FloatField(),
+    )
+
+
+def round_half_even(expression):
+    """Python's round() for a float expression, as an integer expression"""
+    floor = Cast(Floor(expression), IntegerField())
+    fraction = expression - floor
+    return Case(
+        When(GreaterThan(fraction, 0.5), then=floor + 1),
+        When(LessThan(fraction, 0.5), then=floor),
+        default=floor + Mod(floor, 2),
+        output_field=IntegerField(),
+    )
+
+
+class CustomerQuerySet(models.QuerySet):
+
+    def with_credit_score(self, as_of=None):
+        """
+        Annotate customers with `credit_score` and its inputs:
+        loan_count, active_debt, payment_ratio_sum, current_year_loan_count
+        """
+        as_of = as_of or get_current_date()
+        year = as_of.year
+        money = models.DecimalField(max_digits=16, decimal_places=2)
+
+        queryset = self.annotate(
+            loan_count=Count('loans'),
+            active_debt=Coalesce(
+                Sum(
+                    F('loans__loan_amount') - F('loans__emis_paid_on_time') * F('loans__monthly_payment'),
+                    filter=Q(loans__end_date__gte=as_of),
+                    output_field=money,
+                ),
+                Value(0),
+                output_field=money,
+            ),
+            payment_ratio_sum=Coalesce(Sum(payment_ratio_expression(as_of)), Value(0.0)),
+            current_year_loan_count=Count(
+                'loans',
+                filter=Q(loans__date_of_approval__year__lte=year, loans__end_date__year__gte=year),
+            ),
+        )
+
+        # COMPONENT 1: payment history (50 points)
+        payment_history = Case(
+            When(loan_count=0, then=Value(0.0)),
+            default=F('payment_ratio_sum') / _float(F('loan_count')) * 50,
+            output_field=FloatField(),
+        )
+        # COMPONENT 2: number of loans (15 / 10 / 5 points)
+        loan_count_score = Case(
+            When(loan_count__lte=3, then=Value(15)),
+            When(loan_count__lte=6, then=Value(10)),
+            default=Value(5),
+        )
+        # COMPONENT 3: utilization (20 / 15 / 10 / 5 points)
+        # debt / limit < 0.3  <=>  10 * debt < 3 * limit
+        debt = F('active_debt') * 10
+        volume_score = Case(
+            When(approved_limit__lte=0, then=Value(20)),
+            When(LessThan(debt, F('approved_limit') * 3), then=Value(20)),
+            When(LessThan(debt, F('approved_limit') * 5), then=Value(15)),
+            When(LessThan(debt, F('approved_limit') * 8), then=Value(10)),
+            default=Value(5),
+        )
+        # COMPONENT 4: current year activity (15 / 10 / 5 points)
+        activity_score = Case(
+            When(current_year_loan_count=0, then=Value(15)),
+            When(current_year_loan_count__lte=2, then=Value(10)),
+            default=Value(5),
+        )
+
+        total = payment_history + loan_count_score + volume_score + activity_score
+        return queryset.annotate(
+            credit_score=Case(
+                When(loan_count=0, then=Value(0)),
+                # OVERRIDE: current debt above the approved limit
+                When(GreaterThan(F('active_debt'), F('approved_limit')), then=Value(0)),
+                default=round_half_even(total),
+                output_field=IntegerField(),
+            )
+        )
+
+
+class LoanQuerySet(models.QuerySet):
+
+    def active(self, as_of=None):
+        """Loans not yet ended on `as_of` (end_date >= as_of), like the scoring rules"""
+        return self.filter(end_date__gte=as_of or get_current_date())
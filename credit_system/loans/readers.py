@@ -0,0 +1,154 @@
+"""
+Streaming readers for customer and loan source files.
+
+Every reader yields batches of rows as dicts keyed by our own field names,
+so only one batch is held in memory at a time whatever the size of the
+file. Supported formats: .xlsx (openpyxl read-only mode), .csv and
+.parquet (needs pyarrow).
+
+The mapping between source column headers and our field names lives in
+CUSTOMER_COLUMNS / LOAN_COLUMNS below and nowhere else.
+"""
+import csv
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pq = None
+
+
+def to_int(value):
+    return int(Decimal(str(value)))
+
+
+def to_decimal(value):
+    # Go through str() so floats from Excel (8.2) don't turn into 8.1999...
+    return Decimal(str(value))
+
+
+def to_str(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])
+
+
+# header: column name in the source file
+# convert: callable turning the raw cell into our value
+# default: used when the column is missing or the cell is empty;
+#          REQUIRED means the column must be present
+REQUIRED = object()
+Column = namedtuple('Column', ['header', 'convert', 'default'], defaults=[REQUIRED])
+
+CUSTOMER_COLUMNS = {
+    'customer_id': Column('Customer ID', to_int),
+    'first_name': Column('First Name', to_str),
+    'last_name': Column('Last Name', to_str),
+    'age': Column('Age', to_int),
+    'phone_number': Column('Phone Number', to_str),
+    'monthly_salary': Column('Monthly Salary', to_decimal),
+    'approved_limit': Column('Approved Limit', to_decimal),
+    'current_debt': Column('Current Debt', to_decimal, Decimal(0)),
+}
+
+LOAN_COLUMNS = {
+    'customer_id': Column('Customer ID', to_int),
+    'loan_id': Column('Loan ID', to_int),
+    'loan_amount': Column('Loan Amount', to_decimal),
+    'tenure': Column('Tenure', to_int),
+    'interest_rate': Column('Interest Rate', to_decimal),
+    'monthly_payment': Column('Monthly payment', to_decimal),
+    'emis_paid_on_time': Column('EMIs paid on Time', to_int),
+    'date_of_approval': Column('Date of Approval', to_date),
+    'end_date': Column('End Date', to_date),
+}
+
+
+def _xlsx_rows(path):
+    """Yield raw row tuples from the first sheet, header row first"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        yield from csv.reader(handle)
+
+
+def _parquet_rows(path, batch_size):
+    if pq is None:
+        raise ImportError("Reading parquet files requires pyarrow (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(path)
+    yield tuple(parquet_file.schema_arrow.names)
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+        columns = [column.to_pylist() for column in record_batch.columns]
+        yield from zip(*columns)
+
+
+def iter_source_rows(path, batch_size=5000):
+    """Yield raw row tuples from any supported file, header row first"""
+    suffix = Path(path).suffix.lower()
+    if suffix in ('.xlsx', '.xlsm'):
+        return _xlsx_rows(path)
+    if suffix == '.csv':
+        return _csv_rows(path)
+    if suffix == '.parquet':
+        return _parquet_rows(path, batch_size)
+    raise ValueError(f"Unsupported file type '{suffix}' for {path} (expected .xlsx, .csv or .parquet)")
+
+
+def read_batches(path, columns, batch_size=5000):
+    """
+    Yield lists of at most `batch_size` rows from `path`
+    Each row is a dict {field_name: converted value} built from `columns`
+    (CUSTOMER_COLUMNS or LOAN_COLUMNS)
+    """
+    rows = iter_source_rows(path, batch_size)
+    header = next(rows, None)
+    if header is None:
+        return
+    positions = {name: index for index, name in enumerate(header) if name is not None}
+
+    plan = []
+    for field, column in columns.items():
+        index = positions.get(column.header)
+        if index is None and column.default is REQUIRED:
+            raise ValueError(f"{path} is missing the required column '{column.header}'")
+        plan.append((field, index, column.convert, column.default))
+
+    batch = []
+    for raw in rows:
+        # Skip completely empty lines (trailing rows in Excel sheets, blank CSV lines)
+        if not raw or all(cell in (None, '') for cell in raw):
+            continue
+        row = {}
+        for field, index, convert, default in plan:
+            value = raw[index] if index is not None and index < len(raw) else None
+            if value is None or value == '':
+                if default is REQUIRED:
+                    raise ValueError(f"{path}: empty '{columns[field].header}' in row {raw!r}")
+                row[field] = default
+            else:
+                row[field] = convert(value)
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
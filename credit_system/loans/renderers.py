@@ -0,0 +1,113 @@
+"""
+Faster renderers and parsers for the API
+
+ORJSONRenderer / ORJSONParser
+    Drop-in replacements for DRF's JSONRenderer / JSONParser built on
+    orjson. The output is byte-identical to JSONRenderer's compact, UTF-8
+    output: Decimal becomes a number and dates/datetimes/lazy strings are
+    formatted by DRF's own JSONEncoder, non-string dict keys are converted,
+    and U+2028/U+2029 are escaped. If the client asks for indentation
+    ('application/json; indent=4', or the browsable API) or orjson is not
+    installed, JSONRenderer does the work.
+    Floats Python writes with an exponent (1e+16, 1e-05) come out of
+    orjson differently (1e16, 0.00001); responses that may hold one are
+    rendered again by JSONRenderer. The one difference left: NaN and
+    Infinity become null, where JSONRenderer raises ValueError (or writes
+    NaN / Infinity with STRICT_JSON off).
+
+MessagePackRenderer
+    'application/msgpack' for internal service-to-service callers that
+    send `Accept: application/msgpack`. Values are converted the same way
+    as for JSON. Needs the msgpack package (requirements.txt).
+
+All of them are enabled through REST_FRAMEWORK in settings.py.
+"""
+import re
+
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+# Decimal -> float, datetime/date/time -> ISO strings (datetimes with
+# millisecond precision and 'Z' for UTC), lazy strings -> str, ...
+_encode_default = JSONEncoder().default
+
+# orjson output that may hold a float json.dumps writes differently:
+# an exponent (1e16, 1.5e-7), or below 1e-4 without one (0.00001).
+# Strings can match too; they only cost a slower render.
+_FLOAT_FORMAT_DIFFERS = re.compile(rb'[0-9]e|\.0000')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with orjson doing the encoding
+    """
+    # dates go to _encode_default so they are formatted like JSONEncoder does
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_encode_default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the json module handles
+            return super().render(data, accepted_media_type, renderer_context)
+        if _FLOAT_FORMAT_DIFFERS.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same strict-javascript-subset escaping as JSONRenderer
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser with orjson doing the decoding (UTF-8 request bodies)
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or not self.strict or encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders to MessagePack (application/msgpack)
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise RuntimeError('MessagePackRenderer needs the msgpack package')
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True, datetime=False)
@@ -0,0 +1,233 @@
+"""
+Amortization schedules computed with NumPy
+
+Every installment of every loan in a batch is one row of flat arrays
+(loan index, installment number 1..tenure), so a whole batch is a handful
+of array operations instead of a month-by-month loop per loan.
+
+Money is in integer paise:
+- the EMI is the loan's stored monthly_payment, the figure /view-loan/
+  and /create-loan/ report (amortize() falls back to the annuity-factor
+  table in loans.emi when no EMI is given)
+- the balance after installment k is the closed form
+      B_k = P + ((1 + r)^k - 1) * (P - EMI / r)      (B_k = P - k * EMI if r = 0)
+  rounded to the nearest paisa; principal_k = B_(k-1) - B_k and
+  interest_k = EMI - principal_k
+- the final installment is adjusted so the balance ends at exactly zero:
+  it repays the remaining balance plus that month's interest, absorbing
+  the difference between the stored EMI and the exact annuity (rounding,
+  or a rate rounded after the EMI was computed). A stored EMI large
+  enough to clear the loan early makes that installment the final one,
+  and the ones after it are zero.
+
+So the principal column always sums to the loan amount and every row
+satisfies payment = principal + interest.
+"""
+import numpy as np
+
+from .emi import emi_paise_array
+from .models import Loan
+from .vectorized import to_paise
+
+SCHEDULE_COLUMNS = ['installment', 'due_date', 'payment', 'principal', 'interest', 'balance']
+
+
+def format_paise(values):
+    """int paise array -> list of '1234.50' strings"""
+    values = np.asarray(values, dtype=np.int64)
+    rupees, paise = np.divmod(np.abs(values), 100)
+    signs = np.where(values < 0, '-', '')
+    return [f'{sign}{whole}.{part:02d}' for sign, whole, part in zip(signs.tolist(), rupees.tolist(), paise.tolist())]
+
+
+def due_dates(approval_dates, installment):
+    """
+    date_of_approval + relativedelta(months=installment), vectorized: the
+    approval day, clamped to the length of the due month
+    """
+    approval_dates = np.asarray(approval_dates, dtype='datetime64[D]')
+    approval_months = approval_dates.astype('datetime64[M]')
+    day = (approval_dates - approval_months.astype('datetime64[D]')).astype(np.int64)
+    due_months = (approval_months.astype(np.int64) + installment)
+    if not len(due_months):
+        return due_months.astype('datetime64[D]')
+
+    # First day and length of every month in range, looked up per row
+    first_month = due_months.min()
+    month_starts = np.arange(first_month, due_months.max() + 2).astype('datetime64[M]').astype('datetime64[D]')
+    month_lengths = np.diff(month_starts).astype(np.int64)
+    month = due_months - first_month
+    return month_starts[month] + np.minimum(day, month_lengths[month] - 1)
+
+
+def amortize(principal, annual_rate, tenure, emis_paid=None, emi=None):
+    """
+    Schedules of a batch of loans as flat arrays, one row per installment
+    principal: paise, annual_rate: percent, tenure: months (one value per loan)
+    emis_paid: installments already paid per loan; adds a boolean 'paid'
+    column marking the first emis_paid installments of each loan
+    emi: monthly installment per loan in paise (default: the exact annuity)
+
+    Returns a dict of arrays: loan_index, installment, payment, principal,
+    interest, balance (int64 paise), emi (per loan) and row_offsets (the
+    first row of each loan, plus the total number of rows)
+    """
+    principal = np.asarray(principal, dtype=np.int64)
+    tenure = np.maximum(np.asarray(tenure, dtype=np.int64), 0)
+    monthly_rate = np.rint(np.asarray(annual_rate, dtype=np.float64) * 100) / 120000  # on the 0.01% grid
+    if emi is None:
+        emi = emi_paise_array(principal, annual_rate, tenure)
+    else:
+        emi = np.asarray(emi, dtype=np.int64)
+
+    # Step 1: One row per installment
+    row_offsets = np.zeros(len(tenure) + 1, dtype=np.int64)
+    np.cumsum(tenure, out=row_offsets[1:])
+    loan_index = np.repeat(np.arange(len(tenure)), tenure)
+    installment = np.arange(row_offsets[-1], dtype=np.int64) - row_offsets[loan_index] + 1
+
+    # Step 2: Balance after each installment (closed form), and before it:
+    # the previous row's, or the loan amount for the first installment.
+    # Per-loan terms are computed once and gathered per row.
+    interest_bearing = monthly_rate != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_growth = np.log1p(monthly_rate)
+        surplus = np.where(interest_bearing, principal - emi / monthly_rate, 0.0)  # P - EMI / r
+    balance = np.expm1(installment * log_growth[loan_index])
+    balance *= surplus[loan_index]
+    balance += principal[loan_index]
+    if not interest_bearing.all():
+        flat = ~interest_bearing[loan_index]
+        balance[flat] = principal[loan_index[flat]] - installment[flat] * emi[loan_index[flat]]
+    closing = np.maximum(np.rint(balance), 0).astype(np.int64)
+    opening = np.empty_like(closing)
+    opening[1:] = closing[:-1]
+    first = row_offsets[:-1][tenure > 0]
+    opening[first] = principal[tenure > 0]
+
+    # Step 3: The final installment (the last one, or the one the EMI
+    # clears the balance with) pays off whatever is left; any after it are 0
+    last = row_offsets[1:][tenure > 0] - 1
+    closing[last] = 0
+    settled = np.zeros(len(closing), dtype=bool)
+    settled[1:] = closing[:-1] == 0
+    settled[first] = principal[tenure > 0] == 0
+    opening[settled] = 0
+    closing[settled] = 0
+    final = (closing == 0) & ~settled
+    principal_paid = opening - closing
+    interest = emi[loan_index] - principal_paid
+    interest[final] = np.rint(opening[final] * monthly_rate[loan_index[final]])
+    interest[settled] = 0
+
+    schedule = {
+        'loan_index': loan_index,
+        'installment': installment,
+        'payment': principal_paid + interest,
+        'principal': principal_paid,
+        'interest': interest,
+        'balance': closing,
+        'emi': emi,
+        'row_offsets': row_offsets,
+    }
+    if emis_paid is not None:
+        schedule['paid'] = installment <= np.asarray(emis_paid, dtype=np.int64)[loan_index]
+    return schedule
+
+
+def load_schedule_inputs(loans):
+    """
+    The columns amortize() needs for a Loan queryset, ordered by id
+    """
+    rows = list(loans.order_by('id').values_list(
+        'id', 'customer_id', 'loan_amount', 'interest_rate', 'tenure', 'emis_paid_on_time', 'date_of_approval',
+        'monthly_payment',
+    ))
+    return {
+        'loan_id': np.array([row[0] for row in rows], dtype=np.int64),
+        'customer_id': np.array([row[1] for row in rows], dtype=np.int64),
+        'principal': np.array([to_paise(row[2]) for row in rows], dtype=np.int64),
+        'annual_rate': np.array([float(row[3]) for row in rows], dtype=np.float64),
+        'tenure': np.array([row[4] for row in rows], dtype=np.int64),
+        'emis_paid': np.array([row[5] for row in rows], dtype=np.int64),
+        'date_of_approval': np.array([row[6] for row in rows], dtype='datetime64[D]'),
+        'monthly_payment': np.array([to_paise(row[7]) for row in rows], dtype=np.int64),
+    }
+
+
+def schedule_for_loans(loans, mark_paid=False):
+    """
+    (inputs, schedule) for a Loan queryset: load_schedule_inputs() plus
+    amortize() at the stored monthly_payment, with due dates
+    """
+    inputs = load_schedule_inputs(loans)
+    schedule = amortize(
+        inputs['principal'], inputs['annual_rate'], inputs['tenure'],
+        emis_paid=inputs['emis_paid'] if mark_paid else None, emi=inputs['monthly_payment'],
+    )
+    schedule['due_date'] = due_dates(inputs['date_of_approval'][schedule['loan_index']], schedule['installment'])
+    return inputs, schedule
+
+
+def schedule_columns(schedule, start=0, stop=None):
+    """
+    (names, columns) of rows start..stop of a schedule, money as '1234.50'
+    strings and dates as 'YYYY-MM-DD'
+    """
+    window = slice(start, stop)
+    names = list(SCHEDULE_COLUMNS)
+    columns = [
+        schedule['installment'][window].tolist(),
+        np.datetime_as_string(schedule['due_date'][window]).tolist(),
+        format_paise(schedule['payment'][window]),
+        format_paise(schedule['principal'][window]),
+        format_paise(schedule['interest'][window]),
+        format_paise(schedule['balance'][window]),
+    ]
+    if 'paid' in schedule:
+        names.append('paid')
+        columns.append(schedule['paid'][window].tolist())
+    return names, columns
+
+
+def schedule_rows(schedule, start=0, stop=None):
+    """Rows start..stop of a schedule as dicts"""
+    names, columns = schedule_columns(schedule, start, stop)
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def loan_schedule(loan_id, mark_paid=False):
+    """
+    Response body of /loan-schedule/<loan_id>/
+    Raises Loan.DoesNotExist
+    """
+    inputs, schedule = schedule_for_loans(Loan.objects.filter(id=loan_id), mark_paid)
+    if not len(inputs['loan_id']):
+        raise Loan.DoesNotExist
+    return {
+        'loan_id': int(inputs['loan_id'][0]),
+        'customer_id': int(inputs['customer_id'][0]),
+        'loan_amount': format_paise(inputs['principal'])[0],
+        'interest_rate': float(inputs['annual_rate'][0]),
+        'tenure': int(inputs['tenure'][0]),
+        'emis_paid_on_time': int(inputs['emis_paid'][0]),
+        'monthly_installment': format_paise(schedule['emi'])[0],
+        'total_interest': format_paise([schedule['interest'].sum()])[0],
+        'schedule': schedule_rows(schedule),
+    }
+
+
+def schedule_csv_chunks(inputs, schedule, chunk_rows=10000):
+    """
+    A schedule_for_loans() result as CSV text: the header, then
+    `chunk_rows` installments per chunk
+    """
+    loan_ids = inputs['loan_id'][schedule['loan_index']]
+    customer_ids = inputs['customer_id'][schedule['loan_index']]
+    header = ['loan_id', 'customer_id'] + SCHEDULE_COLUMNS + (['paid'] if 'paid' in schedule else [])
+    yield ','.join(header) + '\r\n'
+    for start in range(0, len(loan_ids), chunk_rows):
+        stop = start + chunk_rows
+        _, columns = schedule_columns(schedule, start, stop)
+        columns = [loan_ids[start:stop].tolist(), customer_ids[start:stop].tolist()] + columns
+        yield ''.join(','.join(map(str, values)) + '\r\n' for values in zip(*columns))
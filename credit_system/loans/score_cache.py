@@ -0,0 +1,250 @@
+"""
+Cache of credit scores
+
+Each entry holds a customer's score together with the profile aggregates
+it was computed from (the eligibility check needs the active EMI total as
+well), keyed on customer id, the customer's version and the effective
+date from get_current_date(). When the date moves, old entries are simply
+never read again and age out.
+
+Every customer has a version number in the cache, bumped whenever a loan
+or the customer itself is written (see signals.py and the loader). A
+reader takes the version before it reads the profile and stores the
+score under that version, so a write that lands in between leaves the
+score under a key nobody reads any more, instead of caching a stale score
+after the invalidation. A missing version (never set, or evicted) is
+replaced with a new one from time.time_ns(), which never repeats an
+earlier one. Size and eviction are configured on the cache named by
+settings.CREDIT_SCORE_CACHE (MAX_ENTRIES / TIMEOUT); versions never time
+out.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Customer, CustomerCreditProfile
+from .profiles import get_credit_profile, refresh_profiles
+from .scoring import score_from_aggregates
+from .utils import chunked, get_current_date
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def score_cache():
+    return caches[getattr(settings, 'CREDIT_SCORE_CACHE', 'default')]
+
+
+def version_key(customer_id):
+    return f"credit-score-version:{customer_id}"
+
+
+def cache_key(customer_id, version, as_of):
+    return f"credit-score:{customer_id}:{version}:{as_of.isoformat()}"
+
+
+def get_versions(cache, customer_ids):
+    """
+    {customer_id: current version}, starting a version for customers
+    that have none
+    """
+    keys = {customer_id: version_key(customer_id) for customer_id in customer_ids}
+    stored = cache.get_many(list(keys.values()))
+    versions = {}
+    missing = {}
+    for customer_id, key in keys.items():
+        if key in stored:
+            versions[customer_id] = stored[key]
+        else:
+            versions[customer_id] = missing[key] = time.time_ns()
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return versions
+
+
+async def aget_version(cache, customer_id):
+    """get_versions for one customer, for async views"""
+    key = version_key(customer_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        await cache.aset(key, version, timeout=None)
+    return version
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """Hit / miss counters of this process"""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
+
+
+def build_snapshot(profile, approved_limit):
+    """Profile aggregates plus the credit score computed from them"""
+    snapshot = profile.aggregates()
+    snapshot['credit_score'] = score_from_aggregates(snapshot, approved_limit)
+    return snapshot
+
+
+def get_credit_snapshot(customer, as_of=None):
+    """
+    Cached {'credit_score': ..., <profile aggregates>} for a customer
+    A miss reads (and if needed refreshes) the credit profile
+    """
+    as_of = as_of or get_current_date()
+    cache = score_cache()
+    key = cache_key(customer.pk, get_versions(cache, [customer.pk])[customer.pk], as_of)
+
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        _count('hits')
+        return snapshot
+
+    _count('misses')
+    profile = get_credit_profile(customer, as_of)
+    snapshot = build_snapshot(profile, customer.approved_limit)
+    cache.set(key, snapshot)
+    return snapshot
+
+
+async def aget_credit_snapshot(customer, as_of=None):
+    """
+    get_credit_snapshot for async views
+    `customer` must come with select_related('credit_profile'); only a
+    missing or stale profile falls back to the sync recompute
+    """
+    as_of = as_of or get_current_date()
+    cache = score_cache()
+    key = cache_key(customer.pk, await aget_version(cache, customer.pk), as_of)
+
+    snapshot = await cache.aget(key)
+    if snapshot is not None:
+        _count('hits')
+        return snapshot
+
+    _count('misses')
+    profile = getattr(customer, 'credit_profile', None)
+    if profile is None or profile.as_of != as_of:
+        profile = (await sync_to_async(refresh_profiles)([customer.pk], as_of))[customer.pk]
+    snapshot = build_snapshot(profile, customer.approved_limit)
+    await cache.aset(key, snapshot)
+    return snapshot
+
+
+def _build_snapshots(customers, as_of):
+    """
+    Snapshots for a batch of customers, straight from their profiles
+    Profiles joined in with select_related('credit_profile') are used as
+    they are; the rest are fetched in one query, and stale ones recomputed
+    Returns {customer_id: snapshot}
+    """
+    profiles = {}
+    unloaded = []
+    for customer in customers:
+        if Customer.credit_profile.is_cached(customer):
+            profile = getattr(customer, 'credit_profile', None)
+            if profile is not None:
+                profiles[customer.pk] = profile
+        else:
+            unloaded.append(customer.pk)
+    if unloaded:
+        profiles.update(CustomerCreditProfile.objects.in_bulk(unloaded))
+
+    stale = [
+        customer.pk for customer in customers
+        if customer.pk not in profiles or profiles[customer.pk].as_of != as_of
+    ]
+    if stale:
+        profiles.update(refresh_profiles(stale, as_of))
+    return {
+        customer.pk: build_snapshot(profiles[customer.pk], customer.approved_limit)
+        for customer in customers
+    }
+
+
+def get_credit_snapshots(customers, as_of=None):
+    """
+    get_credit_snapshot for many customers with a fixed number of cache
+    and database round trips
+    Returns {customer_id: snapshot}
+    """
+    as_of = as_of or get_current_date()
+    cache = score_cache()
+    customers = list(customers)
+    versions = get_versions(cache, [customer.pk for customer in customers])
+    keys = {customer.pk: cache_key(customer.pk, versions[customer.pk], as_of) for customer in customers}
+
+    cached = cache.get_many(list(keys.values()))
+    snapshots = {
+        customer_id: cached[key] for customer_id, key in keys.items() if key in cached
+    }
+    missing = [customer for customer in customers if customer.pk not in snapshots]
+
+    with _stats_lock:
+        _stats['hits'] += len(snapshots)
+        _stats['misses'] += len(missing)
+
+    if missing:
+        built = _build_snapshots(missing, as_of)
+        cache.set_many({keys[customer_id]: snapshot for customer_id, snapshot in built.items()})
+        snapshots.update(built)
+    return snapshots
+
+
+def invalidate_credit_scores(customer_ids):
+    """
+    Bump the versions of the given customers, so their cached entries
+    (for any date) are never read again
+    """
+    cache = score_cache()
+    keys = [version_key(customer_id) for customer_id in customer_ids]
+    # Customers without a version have nothing cached, and a reader that
+    # starts one meanwhile gets overwritten by a new version below
+    existing = cache.get_many(keys)
+    fresh = {key: time.time_ns() for key in keys if key not in existing}
+    for key in existing:
+        try:
+            cache.incr(key)
+        except ValueError:  # evicted since get_many
+            fresh[key] = time.time_ns()
+    if fresh:
+        cache.set_many(fresh, timeout=None)
+
+
+def warm_credit_scores(batch_size=2000, as_of=None):
+    """
+    Fill the cache for every customer, one batch of customers at a time
+    Returns the number of entries written
+    """
+    as_of = as_of or get_current_date()
+    cache = score_cache()
+    written = 0
+
+    customers = Customer.objects.order_by('id').only('id', 'approved_limit').iterator(chunk_size=batch_size)
+    for batch in chunked(customers, batch_size):
+        versions = get_versions(cache, [customer.pk for customer in batch])
+        snapshots = _build_snapshots(batch, as_of)
+        cache.set_many({
+            cache_key(customer_id, versions[customer_id], as_of): snapshot
+            for customer_id, snapshot in snapshots.items()
+        })
+        written += len(batch)
+    return written
@@ -0,0 +1,162 @@
+"""
+Credit score calculation
+
+The score only depends on a handful of per-customer loan aggregates
+(see empty_aggregates). add_loan folds one loan into those aggregates and
+score_from_aggregates turns them into the 0-100 score. The aggregates are
+materialized per customer in CustomerCreditProfile (see profiles.py), so
+calculate_credit_score reads one row instead of every loan.
+"""
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+from .utils import get_current_date
+
+
+def months_between(start_date, end_date):
+    """Calculate number of months between two dates"""
+    if end_date < start_date:
+        return 0
+    delta = relativedelta(end_date, start_date)
+    return delta.years * 12 + delta.months
+
+
+def payment_ratio(loan, current_date):
+    """
+    Payment ratio for one loan
+
+    If loan ended before today:
+        payment_ratio = emis_paid / tenure
+    Else (loan still active):
+        expected_emis = months_between(start_date, today)
+        payment_ratio = min(emis_paid / expected_emis, 1.0)
+    """
+    if loan.end_date < current_date:
+        return loan.emis_paid_on_time / loan.tenure
+    expected_emis = months_between(loan.date_of_approval, current_date)
+    if expected_emis > 0:
+        return min(loan.emis_paid_on_time / expected_emis, 1.0)
+    return 1.0  # If loan just started, consider it good payment history
+
+
+def empty_aggregates():
+    """Aggregates of a customer with no loans"""
+    return {
+        'loan_count': 0,
+        'active_loan_count': 0,
+        'active_debt': Decimal(0),         # sum of remaining amounts of active loans
+        'active_emi_total': Decimal(0),    # sum of monthly payments of active loans
+        'payment_ratio_sum': 0.0,
+        'current_year_loan_count': 0,      # loans running during the current year
+    }
+
+
+def add_loan(aggregates, loan, current_date):
+    """
+    Fold one loan into `aggregates` (in place) and return them
+    A loan is active when end_date >= current_date
+    """
+    aggregates['loan_count'] += 1
+
+    if loan.end_date >= current_date:
+        # remaining = loan_amount - (emis_paid * monthly_payment)
+        remaining = loan.loan_amount - (loan.emis_paid_on_time * loan.monthly_payment)
+        aggregates['active_loan_count'] += 1
+        aggregates['active_debt'] += remaining
+        aggregates['active_emi_total'] += loan.monthly_payment
+
+    aggregates['payment_ratio_sum'] += payment_ratio(loan, current_date)
+
+    # loan started <= current year AND loan ends >= current year
+    current_year = current_date.year
+    if loan.date_of_approval.year <= current_year and loan.end_date.year >= current_year:
+        aggregates['current_year_loan_count'] += 1
+
+    return aggregates
+
+
+def compute_aggregates(loans, current_date=None):
+    """Aggregates computed from scratch over an iterable of loans"""
+    current_date = current_date or get_current_date()
+    aggregates = empty_aggregates()
+    for loan in loans:
+        add_loan(aggregates, loan, current_date)
+    return aggregates
+
+
+def score_from_aggregates(aggregates, approved_limit):
+    """
+    Credit score (0-100) from a customer's loan aggregates
+    `aggregates` is a dict shaped like empty_aggregates()
+    """
+    num_loans = aggregates['loan_count']
+    if num_loans == 0:
+        return 0  # No credit history
+
+    # OVERRIDE: Check if current debt > approved limit
+    # current debt = sum of the remaining amounts of all active loans
+    current_debt = aggregates['active_debt']
+    if current_debt > approved_limit:
+        return 0  # OVERRIDE CONDITION
+
+    # ========== COMPONENT 1: PAYMENT HISTORY (50 points) ==========
+    payment_history_score = (aggregates['payment_ratio_sum'] / num_loans) * 50
+
+    # ========== COMPONENT 2: NUMBER OF LOANS (15 points) ==========
+    # 0 loans: 0 points
+    # 1-3 loans: 15 points
+    # 4-6 loans: 10 points
+    # 7+ loans: 5 points
+    if 1 <= num_loans <= 3:
+        num_loans_score = 15
+    elif 4 <= num_loans <= 6:
+        num_loans_score = 10
+    else:
+        num_loans_score = 5  # 7+ loans: 5 points
+
+    # ========== COMPONENT 3: LOAN VOLUME (20 points) ==========
+    if approved_limit > 0:
+        utilization_ratio = float(current_debt / approved_limit)
+    else:
+        utilization_ratio = 0
+
+    # < 30%: 20 points
+    # 30-50%: 15 points
+    # 50-80%: 10 points
+    # > 80%: 5 points
+    if utilization_ratio < 0.3:
+        volume_score = 20
+    elif 0.3 <= utilization_ratio < 0.5:
+        volume_score = 15
+    elif 0.5 <= utilization_ratio < 0.8:
+        volume_score = 10
+    else:
+        volume_score = 5  # > 80% utilization: 5 points
+
+    # ========== COMPONENT 4: CURRENT YEAR ACTIVITY (15 points) ==========
+    # 0 active: 15 points
+    # 1-2 active: 10 points
+    # 3+ active: 5 points
+    active_this_year = aggregates['current_year_loan_count']
+    if active_this_year == 0:
+        activity_score = 15
+    elif 1 <= active_this_year <= 2:
+        activity_score = 10
+    else:
+        activity_score = 5
+
+    # ========== TOTAL SCORE ==========
+    total_score = payment_history_score + num_loans_score + volume_score + activity_score
+
+    return round(total_score)
+
+
+def calculate_credit_score(customer, profile=None):
+    """
+    Calculate credit score (0-100) for a customer
+    Without `profile` the score comes from the score cache, which falls
+    back to the customer's CustomerCreditProfile row on a miss
+    """
+    if profile is None:
+        from .score_cache import get_credit_snapshot
+        return get_credit_snapshot(customer)['credit_score']
+    return score_from_aggregates(profile.aggregates(), customer.approved_limit)
@@ -89,7 +89,22 @@ class LoanEligibilityRequestSerializer(serializers.Serializer):
     customer_id = serializers.IntegerField()
     loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
     interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
-    tenure = serializers.IntegerField()
+    # months; the EMI is undefined for 0
+    tenure = serializers.IntegerField(min_value=1)
+class LoanOfferRequestSerializer(serializers.Serializer):
+    """
+    Serializer for /loan-offers request
+    Tenures min_tenure..max_tenure (months), at most 600
+    """
+    customer_id = serializers.IntegerField()
+    interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    min_tenure = serializers.IntegerField(min_value=1, max_value=600, default=6)
+    max_tenure = serializers.IntegerField(min_value=1, max_value=600, default=60)
+
+    def validate(self, data):
+        if data['min_tenure'] > data['max_tenure']:
+            raise serializers.ValidationError("min_tenure must not be greater than max_tenure")
+        return data
 class LoanCreateResponseSerializer(serializers.ModelSerializer):
     """
     Serializer for /create-loan response
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Customer, Loan
+from .profiles import record_new_loan, refresh_profiles
+from .score_cache import invalidate_credit_scores
+
+
+def invalidate_on_commit(customer_id):
+    # After commit, so a concurrent reader cannot re-cache the old score
+    # between our delete and the commit
+    transaction.on_commit(lambda: invalidate_credit_scores([customer_id]))
+
+
+@receiver(post_save, sender=Loan)
+def update_credit_profile_on_save(sender, instance, created, raw=False, **kwargs):
+    """Keep the customer's credit profile in step with every saved loan"""
+    if raw:
+        return  # fixture loading
+    # Runs inside the caller's transaction (create_loan wraps the INSERT)
+    if created:
+        record_new_loan(instance)
+    else:
+        refresh_profiles([instance.customer_id])
+    invalidate_on_commit(instance.customer_id)
+
+
+@receiver(post_delete, sender=Loan)
+def update_credit_profile_on_delete(sender, instance, **kwargs):
+    # Deferred to commit: when the whole customer is being deleted the
+    # cascade removes the profile too, and there is nothing to rebuild
+    customer_id = instance.customer_id
+    transaction.on_commit(
+        lambda: refresh_profiles(list(Customer.objects.filter(pk=customer_id).values_list('pk', flat=True)))
+    )
+    invalidate_on_commit(customer_id)
+
+
+@receiver(post_save, sender=Customer)
+def invalidate_credit_score_on_customer_save(sender, instance, created, raw=False, **kwargs):
+    """The score also depends on the customer's approved_limit"""
+    if not created and not raw:
+        invalidate_on_commit(instance.pk)
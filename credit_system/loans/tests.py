@@ -1,3 +1,1943 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from unittest import skipUnless
+from unittest.mock import patch
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from credit_system.db import pool as pool_module
+from credit_system.db.pool import ConnectionPool, PoolTimeout, get_pool, pool_stats
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _lazy
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from django.test import AsyncRequestFactory, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+
+from . import async_views
+from .benchmarks import compare_with_baseline, populate_portfolio
+from .emi import emi_paise_array, monthly_emi
+from .fast_serializers import get_customer_dict, serialize_loan, serialize_loans
+from . import metrics, profiling
+from .idempotency import Claim, DatabaseIdempotencyStore, MemoryIdempotencyStore
+from .ingest import BulkCreateWriter, copy_supported, get_writer
+from .middleware import MetricsMiddleware, ProfilingMiddleware
+from .models import Customer, CustomerCreditProfile, IdempotencyRecord, Loan, SyncCheckpoint
+from .profiles import check_profiles, compute_profiles, get_credit_profile
+from .readers import CUSTOMER_COLUMNS, LOAN_COLUMNS, read_batches
+from .renderers import ORJSONParser, ORJSONRenderer, msgpack
+from .score_cache import (
+    aget_credit_snapshot, cache_stats, get_credit_snapshot, get_credit_snapshots, reset_cache_stats, score_cache,
+)
+from .scoring import calculate_credit_score, compute_aggregates, score_from_aggregates
+from .serializers import LoanListSerializer, LoanSerializer
+from .vectorized import score_portfolio
+from .utils import chunked
+from .views import calculate_emi, lock_customer_for_lending
+
+try:
+    from credit_system.db.pooled_postgresql import base as pooled_postgresql
+except ImportError:  # psycopg2 not installed
+    pooled_postgresql = None
+
+logger = logging.getLogger(__name__)
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class ScoringQueryCountTests(TestCase):
+    """
+    The scoring endpoints read one customer row with its credit profile
+    joined in, instead of scanning the customer's loans several times
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Asha', last_name='Rao', age=34, phone_number='9000000001',
+            monthly_salary=Decimal('90000'), approved_limit=Decimal('3200000'),
+        )
+        for amount, emis_paid, approved, ends in [
+            ('300000', 24, date(2018, 1, 5), date(2020, 1, 5)),   # completed
+            ('500000', 30, date(2023, 6, 1), date(2028, 6, 1)),   # active
+            ('200000', 10, date(2025, 3, 15), date(2027, 3, 15)),  # active
+        ]:
+            Loan.objects.create(
+                customer=cls.customer, loan_amount=Decimal(amount), tenure=24,
+                interest_rate=Decimal('12.00'), monthly_payment=Decimal('9500.00'),
+                emis_paid_on_time=emis_paid, date_of_approval=approved, end_date=ends,
+            )
+
+    def setUp(self):
+        score_cache().clear()
+
+    def application(self, **overrides):
+        data = {
+            'customer_id': self.customer.id,
+            'loan_amount': 100000,
+            'interest_rate': 10,
+            'tenure': 12,
+        }
+        data.update(overrides)
+        return data
+
+    def test_check_eligibility_uses_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/check-eligibility/', self.application(), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        # Cache hit: still just the customer row
+        with self.assertNumQueries(1):
+            self.client.post('/api/check-eligibility/', self.application(), content_type='application/json')
+
+    def test_check_eligibility_batch_query_count_is_fixed(self):
+        items = [self.application(loan_amount=amount) for amount in (50000, 100000, 900000)] * 20
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/check-eligibility-batch/', items, content_type='application/json')
+        self.assertEqual(len(response.json()['results']), 60)
+
+    def test_check_eligibility_batch_reports_invalid_items_per_item(self):
+        items = [
+            self.application(),
+            self.application(tenure=0),
+            self.application(customer_id=999999),
+            self.application(tenure=-6),
+            self.application(loan_amount=900000),
+        ]
+        response = self.client.post('/api/check-eligibility-batch/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [200, 400, 404, 400, 200])
+        self.assertIn('tenure', results[1]['body'])
+        self.assertIn('tenure', results[3]['body'])
+        single = self.client.post('/api/check-eligibility/', items[4], content_type='application/json')
+        self.assertEqual(results[4]['body'], single.json())
+        self.assertEqual(
+            self.client.post('/api/check-eligibility/', items[1], content_type='application/json').status_code, 400
+        )
+
+    def test_create_loan_query_count(self):
+        # SAVEPOINT, customer (FOR UPDATE), profile, INSERT, profile UPDATE,
+        # current_debt UPDATE, RELEASE
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/create-loan/', self.application(), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_create_loan_maintains_current_debt_and_emi_total(self):
+        get_credit_profile(self.customer)
+        debt_before = Customer.objects.get(pk=self.customer.pk).current_debt
+        response = self.client.post('/api/create-loan/', self.application(), content_type='application/json')
+        loan = Loan.objects.get(pk=response.json()['loan_id'])
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, debt_before + Decimal('100000'))
+        self.assertEqual(
+            self.customer.credit_profile.active_emi_total,
+            Decimal('19000.00') + loan.monthly_payment,
+        )
+
+    def test_loans_inserted_outside_create_loan_leave_current_debt(self):
+        # Loaders and fixtures: current_debt is only maintained by create_loan
+        debt_before = Customer.objects.get(pk=self.customer.pk).current_debt
+        Loan.objects.create(
+            customer=self.customer, loan_amount=Decimal('250000'), tenure=12, interest_rate=Decimal('12'),
+            monthly_payment=Decimal('22212.00'), emis_paid_on_time=0,
+            date_of_approval=date(2026, 1, 1), end_date=date(2027, 1, 1),
+        )
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).current_debt, debt_before)
+
+    def test_debug_score_uses_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/debug-score/{self.customer.id}/')
+        self.assertEqual(response.json()['loan_statistics'], {
+            'total_loans': 3, 'active_loans': 2, 'completed_loans': 1
+        })
+
+    def test_debug_emis_uses_two_queries(self):
+        # customer, then the active loans
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/debug-emis/{self.customer.id}/')
+        self.assertEqual(response.json()['active_loans_count'], 2)
+        self.assertEqual(response.json()['current_total_emis'], 19000.0)
+
+
+class ScoringParityTests(TestCase):
+    """
+    Customer.objects.with_credit_score and vectorized.score_portfolio must
+    give the same scores as the Python rules in loans.scoring, including
+    month-end and leap-day dates
+    """
+    AS_OF_DATES = [
+        date(2026, 2, 9), date(2026, 2, 28), date(2024, 2, 29),
+        date(2023, 4, 30), date(2019, 1, 31), date(2030, 12, 31),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(20260209)
+        customers = Customer.objects.bulk_create([
+            Customer(
+                first_name=f'First{i}', last_name=f'Last{i}', age=rng.randint(21, 65),
+                phone_number=str(9000000000 + i),
+                monthly_salary=Decimal(rng.choice([0, rng.randrange(20000, 200000, 1000)])),
+                approved_limit=Decimal(rng.choice([0, 100000, 500000, 1500000, 4000000])),
+            )
+            for i in range(150)
+        ])
+        # Edge cases the random draw may miss: no loans at all, and zero
+        # salary and limit with only ended loans approved on a 31st
+        cls.no_loans, cls.zero_limit = Customer.objects.bulk_create([
+            Customer(first_name='No', last_name='Loans', age=30, phone_number='9100000001',
+                     monthly_salary=Decimal(50000), approved_limit=Decimal(1800000)),
+            Customer(first_name='Zero', last_name='Limit', age=30, phone_number='9100000002',
+                     monthly_salary=Decimal(0), approved_limit=Decimal(0)),
+        ])
+        loans = [
+            Loan(customer=cls.zero_limit, loan_amount=Decimal(100000), tenure=tenure, interest_rate=Decimal(12),
+                 monthly_payment=Decimal('8884.88'), emis_paid_on_time=paid,
+                 date_of_approval=date(2015, 1, 31), end_date=date(2015, 1, 31) + relativedelta(months=tenure))
+            for tenure, paid in ((12, 12), (13, 7))
+        ]
+        for customer in customers:
+            for _ in range(rng.choice([0, 1, 2, 3, 4, 6, 7, 9])):
+                tenure = rng.randint(3, 180)
+                approved = date(2010, 1, 1) + relativedelta(days=rng.randint(0, 7300))
+                if rng.random() < 0.2:
+                    # month-end approvals exercise the clamped-day rule
+                    approved = approved + relativedelta(day=31)
+                loans.append(Loan(
+                    customer=customer,
+                    loan_amount=Decimal(rng.randrange(10000, 2000000, 10000)),
+                    tenure=tenure,
+                    interest_rate=Decimal(rng.randrange(500, 2000)) / 100,
+                    monthly_payment=Decimal(rng.randrange(100000, 9000000)) / 100,
+                    emis_paid_on_time=rng.randint(0, tenure),
+                    date_of_approval=approved,
+                    end_date=approved + relativedelta(months=tenure),
+                ))
+        Loan.objects.bulk_create(loans)
+
+    def expected_scores(self, as_of):
+        return {
+            customer.id: score_from_aggregates(
+                compute_aggregates(sorted(customer.loans.all(), key=lambda loan: loan.id), as_of),
+                customer.approved_limit,
+            )
+            for customer in Customer.objects.prefetch_related('loans')
+        }
+
+    def test_database_scores_match_python(self):
+        for as_of in self.AS_OF_DATES:
+            with self.subTest(as_of=as_of):
+                expected = self.expected_scores(as_of)
+                actual = dict(Customer.objects.with_credit_score(as_of).values_list('id', 'credit_score'))
+                self.assertEqual(actual, expected)
+
+    def test_vectorized_scores_match_calculate_credit_score(self):
+        for as_of in self.AS_OF_DATES:
+            with self.subTest(as_of=as_of), override_settings(SYSTEM_REFERENCE_DATE=as_of.isoformat()):
+                score_cache().clear()
+                expected = {
+                    customer.id: calculate_credit_score(customer)
+                    for customer in Customer.objects.select_related('credit_profile')
+                }
+                result = score_portfolio(as_of)
+                actual = dict(zip(result['customer_id'].tolist(), result['score'].tolist()))
+                self.assertEqual(actual, expected)
+                self.assertEqual(actual, self.expected_scores(as_of))
+                self.assertEqual(actual[self.no_loans.id], 0)
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class CreditProfileMaintenanceTests(TestCase):
+    """
+    loans.profiles keeps CustomerCreditProfile in step with the loans;
+    check_credit_profiles finds drift and rebuild_credit_profiles repairs it
+    """
+
+    def setUp(self):
+        self.customer, self.other = Customer.objects.bulk_create([
+            Customer(first_name='Nisha', last_name='Pillai', age=36, phone_number='9000000011',
+                     monthly_salary=Decimal('80000'), approved_limit=Decimal('2900000')),
+            Customer(first_name='Arjun', last_name='Menon', age=41, phone_number='9000000012',
+                     monthly_salary=Decimal('60000'), approved_limit=Decimal('2200000')),
+        ])
+
+    def add_loan(self, customer, approved, tenure=24, emis_paid=5):
+        return Loan.objects.create(
+            customer=customer, loan_amount=Decimal('240000'), tenure=tenure, interest_rate=Decimal('11.5'),
+            monthly_payment=Decimal('11241.63'), emis_paid_on_time=emis_paid,
+            date_of_approval=approved, end_date=approved + relativedelta(months=tenure),
+        )
+
+    def assert_profile_current(self, customer, loan_count):
+        profile = CustomerCreditProfile.objects.get(customer=customer)
+        self.assertEqual(profile.as_of, date(2026, 2, 9))
+        expected = compute_profiles([customer.id], profile.as_of)[customer.id]
+        self.assertEqual(profile.aggregates(), expected)
+        self.assertEqual(profile.loan_count, loan_count)
+
+    def test_profile_follows_loan_writes(self):
+        ended = self.add_loan(self.customer, date(2019, 3, 31), tenure=12, emis_paid=12)
+        self.assert_profile_current(self.customer, 1)
+        active = self.add_loan(self.customer, date(2025, 8, 31))
+        self.assert_profile_current(self.customer, 2)
+        self.assertEqual(CustomerCreditProfile.objects.get(customer=self.customer).active_loan_count, 1)
+
+        active.emis_paid_on_time = 6
+        active.end_date = date(2026, 1, 31)
+        active.save()
+        self.assert_profile_current(self.customer, 2)
+        self.assertEqual(CustomerCreditProfile.objects.get(customer=self.customer).active_loan_count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ended.delete()
+        self.assert_profile_current(self.customer, 1)
+        # the other customer never had a loan, so never got a profile
+        self.assertEqual(list(check_profiles()), [(self.other.id, 'profile', None, 'missing')])
+
+    def test_stale_profile_is_recomputed_on_read(self):
+        self.add_loan(self.customer, date(2025, 8, 31))
+        profile = get_credit_profile(Customer.objects.get(pk=self.customer.pk), as_of=date(2028, 1, 1))
+        self.assertEqual((profile.as_of, profile.active_loan_count), (date(2028, 1, 1), 0))
+
+    def test_check_reports_drift_and_rebuild_repairs_it(self):
+        self.add_loan(self.customer, date(2025, 8, 31))
+        self.add_loan(self.customer, date(2024, 1, 15))
+        self.add_loan(self.other, date(2025, 2, 28))
+        call_command('check_credit_profiles', stdout=io.StringIO())
+
+        CustomerCreditProfile.objects.filter(customer=self.customer).update(loan_count=7)
+        CustomerCreditProfile.objects.filter(customer=self.other).delete()
+        output = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '2 customers have inconsistent credit profiles'):
+            call_command('check_credit_profiles', batch_size=1, stdout=output)
+        self.assertIn(f'Customer {self.customer.id}: loan_count is 7, expected 2', output.getvalue())
+        self.assertIn(f'Customer {self.other.id}: profile is None, expected missing', output.getvalue())
+
+        output = io.StringIO()
+        call_command('rebuild_credit_profiles', batch_size=1, stdout=output)
+        self.assertIn('Rebuilt 2 credit profiles', output.getvalue())
+        self.assert_profile_current(self.customer, 2)
+        self.assert_profile_current(self.other, 1)
+        output = io.StringIO()
+        call_command('check_credit_profiles', stdout=output)
+        self.assertIn('All credit profiles are consistent', output.getvalue())
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class ScoreCacheTests(TestCase):
+    """Versioned score cache: invalidation on writes, warm-up, hit/miss counters"""
+
+    def setUp(self):
+        score_cache().clear()
+        reset_cache_stats()
+        self.customer, self.other = Customer.objects.bulk_create([
+            Customer(first_name='Kavya', last_name='Reddy', age=33, phone_number='9000000021',
+                     monthly_salary=Decimal('70000'), approved_limit=Decimal('2500000')),
+            Customer(first_name='Rohan', last_name='Shah', age=48, phone_number='9000000022',
+                     monthly_salary=Decimal('150000'), approved_limit=Decimal('5400000')),
+        ])
+        self.add_loan(Decimal('300000'))
+
+    def add_loan(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Loan.objects.create(
+                customer=self.customer, loan_amount=amount, tenure=24, interest_rate=Decimal('12'),
+                monthly_payment=Decimal('14122.04'), emis_paid_on_time=4,
+                date_of_approval=date(2025, 6, 1), end_date=date(2027, 6, 1),
+            )
+
+    def snapshot(self):
+        return get_credit_snapshot(Customer.objects.get(pk=self.customer.pk))
+
+    def test_counts_hits_and_misses(self):
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 0, 'hit_ratio': None})
+        first = self.snapshot()
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+        get_credit_snapshots([self.customer, self.other])
+        self.assertEqual(cache_stats(), {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+
+    def test_loan_and_customer_writes_invalidate(self):
+        self.assertEqual(self.snapshot()['loan_count'], 1)
+        get_credit_snapshots([self.customer])
+
+        self.add_loan(Decimal('2400000'))
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot['loan_count'], 2)
+        self.assertEqual(snapshot['credit_score'], 0)  # debt above the approved limit
+        self.assertEqual(get_credit_snapshots([self.customer])[self.customer.pk], snapshot)
+
+        customer = Customer.objects.get(pk=self.customer.pk)
+        customer.approved_limit = Decimal('9000000')
+        with self.captureOnCommitCallbacks(execute=True):
+            customer.save()
+        self.assertGreater(self.snapshot()['credit_score'], 0)
+        # the async path reads the same versioned entry
+        self.assertGreater(async_to_sync(aget_credit_snapshot)(customer)['credit_score'], 0)
+        self.assertEqual(cache_stats(), {'hits': 3, 'misses': 3, 'hit_ratio': 0.5})
+
+    def test_invalidation_during_a_miss_does_not_cache_the_stale_score(self):
+        from . import score_cache as score_cache_module
+        read_profile = score_cache_module.get_credit_profile
+
+        def profile_then_concurrent_write(customer, as_of):
+            profile = read_profile(customer, as_of)
+            # another request commits a loan (and invalidates) before this
+            # one stores the score it computed from the old profile
+            self.add_loan(Decimal('50000'))
+            return profile
+
+        with patch('loans.score_cache.get_credit_profile', side_effect=profile_then_concurrent_write):
+            self.assertEqual(self.snapshot()['loan_count'], 1)
+        self.assertEqual(self.snapshot()['loan_count'], 2)
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 2, 'hit_ratio': 0.0})
+
+    def test_warm_up_fills_the_cache(self):
+        output = io.StringIO()
+        call_command('warm_score_cache', batch_size=1, stdout=output)
+        self.assertIn('Cached 2 credit scores', output.getvalue())
+
+        customers = list(Customer.objects.all())
+        with self.assertNumQueries(0):
+            snapshots = get_credit_snapshots(customers)
+        self.assertEqual(cache_stats(), {'hits': 2, 'misses': 0, 'hit_ratio': 1.0})
+        self.assertEqual(snapshots[self.customer.pk]['loan_count'], 1)
+        self.assertEqual(snapshots[self.other.pk]['loan_count'], 0)
+
+        self.add_loan(Decimal('100000'))
+        self.assertEqual(self.snapshot()['loan_count'], 2)
+        self.assertEqual(cache_stats()['misses'], 1)
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class CustomerLockTests(TestCase):
+    """
+    create_loan reads the customer with SELECT ... FOR UPDATE wherever the
+    backend supports it (on every backend, unlike the contention test below)
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Ravi', last_name='Iyer', age=40, phone_number='9000000002',
+            monthly_salary=Decimal('100000'), approved_limit=Decimal('100000000'),
+        )
+
+    def locking_queries(self, queries):
+        table = connection.ops.quote_name(Customer._meta.db_table)
+        return [
+            query['sql'] for query in queries
+            if f'FROM {table}' in query['sql'] and connection.ops.for_update_sql() in query['sql']
+        ]
+
+    def test_lock_uses_select_for_update(self):
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(lock_customer_for_lending(self.customer.id), self.customer)
+        expected = 1 if connection.features.has_select_for_update else 0
+        self.assertEqual(len(self.locking_queries(queries)), expected)
+
+    def test_create_loan_takes_the_lock(self):
+        with patch('loans.views.lock_customer_for_lending', wraps=lock_customer_for_lending) as lock, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/create-loan/', {
+                'customer_id': self.customer.id, 'loan_amount': 100000, 'interest_rate': 14, 'tenure': 24,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        lock.assert_called_once_with(self.customer.id)
+        expected = 1 if connection.features.has_select_for_update else 0
+        self.assertEqual(len(self.locking_queries(queries)), expected)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class CreateLoanConcurrencyTests(TransactionTestCase):
+    """
+    Many threads applying for the same customer at once: the row lock in
+    create_loan must keep the approved EMIs within 50% of the salary
+    (needs a database with SELECT ... FOR UPDATE, i.e. PostgreSQL)
+    """
+    THREADS = 16
+    REQUESTS = 200
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Ravi', last_name='Iyer', age=40, phone_number='9000000002',
+            monthly_salary=Decimal('100000'), approved_limit=Decimal('100000000'),
+        )
+        # One completed, fully repaid loan: credit score 100
+        Loan.objects.create(
+            customer=self.customer, loan_amount=Decimal('100000'), tenure=12,
+            interest_rate=Decimal('12.00'), monthly_payment=Decimal('8885.00'),
+            emis_paid_on_time=12, date_of_approval=date(2020, 1, 1), end_date=date(2021, 1, 1),
+        )
+
+    def apply(self, _):
+        try:
+            started = time.perf_counter()
+            response = Client().post('/api/create-loan/', {
+                'customer_id': self.customer.id,
+                'loan_amount': 100000,
+                'interest_rate': 14,
+                'tenure': 24,
+            }, content_type='application/json')
+            return response.status_code, response.json()['loan_approved'], time.perf_counter() - started
+        finally:
+            connections.close_all()
+
+    def test_no_over_allocation_under_contention(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            results = list(pool.map(self.apply, range(self.REQUESTS)))
+        elapsed = time.perf_counter() - started
+
+        self.assertTrue(all(status_code in (200, 201) for status_code, _, _ in results))
+        approved = sum(1 for _, loan_approved, _ in results if loan_approved)
+        new_loans = Loan.objects.filter(customer=self.customer, emis_paid_on_time=0)
+        self.assertEqual(new_loans.count(), approved)
+
+        # Never more EMIs than half the salary, and no approvable room left
+        active_emis = sum(loan.monthly_payment for loan in new_loans)
+        self.assertLessEqual(active_emis, self.customer.monthly_salary / 2)
+        self.assertGreater(active_emis + new_loans[0].monthly_payment, self.customer.monthly_salary / 2)
+
+        # current_debt and the profile kept in step, F() increments not lost
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, Decimal('100000') * approved)
+        self.assertEqual(self.customer.credit_profile.active_emi_total, active_emis)
+
+        latencies = sorted(latency for _, _, latency in results)
+        logger.debug(
+            "create_loan, %d threads on one customer (%s): %d requests in %.2fs, p50 %.1f ms, %d approved",
+            self.THREADS, connection.vendor, self.REQUESTS, elapsed,
+            latencies[len(latencies) // 2] * 1000, approved,
+        )
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class IdempotencyKeyTests(TestCase):
+    """Retried POSTs with the same Idempotency-Key replay the first response"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Meera', last_name='Shah', age=29, phone_number='9000000003',
+            monthly_salary=Decimal('80000'), approved_limit=Decimal('2900000'),
+        )
+        Loan.objects.create(
+            customer=cls.customer, loan_amount=Decimal('100000'), tenure=12,
+            interest_rate=Decimal('12.00'), monthly_payment=Decimal('8885.00'),
+            emis_paid_on_time=12, date_of_approval=date(2020, 1, 1), end_date=date(2021, 1, 1),
+        )
+
+    def create_loan(self, key, loan_amount=100000):
+        return self.client.post('/api/create-loan/', {
+            'customer_id': self.customer.id, 'loan_amount': loan_amount, 'interest_rate': 14, 'tenure': 24,
+        }, content_type='application/json', headers={'Idempotency-Key': key})
+
+    def test_retry_replays_response_without_creating_a_second_loan(self):
+        first = self.create_loan('retry-1')
+        self.assertEqual(first.status_code, 201)
+
+        # Replay: the stored record only, no scoring or customer lookup
+        with self.assertNumQueries(1):
+            second = self.create_loan('retry-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 2)
+
+        # Another key is another request
+        self.assertEqual(self.create_loan('retry-2').status_code, 201)
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 3)
+
+    def test_register_is_idempotent(self):
+        data = {'first_name': 'Dev', 'last_name': 'Nair', 'age': 31, 'monthly_income': 50000, 'phone_number': 9000000004}
+        responses = [
+            self.client.post('/api/register/', data, content_type='application/json', headers={'Idempotency-Key': 'reg-1'})
+            for _ in range(3)
+        ]
+        self.assertEqual({response.content for response in responses}, {responses[0].content})
+        self.assertEqual(Customer.objects.filter(first_name='Dev').count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.create_loan('reuse')
+        response = self.create_loan('reuse', loan_amount=200000)
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(IDEMPOTENCY_PENDING_TIMEOUT=0)
+    def test_request_taken_over_does_not_overwrite_the_new_owner(self):
+        for store in (DatabaseIdempotencyStore(), MemoryIdempotencyStore()):
+            # The first request's claim expires before it finishes: a retry takes it over
+            stale = store.claim('create-loan', 'slow', 'hash')
+            owner = store.claim('create-loan', 'slow', 'hash')
+            self.assertNotEqual(owner, stale)
+            self.assertTrue(store.complete(owner, 201, '{"loan_id":2}'))
+
+            # The first request finishing (or failing) leaves the retry's response alone
+            self.assertFalse(store.complete(stale, 201, '{"loan_id":1}'))
+            store.release(stale)
+            self.assertEqual(store.claim('create-loan', 'slow', 'hash').body, '{"loan_id":2}')
+
+    def test_sweeper_deletes_expired_records_in_batches(self):
+        now = timezone.now()
+        IdempotencyRecord.objects.bulk_create([
+            IdempotencyRecord(scope='register', key=f'k{i}', request_hash='x',
+                              expires_at=now + timedelta(hours=-1 if i < 25 else 1))
+            for i in range(30)
+        ])
+        call_command('sweep_idempotency_keys', batch_size=10, max_batches=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(IdempotencyRecord.objects.count(), 10)
+        call_command('sweep_idempotency_keys', batch_size=10, stdout=open(os.devnull, 'w'))
+        self.assertEqual(IdempotencyRecord.objects.count(), 5)
+
+
+class MemoryIdempotencyStoreTests(SimpleTestCase):
+
+    def test_duplicate_waits_for_the_first_request(self):
+        store = MemoryIdempotencyStore()
+        claim = store.claim('create-loan', 'k', 'hash')
+        self.assertIsInstance(claim, Claim)
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(store.claim('create-loan', 'k', 'hash')))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertEqual(results, [])  # still waiting
+        store.complete(claim, 201, '{"loan_id":1}')
+        waiter.join(timeout=5)
+        self.assertEqual(results[0].status_code, 201)
+        self.assertEqual(results[0].body, '{"loan_id":1}')
+
+    @override_settings(IDEMPOTENCY_TTL=0)
+    def test_expired_entries_are_swept(self):
+        store = MemoryIdempotencyStore()
+        for i in range(5):
+            store.complete(store.claim('register', f'k{i}', 'hash'), 201, '{}')
+        self.assertEqual(store.sweep(batch_size=2), 5)
+        self.assertEqual(len(store), 0)
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class AsyncViewTests(TestCase):
+    """The async views return exactly what the DRF views return"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Kiran', last_name='Das', age=45, phone_number='9000000005',
+            monthly_salary=Decimal('120000'), approved_limit=Decimal('4300000'),
+        )
+        cls.loan = Loan.objects.create(
+            customer=cls.customer, loan_amount=Decimal('450000'), tenure=36,
+            interest_rate=Decimal('11.50'), monthly_payment=Decimal('14839.25'),
+            emis_paid_on_time=20, date_of_approval=date(2024, 5, 10), end_date=date(2027, 5, 10),
+        )
+
+    def setUp(self):
+        score_cache().clear()
+        self.factory = AsyncRequestFactory()
+
+    async def test_read_endpoints_match(self):
+        for view, path, arg in [
+            (async_views.view_loan, f'/api/view-loan/{self.loan.id}/', self.loan.id),
+            (async_views.view_loans, f'/api/view-loans/{self.customer.id}/', self.customer.id),
+            (async_views.view_loan, '/api/view-loan/0/', 0),
+        ]:
+            expected = await self.async_client.get(path)
+            response = await view(self.factory.get(path), arg)
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+
+    async def test_check_eligibility_matches(self):
+        for body in [
+            {'customer_id': self.customer.id, 'loan_amount': 300000, 'interest_rate': 9, 'tenure': 24},
+            {'customer_id': self.customer.id, 'loan_amount': 9000000, 'interest_rate': 9, 'tenure': 12},
+            {'customer_id': 0, 'loan_amount': 300000, 'interest_rate': 9, 'tenure': 24},
+            {'customer_id': self.customer.id},
+        ]:
+            # async first, so it takes the cache-miss path
+            request = self.factory.post('/api/check-eligibility/', body, content_type='application/json')
+            response = await async_views.check_eligibility(request)
+            expected = await self.async_client.post('/api/check-eligibility/', body, content_type='application/json')
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class LoanIndexPlanTests(TestCase):
+    """
+    The active-loan filters of the hot paths (customer_id = ? AND
+    end_date >= ?) go through loan_customer_active_idx
+    """
+    CUSTOMERS = 2000
+    INDEX = 'loan_customer_active_idx'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(14)
+        customers = Customer.objects.bulk_create([
+            Customer(
+                first_name=f'First{i}', last_name=f'Last{i}', age=30, phone_number=str(9100000000 + i),
+                monthly_salary=Decimal(60000), approved_limit=Decimal(2200000),
+            )
+            for i in range(cls.CUSTOMERS)
+        ])
+        loans = []
+        for customer in customers:
+            for _ in range(rng.randint(1, 6)):
+                approved = date(2012, 1, 1) + timedelta(days=rng.randint(0, 5000))
+                tenure = rng.randint(6, 120)
+                loans.append(Loan(
+                    customer=customer, loan_amount=Decimal(rng.randrange(50000, 900000, 1000)), tenure=tenure,
+                    interest_rate=Decimal('12.50'), monthly_payment=Decimal(rng.randrange(2000, 40000)),
+                    emis_paid_on_time=rng.randint(0, tenure), date_of_approval=approved,
+                    end_date=approved + relativedelta(months=tenure),
+                ))
+        Loan.objects.bulk_create(loans, batch_size=2000)
+        cls.customer = customers[len(customers) // 2]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # The test tables are tiny and never vacuumed; ask the planner
+            # for its index plan rather than the cheapest plan for this size
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def plan(self, run_query):
+        """Query plan of the single statement run_query() executes"""
+        with CaptureQueriesContext(connection) as captured:
+            run_query()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + captured[-1]['sql'])
+            return '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+
+    def test_active_loans_use_the_index(self):
+        # debug-emis needs whole rows, but finds them through the index,
+        # on both of its columns: customer_id = ? AND end_date >= ?
+        plan = self.plan(lambda: list(self.customer.loans.active().order_by('id')))
+        if connection.vendor == 'sqlite':
+            self.assertIn(f'USING INDEX {self.INDEX} (customer_id=? AND end_date>?)', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertIn(f'Index Scan using {self.INDEX}', plan)
+            self.assertRegex(plan, r'Index Cond: \(\(customer_id = \d+\) AND \(end_date >= ')
+        else:
+            self.assertIn(self.INDEX, plan)
+
+    def test_scoring_loans_use_the_index(self):
+        # profile recompute: every loan of a batch of customers
+        from .profiles import compute_profiles
+        plan = self.plan(lambda: compute_profiles([self.customer.id], date(2026, 2, 9)))
+        self.assertIn(self.INDEX, plan)
+
+
+class ViewLoansPaginationTests(TestCase):
+    """Cursor pages and the streamed list add up to the plain list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Tara', last_name='Bose', age=50, phone_number='9000000006',
+            monthly_salary=Decimal('900000'), approved_limit=Decimal('32400000'),
+        )
+        Loan.objects.bulk_create([
+            Loan(
+                customer=cls.customer, loan_amount=Decimal(100000 + i), tenure=24,
+                interest_rate=Decimal('10.00'), monthly_payment=Decimal('4614.49'),
+                emis_paid_on_time=i % 24, date_of_approval=date(2024, 1, 1), end_date=date(2026, 1, 1),
+            )
+            for i in range(57)
+        ])
+
+    def url(self, query=''):
+        return f'/api/view-loans/{self.customer.id}/{query}'
+
+    def test_pages_follow_the_cursor(self):
+        everything = self.client.get(self.url()).json()
+        collected = []
+        cursor = ''
+        while True:
+            page = self.client.get(self.url(f'?page_size=20&cursor={cursor}')).json()
+            collected.extend(page['results'])
+            if page['next_cursor'] is None:
+                break
+            cursor = page['next_cursor']
+        self.assertEqual(collected, sorted(everything, key=lambda loan: loan['id']))
+        self.assertEqual(len(collected), 57)
+
+    @override_settings(VIEW_LOANS_STREAM_CHUNK_SIZE=10)
+    def test_stream_matches_plain_list(self):
+        plain = self.client.get(self.url())
+        streamed = self.client.get(self.url('?stream=1'))
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content), plain.content)
+
+    def test_invalid_page_size(self):
+        self.assertEqual(self.client.get(self.url('?page_size=0')).status_code, 400)
+        self.assertEqual(self.client.get(self.url('?cursor=abc')).status_code, 400)
+
+    async def test_async_view_matches(self):
+        factory = AsyncRequestFactory()
+        for query in ['', '?page_size=20', '?page_size=20&cursor=0', '?page_size=5000']:
+            expected = await self.async_client.get(self.url(query))
+            response = await async_views.view_loans(factory.get(self.url(query)), self.customer.id)
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content))
+
+        plain = await self.async_client.get(self.url())
+        streamed = await async_views.view_loans(factory.get(self.url('?stream=1')), self.customer.id)
+        self.assertEqual(b''.join([part async for part in streamed.streaming_content]), plain.content)
+
+
+class LeanSerializationTests(TestCase):
+    """loans.fast_serializers renders the same bytes as the ModelSerializers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Zoë', last_name="D'Souza", age=38, phone_number='9000000007',
+            monthly_salary=Decimal('75000'), approved_limit=Decimal('2700000'),
+        )
+        for amount, rate, payment in [
+            ('3954', '8', '100'), ('125000.5', '12.25', '4100.1'), ('99999999.99', '0.01', '0'),
+        ]:
+            Loan.objects.create(
+                customer=cls.customer, loan_amount=Decimal(amount), tenure=36,
+                interest_rate=Decimal(rate), monthly_payment=Decimal(payment),
+                emis_paid_on_time=7, date_of_approval=date(2025, 1, 1), end_date=date(2028, 1, 1),
+            )
+
+    def test_loan_list_is_byte_identical(self):
+        render = JSONRenderer().render
+        loans = Loan.objects.filter(customer=self.customer)
+        self.assertEqual(
+            render(serialize_loans(loans, get_customer_dict(self.customer.id))),
+            render(LoanListSerializer(Customer.objects.get(pk=self.customer.pk).loans.all(), many=True).data),
+        )
+
+    def test_single_loan_is_byte_identical(self):
+        render = JSONRenderer().render
+        for loan in Loan.objects.all():
+            self.assertEqual(render(serialize_loan(loan.id)), render(LoanSerializer(loan).data))
+
+    def test_view_loan_uses_one_query(self):
+        loan = Loan.objects.first()
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/view-loan/{loan.id}/')
+
+
+class FastRendererTests(TestCase):
+    """ORJSONRenderer / ORJSONParser behave like DRF's JSONRenderer / JSONParser"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Zoë', last_name='Iyer', age=33, phone_number='9000000008',
+            monthly_salary=Decimal('64000.50'), approved_limit=Decimal('2300000'),
+        )
+        cls.loan = Loan.objects.create(
+            customer=cls.customer, loan_amount=Decimal('210000'), tenure=24,
+            interest_rate=Decimal('10.25'), monthly_payment=Decimal('9731.10'),
+            emis_paid_on_time=3, date_of_approval=date(2025, 11, 3), end_date=date(2027, 11, 3),
+        )
+
+    def test_output_is_byte_identical(self):
+        data = {
+            'decimal': Decimal('9731.10'), 'zero': Decimal(0), 'date': date(2025, 11, 3),
+            'datetime': timezone.make_aware(timezone.datetime(2026, 2, 9, 10, 30, 5, 123456)),
+            'lazy': _lazy('Loan approved'), 'text': 'Zoë   "quoted"', 7: [1, 2.5, None, True],
+            'nested': {'rate': 12.0, 'big': 10 ** 20},
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'),
+        )
+
+    def test_floats_json_writes_with_an_exponent(self):
+        for value in [1e16, -1.2345678901234568e+16, 1e22, 1.7976931348623157e308,
+                      1e-05, 2.5e-07, 5e-324, 0.0001, 123456789.123, 9999999999999998.0]:
+            data = {'value': value, 'values': [value, 'text']}
+            with self.subTest(value=value):
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_nan_and_infinity_render_as_null(self):
+        for value in [float('nan'), float('inf'), float('-inf')]:
+            with self.subTest(value=value):
+                # the documented difference: JSONRenderer refuses them
+                self.assertEqual(ORJSONRenderer().render({'value': value}), b'{"value":null}')
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render({'value': value})
+
+    def test_endpoints_render_like_json_renderer(self):
+        for path in [
+            f'/api/view-loans/{self.customer.id}/', f'/api/view-loan/{self.loan.id}/',
+            f'/api/debug-emis/{self.customer.id}/', f'/api/debug-score/{self.customer.id}/',
+        ]:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+        # Decimal values handed to the renderer still come out as numbers
+        emis = self.client.get(f'/api/debug-emis/{self.customer.id}/').json()
+        self.assertEqual(emis['monthly_salary'], 64000.5)
+        self.assertEqual(emis['active_loans'][0]['end_date'], '2027-11-03')
+
+    def test_parser(self):
+        body = '{"customer_id": 1, "name": "Zoë", "loan_amount": 250000.5}'.encode()
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(body), 'application/json', {'encoding': 'utf-8'}),
+            JSONParser().parse(io.BytesIO(body), 'application/json', {'encoding': 'utf-8'}),
+        )
+        for invalid in [b'{"customer_id": ', b'{"loan_amount": NaN}']:
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(invalid), 'application/json', {'encoding': 'utf-8'})
+
+    def test_msgpack_is_negotiated(self):
+        path = f'/api/view-loans/{self.customer.id}/'
+        response = self.client.get(path, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get(path).json())
+
+
+class LoanScheduleTests(TestCase):
+    """Amortization schedules from loans.schedules"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Meera', last_name='Rao', age=41, phone_number='9000000009',
+            monthly_salary=Decimal('95000'), approved_limit=Decimal('3400000'),
+        )
+        cls.loans = [
+            Loan.objects.create(
+                customer=cls.customer, loan_amount=Decimal(amount), tenure=tenure,
+                interest_rate=Decimal(rate), monthly_payment=monthly_emi(Decimal(amount), Decimal(rate), tenure),
+                emis_paid_on_time=paid,
+                date_of_approval=date(2024, 1, 31), end_date=date(2024, 1, 31) + relativedelta(months=tenure),
+            )
+            for amount, rate, tenure, paid in [
+                ('450000', '11.50', 36, 20), ('100000.55', '0', 7, 0), ('2500000', '18.75', 180, 180),
+            ]
+        ]
+
+    def test_schedule_adds_up(self):
+        for loan in self.loans:
+            data = self.client.get(f'/api/loan-schedule/{loan.id}/').json()
+            rows = data['schedule']
+            self.assertEqual(len(rows), loan.tenure)
+            self.assertEqual(sum(Decimal(row['principal']) for row in rows), loan.loan_amount)
+            self.assertEqual(rows[-1]['balance'], '0.00')
+            for row in rows:
+                self.assertEqual(Decimal(row['payment']), Decimal(row['principal']) + Decimal(row['interest']))
+            for row in rows[:-1]:
+                self.assertEqual(row['payment'], data['monthly_installment'])
+            self.assertEqual(
+                [row['due_date'] for row in rows[:2]],
+                [str(loan.date_of_approval + relativedelta(months=1)), str(loan.date_of_approval + relativedelta(months=2))],
+            )
+
+    def test_matches_month_by_month_calculation(self):
+        loan = self.loans[0]
+        rows = self.client.get(f'/api/loan-schedule/{loan.id}/').json()['schedule']
+        emi = loan.monthly_payment
+        balance = loan.loan_amount
+        rate = loan.interest_rate / 1200
+        for row in rows[:-1]:
+            balance -= emi - balance * rate
+            self.assertLessEqual(abs(Decimal(row['balance']) - balance), Decimal('0.005'))
+
+    def test_uses_the_stored_monthly_payment(self):
+        # EMIs recorded rounded to the rupee, one too low and one too high
+        # to last the whole tenure, as in imported loan files
+        for monthly_payment, rows_paid in [('14840.00', 36), ('14839.00', 36), ('20000.00', 26)]:
+            loan = Loan.objects.create(
+                customer=self.customer, loan_amount=Decimal('450000'), tenure=36, interest_rate=Decimal('11.50'),
+                monthly_payment=Decimal(monthly_payment), emis_paid_on_time=0,
+                date_of_approval=date(2024, 5, 10), end_date=date(2027, 5, 10),
+            )
+            data = self.client.get(f'/api/loan-schedule/{loan.id}/').json()
+            self.assertEqual(data['monthly_installment'], self.client.get(f'/api/view-loan/{loan.id}/').json()['monthly_payment'])
+            rows = data['schedule']
+            self.assertEqual(len(rows), 36)
+            self.assertEqual(sum(Decimal(row['principal']) for row in rows), loan.loan_amount)
+            for row in rows[:rows_paid - 1]:
+                self.assertEqual(row['payment'], monthly_payment)
+            # the final installment absorbs the difference to the exact EMI
+            final = rows[rows_paid - 1]
+            self.assertEqual(final['balance'], '0.00')
+            self.assertEqual(Decimal(final['payment']), Decimal(final['principal']) + Decimal(final['interest']))
+            self.assertEqual(
+                [row['payment'] for row in rows[rows_paid:]], ['0.00'] * (36 - rows_paid)
+            )
+            balance = loan.loan_amount
+            for row in rows[:rows_paid - 1]:
+                balance -= Decimal(monthly_payment) - balance * loan.interest_rate / 1200
+                self.assertLessEqual(abs(Decimal(row['balance']) - balance), Decimal('0.005'))
+
+    def test_mark_paid(self):
+        loan = self.loans[0]
+        rows = self.client.get(f'/api/loan-schedule/{loan.id}/?mark_paid=1').json()['schedule']
+        self.assertEqual([row['paid'] for row in rows], [True] * 20 + [False] * 16)
+        self.assertNotIn('paid', self.client.get(f'/api/loan-schedule/{loan.id}/').json()['schedule'][0])
+        self.assertEqual(self.client.get('/api/loan-schedule/0/').status_code, 404)
+
+    def test_export_matches_single_schedules(self):
+        response = self.client.post(
+            '/api/loan-schedules/', {'loan_ids': [loan.id for loan in self.loans], 'mark_paid': True},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'loan_id,customer_id,installment,due_date,payment,principal,interest,balance,paid')
+        self.assertEqual(len(lines), 1 + sum(loan.tenure for loan in self.loans))
+
+        loan = self.loans[1]
+        single = self.client.get(f'/api/loan-schedule/{loan.id}/?mark_paid=1').json()['schedule']
+        exported = [line.split(',') for line in lines[1:] if line.startswith(f'{loan.id},')]
+        self.assertEqual([row[2:8] for row in exported], [
+            [str(row['installment']), row['due_date'], row['payment'], row['principal'], row['interest'], row['balance']]
+            for row in single
+        ])
+
+        missing = self.client.post('/api/loan-schedules/', {'loan_ids': [self.loans[0].id, 0]}, content_type='application/json')
+        self.assertEqual((missing.status_code, missing.json()['loan_ids']), (404, [0]))
+
+        for loan_ids in ([self.loans[0].id, True], [str(self.loans[0].id)], self.loans[0].id):
+            response = self.client.post('/api/loan-schedules/', {'loan_ids': loan_ids}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+class EmiKernelTests(SimpleTestCase):
+    """loans.emi against the calculate_emi formula"""
+
+    def test_matches_calculate_emi(self):
+        rng = random.Random(7)
+        cases = []
+        for _ in range(2000):
+            amount = Decimal(rng.randint(10000, 9999999999)) / 100
+            rate = Decimal(rng.randint(0, 3000)) / 100
+            tenure = rng.randint(1, 720)
+            emi = monthly_emi(amount, rate, tenure)
+            self.assertEqual(emi.as_tuple().exponent, -2)
+            self.assertLessEqual(abs(emi - Decimal(calculate_emi(amount, rate, tenure))), Decimal('0.005'))
+            cases.append((int(amount * 100), float(rate), tenure, int(emi * 100)))
+
+        principal, rates, tenures, expected = zip(*cases)
+        self.assertEqual(emi_paise_array(principal, rates, tenures).tolist(), list(expected))
+
+    def test_rate_forms_and_edges(self):
+        self.assertEqual(monthly_emi(Decimal('1000000'), Decimal('12.00'), 24), Decimal('47073.47'))
+        self.assertEqual(monthly_emi(1000000, 12, 24), monthly_emi(1000000.0, 12.0, 24))
+        self.assertEqual(monthly_emi(Decimal('100000.55'), 0, 7), Decimal('14285.79'))
+        with self.assertRaises(ValueError):
+            monthly_emi(100000, 12, 0)
+
+
+class LoanOffersTests(TestCase):
+    """/loan-offers/ returns the largest amounts /check-eligibility approves"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            first_name='Arjun', last_name='Nair', age=36, phone_number='9000000010',
+            monthly_salary=Decimal('85000.55'), approved_limit=Decimal('3100000'),
+        )
+        Loan.objects.create(
+            customer=cls.customer, loan_amount=Decimal('300000'), tenure=48,
+            interest_rate=Decimal('13.25'), monthly_payment=Decimal('8117.40'),
+            emis_paid_on_time=10, date_of_approval=date(2025, 4, 12), end_date=date(2029, 4, 12),
+        )
+
+    def setUp(self):
+        score_cache().clear()
+
+    def offers(self, **body):
+        response = self.client.post(
+            '/api/loan-offers/', {'customer_id': self.customer.id, **body}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def check(self, amount, rate, tenure):
+        return self.client.post('/api/check-eligibility/', {
+            'customer_id': self.customer.id, 'loan_amount': str(amount), 'interest_rate': str(rate), 'tenure': tenure,
+        }, content_type='application/json').json()
+
+    def test_offers_are_the_largest_approvable_amounts(self):
+        data = self.offers(interest_rate='20.00', min_tenure=1, max_tenure=120)
+        self.assertEqual(data['corrected_interest_rate'], 20.0)
+        self.assertEqual([offer['tenure'] for offer in data['offers']], list(range(1, 121)))
+        for offer in data['offers'][::17]:
+            amount = Decimal(str(offer['max_loan_amount']))
+            approved = self.check(amount, '20.00', offer['tenure'])
+            self.assertTrue(approved['approval'])
+            self.assertEqual(approved['monthly_installment'], offer['monthly_installment'])
+            self.assertFalse(self.check(amount + Decimal('0.01'), '20.00', offer['tenure'])['approval'])
+
+    def test_offers_use_the_corrected_rate(self):
+        with patch('loans.views.get_credit_snapshot', lambda customer: {'credit_score': 25, 'active_emi_total': Decimal('8117.40')}):
+            data = self.offers(interest_rate='9.00', min_tenure=12, max_tenure=12)
+            self.assertEqual(data['corrected_interest_rate'], 16.0)
+            offer = data['offers'][0]
+            self.assertEqual(Decimal(str(offer['monthly_installment'])), monthly_emi(Decimal(str(offer['max_loan_amount'])), 16, 12))
+
+        with patch('loans.views.get_credit_snapshot', lambda customer: {'credit_score': 10, 'active_emi_total': Decimal(0)}):
+            self.assertEqual(self.offers(interest_rate='9.00')['offers'], [])
+
+    def test_validation(self):
+        response = self.client.post('/api/loan-offers/', {
+            'customer_id': self.customer.id, 'interest_rate': '12', 'min_tenure': 30, 'max_tenure': 12,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/loan-offers/', {'customer_id': 0, 'interest_rate': '12'}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class BenchmarkSuiteTests(TestCase):
+    """manage.py benchmark: synthetic portfolios, JSON output and baseline checks"""
+
+    def test_populate_portfolio(self):
+        customers, loans = populate_portfolio(40, seed=3)
+        self.assertEqual((Customer.objects.count(), Loan.objects.count()), (customers, loans))
+        self.assertEqual(CustomerCreditProfile.objects.count(), 40)
+        amounts = list(Loan.objects.order_by('id').values_list('loan_amount', 'tenure', 'interest_rate'))
+        Loan.objects.all().delete()
+        Customer.objects.all().delete()
+        populate_portfolio(40, seed=3)
+        self.assertEqual(list(Loan.objects.order_by('id').values_list('loan_amount', 'tenure', 'interest_rate')), amounts)
+
+    def test_compare_with_baseline(self):
+        baseline = [
+            {'name': 'emi', 'variant': 'table', 'unit': 'us/loan', 'value': 2.0, 'size': 100},
+            {'name': 'emi', 'variant': 'array', 'unit': 'us/loan', 'value': 0.2, 'size': 100},
+        ]
+        results = [
+            {'name': 'emi', 'variant': 'table', 'unit': 'us/loan', 'value': 2.4, 'size': 100},
+            {'name': 'emi', 'variant': 'array', 'unit': 'us/loan', 'value': 0.3, 'size': 100},
+            {'name': 'emi', 'variant': 'array', 'unit': 'us/loan', 'value': 9.0, 'size': 1000},
+        ]
+        regressions = compare_with_baseline(results, baseline, threshold=0.25)
+        self.assertEqual([(r['variant'], r['size'], r['change']) for r in regressions], [('array', 100, 0.5)])
+
+    def test_command_writes_results_and_fails_on_regression(self):
+        populate_portfolio(20)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark', 'months-between', 'emi', repeat=1, output=output, json=True, stdout=io.StringIO())
+            with open(output) as file:
+                results = json.load(file)
+            self.assertEqual({(run['name'], run['variant']) for run in results}, {
+                ('months-between', 'relativedelta'), ('emi', 'formula'), ('emi', 'table'), ('emi', 'array'),
+            })
+
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as file:
+                json.dump([{**run, 'value': run['value'] / 100} for run in results], file)
+            with self.assertRaisesMessage(CommandError, 'regressed'):
+                call_command('benchmark', 'months-between', repeat=1, baseline=baseline, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class PortfolioGeneratorTests(TestCase):
+    """manage.py generate_portfolio: seeded, fitted to the sample files, loadable by load_data"""
+
+    def generate(self, directory, **options):
+        call_command('generate_portfolio', customers=120, chunk_size=50, format='csv', output_dir=directory,
+                     stdout=io.StringIO(), **options)
+        with open(os.path.join(directory, 'customer_data.csv')) as customers, \
+                open(os.path.join(directory, 'loan_data.csv')) as loans:
+            return customers.read(), loans.read()
+
+    def test_same_seed_gives_same_files_whatever_the_workers(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            serial = self.generate(first, seed=7, workers=1)
+            parallel = self.generate(second, seed=7, workers=2)
+            self.assertEqual(serial, parallel)
+            self.assertNotEqual(self.generate(first, seed=8, workers=1), serial)
+
+    def test_files_load_with_load_data(self):
+        with tempfile.TemporaryDirectory() as directory:
+            customers, loans = self.generate(directory, workers=1)
+            call_command('load_data', bulk=True, customers=os.path.join(directory, 'customer_data.csv'),
+                         loans=os.path.join(directory, 'loan_data.csv'), stdout=io.StringIO())
+        self.assertEqual(Customer.objects.count(), 120)
+        self.assertEqual(Loan.objects.count(), loans.count('\n') - 1)
+        for loan in Loan.objects.all()[:50]:
+            self.assertEqual(loan.monthly_payment, monthly_emi(loan.loan_amount, loan.interest_rate, loan.tenure))
+            self.assertEqual(loan.end_date, loan.date_of_approval + relativedelta(months=loan.tenure))
+            self.assertLessEqual(loan.emis_paid_on_time, loan.tenure)
+        salaries = Customer.objects.values_list('monthly_salary', flat=True)
+        self.assertTrue(all(salary % 1000 == 0 for salary in salaries))
+
+    def test_parquet_files_hold_the_csv_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.generate(directory, seed=7, workers=1)
+            call_command('generate_portfolio', customers=120, chunk_size=50, format='parquet', output_dir=directory,
+                         seed=7, workers=1, stdout=io.StringIO())
+            for name, columns in (('customer_data', CUSTOMER_COLUMNS), ('loan_data', LOAN_COLUMNS)):
+                self.assertEqual(
+                    list(read_batches(os.path.join(directory, f'{name}.parquet'), columns)),
+                    list(read_batches(os.path.join(directory, f'{name}.csv'), columns)),
+                )
+            call_command('load_data', bulk=True, customers=os.path.join(directory, 'customer_data.parquet'),
+                         loans=os.path.join(directory, 'loan_data.parquet'), stdout=io.StringIO())
+        self.assertEqual(Customer.objects.count(), 120)
+
+    def test_writes_to_database_with_loan_target(self):
+        call_command('generate_portfolio', customers=200, loans=1000, chunk_size=64, workers=1, stdout=io.StringIO())
+        self.assertEqual(Customer.objects.count(), 200)
+        self.assertAlmostEqual(Loan.objects.count(), 1000, delta=150)
+        self.assertEqual(CustomerCreditProfile.objects.count(), 200)
+
+
+class MetricsTests(TestCase):
+    """MetricsMiddleware, decision counters and the /metrics endpoint"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Meera', last_name='Iyer', age=30, phone_number='9000000001',
+            monthly_salary=Decimal('100000'), approved_limit=Decimal('3600000'),
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_amount=Decimal('100000'), tenure=12, interest_rate=Decimal('10'),
+            monthly_payment=Decimal('8791.59'), emis_paid_on_time=3,
+            date_of_approval=date(2025, 6, 1), end_date=date(2026, 6, 1),
+        )
+
+    def test_records_route_latency_and_queries(self):
+        route = ('api/view-loan/<int:loan_id>/', 'GET')
+        counters, histograms = metrics.collect()
+        queries_before = counters.get(('credit_db_queries_total', route), 0)
+        requests_before = sum(histograms.get(('credit_http_request_duration_seconds', route + ('200',)), [0, 0])[:-1])
+
+        self.client.get(f'/api/view-loan/{self.loan.id}/')
+        self.client.get(f'/api/view-loan/{self.loan.id}/')
+
+        counters, histograms = metrics.collect()
+        histogram = histograms[('credit_http_request_duration_seconds', route + ('200',))]
+        self.assertEqual(sum(histogram[:-1]) - requests_before, 2)
+        self.assertGreater(counters[('credit_db_queries_total', route)] - queries_before, 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE credit_http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'credit_http_request_duration_seconds_bucket{route="api/view-loan/<int:loan_id>/",method="GET",status="200",le="+Inf"}',
+            body,
+        )
+
+    def test_async_stack_records_route_and_queries(self):
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(self.async_response)))
+        self.assertFalse(iscoroutinefunction(MetricsMiddleware(lambda request: HttpResponse())))
+
+        route = ('api/view-loan/<int:loan_id>/', 'GET')
+        counters, histograms = metrics.collect()
+        queries_before = counters.get(('credit_db_queries_total', route), 0)
+        requests_before = sum(histograms.get(('credit_http_request_duration_seconds', route + ('200',)), [0, 0])[:-1])
+
+        response = async_to_sync(self.async_client.get)(f'/api/view-loan/{self.loan.id}/')
+        self.assertEqual(response.status_code, 200)
+
+        counters, histograms = metrics.collect()
+        histogram = histograms[('credit_http_request_duration_seconds', route + ('200',))]
+        self.assertEqual(sum(histogram[:-1]) - requests_before, 1)
+        self.assertGreater(counters[('credit_db_queries_total', route)] - queries_before, 0)
+
+    async def async_response(self, request):
+        # the ORM runs in a sync_to_async thread, as in the async views
+        await Customer.objects.filter(pk=self.customer.pk).aexists()
+        return HttpResponse()
+
+    def test_async_middleware_counts_queries_run_in_threads(self):
+        route = ('unmatched', 'GET')
+        counters, _ = metrics.collect()
+        before = counters.get(('credit_db_queries_total', route), 0)
+
+        middleware = MetricsMiddleware(self.async_response)
+        response = async_to_sync(middleware)(AsyncRequestFactory().get('/probe/'))
+        self.assertEqual(response.status_code, 200)
+
+        counters, _ = metrics.collect()
+        self.assertEqual(counters[('credit_db_queries_total', route)] - before, 1)
+
+    def test_counts_decisions(self):
+        def decisions():
+            counters, _ = metrics.collect()
+            return {
+                decision: counters.get(('credit_loan_decisions_total', ('create_loan', decision)), 0)
+                for decision in ('approved', 'rejected')
+            }
+
+        before = decisions()
+        payload = {'customer_id': self.customer.id, 'loan_amount': 50000, 'interest_rate': 14, 'tenure': 12}
+        self.client.post('/api/create-loan/', payload, content_type='application/json')
+        payload['loan_amount'] = 50000000
+        self.client.post('/api/create-loan/', payload, content_type='application/json')
+        after = decisions()
+        self.assertEqual(after['approved'] - before['approved'], 1)
+        self.assertEqual(after['rejected'] - before['rejected'], 1)
+
+    def test_multiprocess_directory_adds_up_workers(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            metrics.inc('credit_loan_decisions_total', ('test', 'approved'), 2)
+            metrics.flush()
+            own_files = os.listdir(directory)
+            self.assertEqual(len(own_files), 1)
+            # Another worker's file, as written by its flush()
+            with open(os.path.join(directory, own_files[0])) as file:
+                data = json.load(file)
+            with open(os.path.join(directory, 'metrics-1-other.json'), 'w') as file:
+                json.dump(data, file)
+
+            counters, _ = metrics.collect()
+            own, _ = metrics.collect_process()
+            key = ('credit_loan_decisions_total', ('test', 'approved'))
+            self.assertEqual(counters[key], 2 * own[key])
+
+
+class RequestProfilingTests(TestCase):
+    """ProfilingMiddleware: signed token or sampling, ring buffer, admin endpoints"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(PROFILING_DIR=self.directory, PROFILING_MAX_PROFILES=2, PROFILING_SAMPLE_RATE=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        score_cache().clear()
+
+        self.customer = Customer.objects.create(
+            first_name='Ravi', last_name='Das', age=40, phone_number='9000000002',
+            monthly_salary=Decimal('90000'), approved_limit=Decimal('3200000'),
+        )
+        Loan.objects.create(
+            customer=self.customer, loan_amount=Decimal('200000'), tenure=24, interest_rate=Decimal('12'),
+            monthly_payment=Decimal('9414.69'), emis_paid_on_time=10,
+            date_of_approval=date(2024, 1, 1), end_date=date(2026, 1, 1),
+        )
+        self.payload = {'customer_id': self.customer.id, 'loan_amount': 50000, 'interest_rate': 14, 'tenure': 12}
+
+    def check_eligibility(self, **headers):
+        return self.client.post('/api/check-eligibility/', self.payload, content_type='application/json', headers=headers)
+
+    def test_signed_token_profiles_request_with_tags(self):
+        self.assertNotIn('X-Profile-Id', self.check_eligibility())
+        self.assertNotIn('X-Profile-Id', self.check_eligibility(**{'X-Profile-Token': 'forged'}))
+
+        response = self.check_eligibility(**{'X-Profile-Token': profiling.make_token()})
+        self.assertEqual(response.status_code, 200)
+        [summary] = profiling.list_profiles()
+        self.assertEqual(summary['id'], response['X-Profile-Id'])
+        self.assertEqual((summary['path'], summary['status']), ('/api/check-eligibility/', 200))
+        self.assertEqual(set(summary['tags']), {'credit_score', 'emi', 'orm'})
+        self.assertGreater(summary['tags']['credit_score'], 0)
+        self.assertGreater(summary['tags']['emi'], 0)
+        self.assertGreater(summary['tags']['orm'], 0)
+        self.assertLessEqual(summary['tags']['credit_score'], summary['duration'])
+
+    def test_async_requests_pass_through_unprofiled(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = ProfilingMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().post(
+            '/api/check-eligibility/', headers={'X-Profile-Token': profiling.make_token()}
+        )
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+        response = async_to_sync(self.async_client.post)(
+            '/api/check-eligibility/', self.payload, content_type='application/json',
+            headers={'X-Profile-Token': profiling.make_token()},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_sampling_keeps_newest_profiles(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            ids = [self.check_eligibility()['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual([summary['id'] for summary in profiling.list_profiles()], ids[:0:-1])
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_endpoints_are_admin_only(self):
+        profile_id = self.check_eligibility(**{'X-Profile-Token': profiling.make_token()})['X-Profile-Id']
+        self.assertEqual(self.client.get('/api/profiles/').status_code, 403)
+
+        admin = User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get('/api/profiles/')
+        self.assertEqual([summary['id'] for summary in response.json()['profiles']], [profile_id])
+
+        response = self.client.get(f'/api/profiles/{profile_id}/')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{profile_id}.prof"')
+        with tempfile.NamedTemporaryFile(suffix='.prof') as file:
+            file.write(b''.join(response.streaming_content))
+            file.flush()
+            self.assertTrue(pstats.Stats(file.name).stats)
+        self.assertIn('cumulative', self.client.get(f'/api/profiles/{profile_id}/?report=1').content.decode())
+        self.assertEqual(self.client.get('/api/profiles/..%2Fsecret/').status_code, 404)
+
+
+class PortfolioExportTests(TestCase):
+    """export_portfolio / portfolio-export: merged customer and loan rows, streamed"""
+
+    def setUp(self):
+        self.first = Customer.objects.create(
+            first_name='Asha', last_name='Rao', age=35, phone_number='9000000003',
+            monthly_salary=Decimal('80000'), approved_limit=Decimal('2900000'),
+        )
+        self.idle = Customer.objects.create(
+            first_name='Kiran', last_name='Shah', age=28, phone_number='9000000004',
+            monthly_salary=Decimal('50000'), approved_limit=Decimal('1800000'),
+        )
+        self.last = Customer.objects.create(
+            first_name='Dev', last_name='Nair', age=45, phone_number='9000000005',
+            monthly_salary=Decimal('120000'), approved_limit=Decimal('4300000'),
+        )
+        for customer, approved, paid in ((self.first, date(2019, 3, 5), 30), (self.first, date(2024, 8, 1), 10),
+                                         (self.last, date(2019, 11, 20), 12)):
+            Loan.objects.create(
+                customer=customer, loan_amount=Decimal('300000'), tenure=36, interest_rate=Decimal('11.5'),
+                monthly_payment=Decimal('9893.37'), emis_paid_on_time=paid,
+                date_of_approval=approved, end_date=approved + relativedelta(months=36),
+            )
+        self.scores = dict(Customer.objects.with_credit_score().values_list('id', 'credit_score'))
+
+    def test_rows_merge_loans_with_customer_scores(self):
+        from .export import EXPORT_COLUMNS, export_rows
+
+        rows = [dict(zip(EXPORT_COLUMNS, row)) for row in export_rows(chunk_size=1)]
+        self.assertEqual(
+            [(row['customer_id'], row['loan_id'] is not None) for row in rows],
+            [(self.first.id, True), (self.first.id, True), (self.idle.id, False), (self.last.id, True)],
+        )
+        for row in rows:
+            self.assertEqual(row['credit_score'], self.scores[row['customer_id']])
+            if row['loan_id'] is not None:
+                self.assertEqual(row['repayments_left'], row['tenure'] - row['emis_paid_on_time'])
+
+        rows = list(export_rows(approval_year=2019))
+        self.assertEqual([row[0] for row in rows], [self.first.id, self.last.id])
+
+    def test_command_writes_partitioned_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_portfolio', directory, partition_by_year=True, chunk_size=1, stdout=io.StringIO())
+            self.assertEqual(
+                sorted(os.listdir(directory)), ['approval_year=2019', 'approval_year=2024', 'approval_year=none'],
+            )
+            with open(os.path.join(directory, 'approval_year=2019', 'part-0.csv')) as file:
+                rows = list(csv.DictReader(file))
+            self.assertEqual([int(row['customer_id']) for row in rows], [self.first.id, self.last.id])
+            self.assertEqual(rows[0]['repayments_left'], '6')
+
+    def test_command_writes_parquet_like_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path, parquet_path = os.path.join(directory, 'all.csv'), os.path.join(directory, 'all.parquet')
+            call_command('export_portfolio', csv_path, chunk_size=1, stdout=io.StringIO())
+            call_command('export_portfolio', parquet_path, chunk_size=2, stdout=io.StringIO())
+            table = pq.read_table(parquet_path)
+            self.assertEqual(pq.ParquetFile(parquet_path).num_row_groups, 2)
+            with open(csv_path) as file:
+                rows = list(csv.DictReader(file))
+            self.assertEqual(table.column_names, list(rows[0]))
+            self.assertEqual(table.column('customer_id').to_pylist(), [int(row['customer_id']) for row in rows])
+            self.assertEqual(table.column('loan_amount').to_pylist()[0], Decimal('300000.00'))
+            self.assertEqual(table.column('loan_id').to_pylist()[2], None)
+
+            call_command('export_portfolio', os.path.join(directory, 'parts'), format='parquet',
+                         partition_by_year=True, stdout=io.StringIO())
+            table = pq.read_table(os.path.join(directory, 'parts', 'approval_year=2019', 'part-0.parquet'))
+            self.assertEqual(table.column('customer_id').to_pylist(), [self.first.id, self.last.id])
+
+    def test_endpoint_streams_csv_for_admins(self):
+        self.assertEqual(self.client.get('/api/portfolio-export/').status_code, 403)
+        self.client.force_login(User.objects.create_user('risk', password='secret', is_staff=True))
+
+        response = self.client.get('/api/portfolio-export/?approval_year=2024')
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(int(row['customer_id']), row['date_of_approval']) for row in rows], [(self.first.id, '2024-08-01')])
+        self.assertEqual(int(rows[0]['credit_score']), self.scores[self.first.id])
+        self.assertEqual(self.client.get('/api/portfolio-export/?output=xml').status_code, 400)
+
+        response = self.client.get('/api/portfolio-export/?output=parquet&approval_year=2019')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="portfolio-2019.parquet"')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('customer_id').to_pylist(), [self.first.id, self.last.id])
+
+
+class SourceFilesMixin:
+    """Small customer and loan CSV files for load_data, rewritten by write_files()"""
+
+    CUSTOMER_HEADER = ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number',
+                       'Monthly Salary', 'Approved Limit', 'Current Debt']
+    LOAN_HEADER = ['Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate',
+                   'Monthly payment', 'EMIs paid on Time', 'Date of Approval', 'End Date']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.customers = [
+            [customer_id, f'First{customer_id}', f'Last{customer_id}', 30 + customer_id, 9000000000 + customer_id,
+             50000, 1800000, 0]
+            for customer_id in range(1, 7)
+        ]
+        self.loans = [
+            [customer_id, loan_id, 100000, 12, '10.5', 8815, 3, '2025-01-15', '2026-01-15']
+            for customer_id in range(1, 7) for loan_id in (1, 2)
+        ]
+        self.customer_path = os.path.join(self.directory, 'customer_data.csv')
+        self.loan_path = os.path.join(self.directory, 'loan_data.csv')
+        self.write_files()
+
+    def write_files(self):
+        for path, header, rows in ((self.customer_path, self.CUSTOMER_HEADER, self.customers),
+                                   (self.loan_path, self.LOAN_HEADER, self.loans)):
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(header)
+                writer.writerows(rows)
+
+    def load(self, chunk_size=2, **options):
+        output = io.StringIO()
+        with redirect_stdout(io.StringIO()):
+            call_command('load_data', customers=self.customer_path, loans=self.loan_path, chunk_size=chunk_size,
+                         stdout=output, **options)
+        return output.getvalue()
+
+
+class LoadDataSyncTests(SourceFilesMixin, TestCase):
+    """load_data --sync after a row-by-row load, on changed files and from a checkpoint"""
+
+    def test_sync_after_row_by_row_load_changes_nothing(self):
+        self.load()
+        self.assertEqual(Customer.objects.exclude(source_id=None).count(), 6)
+        self.assertEqual(Loan.objects.exclude(source_id=None).count(), 12)
+
+        output = self.load(sync=True)
+        self.assertIn('✓ customers: 6 rows checked, 0 new, 0 changed', output)
+        self.assertIn('✓ loans: 12 rows checked, 0 new, 0 changed', output)
+        self.assertEqual(Customer.objects.count(), 6)
+        self.assertEqual(Loan.objects.count(), 12)
+
+        # unchanged files: the completed checkpoints skip them
+        output = self.load(sync=True)
+        self.assertIn('customers: ', output)
+        self.assertIn('already synced, nothing to do', output)
+
+    def test_sync_updates_changed_rows_only(self):
+        self.load(sync=True)
+        self.customers[2][5] = 75000
+        self.loans[5][6] = 4
+        self.loans.append([6, 3, 50000, 6, '9.0', 8553, 0, '2025-06-01', '2025-12-01'])
+        self.write_files()
+
+        output = self.load(sync=True)
+        self.assertIn('✓ customers: 6 rows checked, 0 new, 1 changed', output)
+        self.assertIn('✓ loans: 13 rows checked, 1 new, 1 changed', output)
+        self.assertEqual(Customer.objects.get(source_id=3).monthly_salary, 75000)
+        self.assertEqual(Loan.objects.get(source_id='3:2').emis_paid_on_time, 4)
+        self.assertEqual(Loan.objects.filter(customer__source_id=6).count(), 3)
+        self.assertEqual(get_credit_profile(Customer.objects.get(source_id=6)).loan_count, 3)
+
+    def test_sync_resumes_after_the_checkpoint(self):
+        self.load(sync=True)
+        # as if the previous run stopped after the second batch of customers
+        SyncCheckpoint.objects.filter(source='customers').update(rows_done=4, completed=False)
+        # rows whose stored hash no longer matches the file count as changed
+        Customer.objects.filter(source_id__in=[1, 6]).update(first_name='Edited', source_hash='stale')
+
+        output = self.load(sync=True)
+        self.assertIn('customers: resuming after row 4', output)
+        self.assertIn('✓ customers: 6 rows checked, 0 new, 1 changed', output)
+        # rows before the checkpoint are not read again
+        self.assertEqual(Customer.objects.get(source_id=1).first_name, 'Edited')
+        self.assertEqual(Customer.objects.get(source_id=6).first_name, 'First6')
+        self.assertTrue(SyncCheckpoint.objects.get(source='customers').completed)
+
+        output = self.load(sync=True, restart=True)
+        self.assertIn('✓ customers: 6 rows checked, 0 new, 1 changed', output)
+        self.assertEqual(Customer.objects.get(source_id=1).first_name, 'First1')
+
+
+@override_settings(SYSTEM_REFERENCE_DATE='2026-02-09')
+class BulkLoadTests(SourceFilesMixin, TestCase):
+    """load_data --bulk: chunked writes through the backend's writer"""
+
+    def test_writer_returns_ids_in_row_order(self):
+        writer = get_writer()
+        self.assertEqual(writer.name, 'copy' if copy_supported() else 'bulk_create')
+        self.assertIsInstance(get_writer(use_copy=False), BulkCreateWriter)
+        self.assertEqual(writer.write(Customer, []), [])
+
+        rows = [
+            {'first_name': f'Name{i}', 'last_name': 'Bulk', 'age': 20 + i, 'phone_number': f'98000000{i:02d}',
+             'monthly_salary': Decimal(40000 + i), 'approved_limit': Decimal(1400000), 'current_debt': Decimal(0),
+             'source_id': 100 + i, 'source_hash': ''}
+            for i in range(5)
+        ]
+        ids = writer.write(Customer, rows)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(
+            list(Customer.objects.filter(pk__in=ids).order_by('source_id').values_list('pk', 'first_name')),
+            [(pk, row['first_name']) for pk, row in zip(ids, rows)],
+        )
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(chunked(iter(range(4)), 2)), [[0, 1], [2, 3]])
+        self.assertEqual(list(chunked([], 3)), [])
+
+    def test_bulk_load_in_chunks(self):
+        self.customers[2][7] = ''  # Current Debt defaults to 0
+        self.write_files()
+        output = self.load(bulk=True, chunk_size=4)
+        self.assertIn('✓ Created 4 customers', output)
+        self.assertIn('✓ Created 6 customers', output)
+        self.assertIn('✓ Created 12 loans', output)
+
+        self.assertEqual(Customer.objects.count(), 6)
+        customer = Customer.objects.get(source_id=3)
+        self.assertEqual((customer.first_name, customer.phone_number, customer.current_debt), ('First3', '9000000003', 0))
+        loan = Loan.objects.get(source_id='3:2')
+        self.assertEqual((loan.customer_id, loan.interest_rate, loan.date_of_approval),
+                         (customer.pk, Decimal('10.5'), date(2025, 1, 15)))
+        # bulk writes skip the signals, so the profiles are built afterwards
+        self.assertEqual(CustomerCreditProfile.objects.get(customer=customer).loan_count, 2)
+        self.assertEqual(list(check_profiles()), [])
+
+        # the same rows again through --sync: nothing to do
+        self.assertIn('✓ customers: 6 rows checked, 0 new, 0 changed', self.load(sync=True))
+
+    def test_second_bulk_load_points_to_sync(self):
+        self.load(bulk=True)
+        with self.assertRaisesMessage(CommandError, 'Run load_data --sync'):
+            self.load(bulk=True)
+        self.assertEqual(Customer.objects.count(), 6)
+        self.assertEqual(Loan.objects.count(), 12)
+
+
+class ReaderTests(SimpleTestCase):
+    """loans.readers.read_batches over .xlsx, .csv and .parquet files"""
+
+    HEADER = ['Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number',
+              'Monthly Salary', 'Approved Limit', 'Current Debt']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def csv_file(self, rows, header=None, name='customers.csv', encoding='utf-8'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='', encoding=encoding) as file:
+            writer = csv.writer(file)
+            writer.writerow(header or self.HEADER)
+            writer.writerows(rows)
+        return path
+
+    def xlsx_file(self, rows, header=None, name='customers.xlsx'):
+        from openpyxl import Workbook
+
+        path = os.path.join(self.directory, name)
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(header or self.HEADER)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+        return path
+
+    def test_xlsx_cells_are_converted(self):
+        # what Excel hands back: floats for numbers, datetimes for dates
+        path = self.xlsx_file([
+            [1.0, ' Asha ', 'Rao', 34.0, 9876543210.0, 50000.0, 1800000.0, 8.2],
+            [2, 'Dev', 'Nair', 29, '9000000002', 65000, 2300000, None],
+            [None, None, None, None, None, None, None, None],
+        ])
+        [batch] = read_batches(path, CUSTOMER_COLUMNS)
+        self.assertEqual(batch, [
+            {'customer_id': 1, 'first_name': 'Asha', 'last_name': 'Rao', 'age': 34, 'phone_number': '9876543210',
+             'monthly_salary': Decimal('50000.0'), 'approved_limit': Decimal('1800000.0'), 'current_debt': Decimal('8.2')},
+            {'customer_id': 2, 'first_name': 'Dev', 'last_name': 'Nair', 'age': 29, 'phone_number': '9000000002',
+             'monthly_salary': Decimal('65000'), 'approved_limit': Decimal('2300000'), 'current_debt': Decimal(0)},
+        ])
+
+        loans = self.xlsx_file(
+            [[1, 7, 300000, 24, 12.5, 14192, 5, datetime(2024, 1, 31), datetime(2026, 1, 31)]],
+            header=[column.header for column in LOAN_COLUMNS.values()], name='loans.xlsx',
+        )
+        [[loan]] = read_batches(loans, LOAN_COLUMNS)
+        self.assertEqual((loan['interest_rate'], loan['date_of_approval'], loan['end_date']),
+                         (Decimal('12.5'), date(2024, 1, 31), date(2026, 1, 31)))
+
+    def test_csv_defaults_and_column_order(self):
+        # columns in another order, optional Current Debt missing, BOM from Excel
+        header = ['Approved Limit', 'Customer ID', 'Age', 'First Name', 'Last Name', 'Phone Number', 'Monthly Salary']
+        path = self.csv_file([[1800000, '3', '41', 'Ira', 'Sen', '9000000003', '50000.50'], []],
+                             header=header, encoding='utf-8-sig')
+        [[row]] = read_batches(path, CUSTOMER_COLUMNS)
+        self.assertEqual(row['customer_id'], 3)
+        self.assertEqual(row['monthly_salary'], Decimal('50000.50'))
+        self.assertEqual(row['approved_limit'], Decimal('1800000'))
+        self.assertEqual(row['current_debt'], Decimal(0))
+
+    def test_batch_boundaries(self):
+        rows = [[i, 'A', 'B', 30, 9000000000 + i, 1000, 36000, 0] for i in range(1, 8)]
+        path = self.csv_file(rows)
+        self.assertEqual([len(batch) for batch in read_batches(path, CUSTOMER_COLUMNS, batch_size=3)], [3, 3, 1])
+        # an exact multiple ends without an empty batch
+        path = self.csv_file(rows[:6], name='six.csv')
+        batches = list(read_batches(path, CUSTOMER_COLUMNS, batch_size=3))
+        self.assertEqual([[row['customer_id'] for row in batch] for batch in batches], [[1, 2, 3], [4, 5, 6]])
+        # header only, or an empty file
+        self.assertEqual(list(read_batches(self.csv_file([], name='header.csv'), CUSTOMER_COLUMNS)), [])
+        empty = os.path.join(self.directory, 'empty.csv')
+        open(empty, 'w').close()
+        self.assertEqual(list(read_batches(empty, CUSTOMER_COLUMNS)), [])
+
+    def test_missing_required_column_or_cell(self):
+        path = self.csv_file([[1, 'A', 'B', 30, '9000000001', 1000, 36000]], header=self.HEADER[:7])
+        self.assertEqual(len(next(read_batches(path, CUSTOMER_COLUMNS))), 1)
+
+        path = self.csv_file([[1, 'A', 30]], header=['Customer ID', 'First Name', 'Age'], name='partial.csv')
+        with self.assertRaisesMessage(ValueError, "is missing the required column 'Last Name'"):
+            next(read_batches(path, CUSTOMER_COLUMNS))
+        path = self.xlsx_file([[1, 'A', 'B', 30, '9000000001', None, 36000, 0]])
+        with self.assertRaisesMessage(ValueError, "empty 'Monthly Salary'"):
+            next(read_batches(path, CUSTOMER_COLUMNS))
+        with self.assertRaisesMessage(ValueError, "Unsupported file type '.json'"):
+            next(read_batches(os.path.join(self.directory, 'customers.json'), CUSTOMER_COLUMNS))
+
+    def test_parquet_matches_csv(self):
+        rows = [[i, f'F{i}', f'L{i}', 30 + i, str(9000000000 + i), 1000.0 * i, 36000 * i, 0.5] for i in range(1, 6)]
+        csv_path = self.csv_file(rows)
+        parquet_path = os.path.join(self.directory, 'customers.parquet')
+        table = pa.table({header: [row[index] for row in rows] for index, header in enumerate(self.HEADER)})
+        pq.write_table(table, parquet_path, row_group_size=2)
+        self.assertEqual(
+            list(read_batches(parquet_path, CUSTOMER_COLUMNS, batch_size=2)),
+            list(read_batches(csv_path, CUSTOMER_COLUMNS, batch_size=2)),
+        )
+
+
+class FakeDBAPIConnection:
+    """Stands in for a psycopg2 connection in the pool tests"""
+    IDLE, IN_TRANSACTION, UNKNOWN = 0, 2, 4
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = True
+        self.status = self.IDLE
+        self.rollbacks = 0
+
+    def close(self):
+        self.closed = 1
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = self.IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """credit_system.db.pool: reuse, limits, broken connections, threads"""
+
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        connection = FakeDBAPIConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_released_connection_is_reused(self):
+        pool = ConnectionPool(max_size=2)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        second = pool.acquire(self.connect)
+        self.assertIsNot(second, first)
+        self.assertEqual(len(self.opened), 2)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connections_created'], stats['size'], stats['idle']), (3, 2, 2, 0))
+
+    def test_exhausted_pool_times_out_then_recovers(self):
+        pool = ConnectionPool(max_size=2, timeout=0.05)
+        first, second = pool.acquire(self.connect), pool.acquire(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.connect)
+        self.assertEqual((pool.stats()['timeouts'], pool.stats()['waiting']), (1, 0))
+
+        pool.release(second)
+        self.assertIs(pool.acquire(self.connect), second)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_waiter_gets_the_released_connection(self):
+        pool = ConnectionPool(max_size=1, timeout=5)
+        connection = pool.acquire(self.connect)
+        with ThreadPoolExecutor(1) as executor:
+            waiting = executor.submit(pool.acquire, self.connect)
+            while not pool.stats()['waiting']:
+                time.sleep(0.001)
+            pool.release(connection)
+            self.assertIs(waiting.result(timeout=5), connection)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_broken_connections_are_discarded(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        connection = pool.acquire(self.connect)
+        connection.closed = 1  # the server went away
+        pool.release(connection)
+        replacement = pool.acquire(self.connect)
+        self.assertIsNot(replacement, connection)
+
+        pool.release(replacement, reusable=False)  # e.g. a failed rollback
+        self.assertEqual(replacement.closed, 1)
+        idle = pool.acquire(self.connect)
+        pool.release(idle)
+        idle.closed = 1  # broke while idle
+        self.assertNotIn(pool.acquire(self.connect), (connection, replacement, idle))
+        self.assertEqual(pool.stats()['connections_discarded'], 3)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_expired_connections_are_replaced(self):
+        pool = ConnectionPool(max_size=1, max_lifetime=0)
+        connection = pool.acquire(self.connect)
+        time.sleep(0.001)
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(self.connect), connection)
+        self.assertEqual(connection.closed, 1)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+
+        def refuse():
+            raise OSError('connection refused')
+
+        with self.assertRaises(OSError):
+            pool.acquire(refuse)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertIsInstance(pool.acquire(self.connect), FakeDBAPIConnection)
+
+    def test_concurrent_checkouts_stay_within_max_size(self):
+        pool = ConnectionPool(max_size=3, timeout=5)
+        lock = threading.Lock()
+        in_use = set()
+        peak = [0]
+
+        def work():
+            for _ in range(200):
+                connection = pool.acquire(self.connect)
+                with lock:
+                    self.assertNotIn(id(connection), in_use)  # never handed to two threads
+                    in_use.add(id(connection))
+                    peak[0] = max(peak[0], len(in_use))
+                time.sleep(0)
+                with lock:
+                    in_use.discard(id(connection))
+                pool.release(connection)
+
+        with ThreadPoolExecutor(8) as executor:
+            for future in [executor.submit(work) for _ in range(8)]:
+                future.result()
+        self.assertLessEqual(peak[0], 3)
+        self.assertLessEqual(len(self.opened), 3)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['checked_out'], stats['waiting']), (1600, 0, 0))
+
+    def test_one_pool_per_alias(self):
+        alias = f'pool-test-{id(self)}'
+        self.addCleanup(pool_module._pools.pop, (os.getpid(), alias), None)
+        pool = get_pool(alias, max_size=4)
+        self.assertIs(get_pool(alias, max_size=9), pool)
+        self.assertEqual(pool_stats()[alias]['max_size'], 4)
+
+
+@skipUnless(pooled_postgresql is not None, 'psycopg2 is not installed')
+class PooledPostgresqlBackendTests(SimpleTestCase):
+    """credit_system.db.pooled_postgresql hands connections back to the pool, reset"""
+
+    def setUp(self):
+        self.alias = f'pooled-{id(self)}'
+        self.addCleanup(pool_module._pools.pop, (os.getpid(), self.alias), None)
+        self.settings_dict = {
+            'ENGINE': 'credit_system.db.pooled_postgresql', 'NAME': 'credit', 'USER': '', 'PASSWORD': '',
+            'HOST': '', 'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None, 'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': False, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+            'POOL': {'MAX_SIZE': 1, 'TIMEOUT': 0.05, 'MAX_LIFETIME': None},
+        }
+        self.opened = []
+
+        def connect(wrapper, conn_params):
+            connection = FakeDBAPIConnection()
+            self.opened.append(connection)
+            return connection
+
+        parent = 'django.db.backends.postgresql.base.DatabaseWrapper.get_new_connection'
+        patcher = patch(parent, autospec=True, side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self):
+        wrapper = pooled_postgresql.DatabaseWrapper(self.settings_dict, self.alias)
+        wrapper.connection = wrapper.get_new_connection({})
+        return wrapper
+
+    def test_close_returns_the_connection_for_the_next_request(self):
+        wrapper = self.checkout()
+        connection = wrapper.connection
+        wrapper._close()
+        self.assertEqual(connection.closed, 0)
+        self.assertIs(self.checkout().connection, connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_open_transaction_is_rolled_back_before_reuse(self):
+        wrapper = self.checkout()
+        connection = wrapper.connection
+        connection.status = FakeDBAPIConnection.IN_TRANSACTION
+        connection.autocommit = False
+        wrapper._close()
+        self.assertEqual((connection.rollbacks, connection.autocommit), (1, True))
+        self.assertIs(self.checkout().connection, connection)
+
+    def test_broken_connection_is_dropped(self):
+        wrapper = self.checkout()
+        broken = wrapper.connection
+
+        def rollback():
+            raise pooled_postgresql.postgresql.Database.OperationalError('server closed the connection')
+
+        broken.rollback = rollback
+        broken.status = FakeDBAPIConnection.UNKNOWN
+        wrapper._close()
+        self.assertEqual(broken.closed, 1)
+        # the slot is free again: MAX_SIZE is 1, so this would time out otherwise
+        self.assertIsNot(self.checkout().connection, broken)
+        self.assertEqual(len(self.opened), 2)
@@ -1,14 +1,34 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+
+# Read and eligibility endpoints: async versions for ASGI deployments
+if getattr(settings, 'LOANS_ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
+
 urlpatterns = [
-    path('view-loan/<int:loan_id>/', views.view_loan, name='view_loan'),
-    path('view-loans/<int:customer_id>/', views.view_loans, name='view_loans'),
+    path('view-loan/<int:loan_id>/', read_views.view_loan, name='view_loan'),
+    path('view-loans/<int:customer_id>/', read_views.view_loans, name='view_loans'),
     path('register/', views.register_customer, name='register'),
-    path ('check-eligibility/', views.check_eligibility, name='check_eligibility'),
+    path ('check-eligibility/', read_views.check_eligibility, name='check_eligibility'),
+    path('check-eligibility-batch/', views.check_eligibility_batch, name='check_eligibility_batch'),
+    path('loan-offers/', views.loan_offers, name='loan_offers'),
     path('create-loan/', views.create_loan, name='create_loan'),
+    path('loan-schedule/<int:loan_id>/', views.loan_schedule, name='loan_schedule'),
+    path('loan-schedules/', views.loan_schedules_export, name='loan_schedules_export'),
+
+    path('portfolio-export/', views.portfolio_export, name='portfolio_export'),
+
+    # Stored request profiles (admin users only)
+    path('profiles/', views.list_request_profiles, name='list_request_profiles'),
+    path('profiles/<str:profile_id>/', views.download_request_profile, name='download_request_profile'),
 
      # Debug endpoints (remove in production)
     path('system-info/', views.system_info, name='system_info'),
     path('debug-score/<int:customer_id>/', views.debug_credit_score, name='debug_score'),
     path('debug-emis/<int:customer_id>/', views.debug_customer_emis, name='debug_emis'),
+    path('debug-score-cache/', views.debug_score_cache, name='debug_score_cache'),
+    path('debug-db-pool/', views.debug_db_pool, name='debug_db_pool'),
 ]
\ No newline at end of file
@@ -20,4 +20,16 @@ def get_current_date():
         return reference_date
     else:
         # Production mode - use real current date
-        return date.today()
\ No newline at end of file
+        return date.today()
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from any iterable"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
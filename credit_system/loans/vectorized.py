@@ -0,0 +1,177 @@
+"""
+Vectorized credit scoring for the whole portfolio
+
+Loads every loan once as columnar NumPy arrays (customer index, amounts in
+integer paise, EMIs paid, tenure, dates as day / month ordinals) and
+computes the four score components plus the debt-over-limit override for
+all customers with grouped reductions.
+
+The results are identical to loans.scoring.calculate_credit_score:
+- money is summed in integer paise, so debt and utilization comparisons
+  are exact (the Python path uses Decimal)
+- payment ratios are summed with np.bincount, which adds in input order,
+  and loans are ordered by (customer, id) like the Python path
+- months_between follows relativedelta: whole months, minus one when the
+  day of month (clamped to the month's length) has not been reached yet
+- the total is rounded half to even, like round()
+"""
+import calendar
+from datetime import date
+
+import numpy as np
+
+from .models import Customer, Loan
+from .utils import get_current_date
+
+
+def to_paise(value):
+    """Decimal rupees -> int paise"""
+    return int(value * 100)
+
+
+def load_customer_arrays():
+    """Customer ids (sorted) and approved limits in paise"""
+    rows = Customer.objects.order_by('id').values_list('id', 'approved_limit')
+    ids = []
+    limits = []
+    for customer_id, approved_limit in rows.iterator(chunk_size=10000):
+        ids.append(customer_id)
+        limits.append(to_paise(approved_limit))
+    return {
+        'customer_id': np.array(ids, dtype=np.int64),
+        'approved_limit': np.array(limits, dtype=np.int64),
+    }
+
+
+def load_loan_arrays(customer_ids):
+    """
+    Every loan as columns, ordered by (customer, id)
+    customer_ids: sorted array from load_customer_arrays, used to map each
+    loan to its customer's index
+    """
+    rows = Loan.objects.order_by('customer_id', 'id').values_list(
+        'customer_id', 'loan_amount', 'monthly_payment', 'emis_paid_on_time',
+        'tenure', 'date_of_approval', 'end_date',
+    )
+    columns = {name: [] for name in (
+        'customer_id', 'loan_amount', 'monthly_payment', 'emis_paid_on_time', 'tenure',
+        'approval_day_ordinal', 'approval_month_ordinal', 'approval_day', 'approval_year',
+        'end_day_ordinal', 'end_year',
+    )}
+    for customer_id, amount, payment, emis_paid, tenure, approved, ends in rows.iterator(chunk_size=10000):
+        columns['customer_id'].append(customer_id)
+        columns['loan_amount'].append(to_paise(amount))
+        columns['monthly_payment'].append(to_paise(payment))
+        columns['emis_paid_on_time'].append(emis_paid)
+        columns['tenure'].append(tenure)
+        columns['approval_day_ordinal'].append(approved.toordinal())
+        columns['approval_month_ordinal'].append(approved.year * 12 + approved.month - 1)
+        columns['approval_day'].append(approved.day)
+        columns['approval_year'].append(approved.year)
+        columns['end_day_ordinal'].append(ends.toordinal())
+        columns['end_year'].append(ends.year)
+
+    arrays = {name: np.array(values, dtype=np.int64) for name, values in columns.items()}
+    arrays['customer_index'] = np.searchsorted(customer_ids, arrays['customer_id'])
+    return arrays
+
+
+def months_between_array(approval_month_ordinal, approval_day, approval_day_ordinal, as_of):
+    """Vectorized scoring.months_between(date_of_approval, as_of)"""
+    days_in_month = calendar.monthrange(as_of.year, as_of.month)[1]
+    months = (as_of.year * 12 + as_of.month - 1) - approval_month_ordinal
+    # relativedelta steps back a month when the (clamped) day is not reached yet
+    months -= as_of.day < np.minimum(approval_day, days_in_month)
+    return np.where(as_of.toordinal() < approval_day_ordinal, 0, months)
+
+
+def score_components(customers, loans, as_of):
+    """
+    All score components for every customer
+    Returns a dict of arrays aligned with customers['customer_id']
+    """
+    n = len(customers['customer_id'])
+    index = loans['customer_index']
+    as_of_ordinal = as_of.toordinal()
+
+    loan_count = np.bincount(index, minlength=n)
+    active = loans['end_day_ordinal'] >= as_of_ordinal
+
+    # Current debt: remaining amount of active loans, in paise
+    remaining = loans['loan_amount'] - loans['emis_paid_on_time'] * loans['monthly_payment']
+    active_debt = np.zeros(n, dtype=np.int64)
+    np.add.at(active_debt, index[active], remaining[active])
+
+    # Payment ratio per loan
+    expected = months_between_array(
+        loans['approval_month_ordinal'], loans['approval_day'], loans['approval_day_ordinal'], as_of
+    )
+    emis_paid = loans['emis_paid_on_time'].astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ended_ratio = emis_paid / loans['tenure']
+        active_ratio = np.where(expected > 0, np.minimum(emis_paid / expected, 1.0), 1.0)
+    ratio = np.where(active, active_ratio, ended_ratio)
+    payment_ratio_sum = np.bincount(index, weights=ratio, minlength=n)
+
+    # Loans running during the as-of year
+    year = as_of.year
+    in_year = (loans['approval_year'] <= year) & (loans['end_year'] >= year)
+    current_year_loan_count = np.bincount(index, weights=in_year, minlength=n).astype(np.int64)
+
+    limit = customers['approved_limit']
+    has_loans = loan_count > 0
+
+    # COMPONENT 1: payment history (50 points)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment_history = np.where(has_loans, payment_ratio_sum / np.maximum(loan_count, 1) * 50, 0.0)
+
+    # COMPONENT 2: number of loans (15 / 10 / 5 points)
+    loan_count_score = np.select([loan_count <= 3, loan_count <= 6], [15, 10], 5)
+
+    # COMPONENT 3: utilization (20 / 15 / 10 / 5 points), compared exactly:
+    # debt / limit < 0.3  <=>  10 * debt < 3 * limit
+    positive_limit = limit > 0
+    volume_score = np.select(
+        [
+            ~positive_limit | (10 * active_debt < 3 * limit),
+            10 * active_debt < 5 * limit,
+            10 * active_debt < 8 * limit,
+        ],
+        [20, 15, 10],
+        5,
+    )
+
+    # COMPONENT 4: current year activity (15 / 10 / 5 points)
+    activity_score = np.select([current_year_loan_count == 0, current_year_loan_count <= 2], [15, 10], 5)
+
+    # OVERRIDE: current debt above the approved limit
+    override = has_loans & (active_debt > limit)
+
+    total = payment_history + loan_count_score + volume_score + activity_score
+    score = np.where(has_loans & ~override, np.rint(total), 0).astype(np.int64)
+
+    return {
+        'customer_id': customers['customer_id'],
+        'loan_count': loan_count,
+        'active_debt': active_debt,
+        'payment_history': payment_history,
+        'loan_count_score': loan_count_score,
+        'volume_score': volume_score,
+        'activity_score': activity_score,
+        'override': override,
+        'score': score,
+    }
+
+
+def score_portfolio(as_of=None):
+    """
+    Credit score of every customer in one pass
+    Returns a dict of arrays (see score_components); 'customer_id' and
+    'score' line up index by index
+    """
+    as_of = as_of or get_current_date()
+    if not isinstance(as_of, date):
+        raise TypeError("as_of must be a date")
+    customers = load_customer_arrays()
+    loans = load_loan_arrays(customers['customer_id'])
+    return score_components(customers, loans, as_of)
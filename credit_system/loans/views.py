@@ -1,16 +1,50 @@
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework.decorators import api_view
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Customer, Loan
-from .serializers import CustomerRegisterSerializer, CustomerResponseSerializer, LoanEligibilityRequestSerializer, LoanListSerializer, LoanSerializer
+from .serializers import CustomerRegisterSerializer, CustomerResponseSerializer, LoanEligibilityRequestSerializer, LoanOfferRequestSerializer
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 from decimal import Decimal
 from .utils import get_current_date
+from .emi import monthly_emi
+from .fast_serializers import get_customer_dict, loan_dict, loan_rows, serialize_loan, serialize_loans
+from .idempotency import idempotent
+from . import metrics
+from .offers import max_loan_amounts
+from .profiles import get_credit_profile
+from . import profiling
+from .renderers import ORJSONRenderer
+from . import export, schedules
+from .score_cache import build_snapshot, cache_stats, get_credit_snapshot, get_credit_snapshots
+from django.db import transaction
+from django.db.models import F
 # from loans.models import Customer, Loan
 # Create your views here.
 
+def get_customer_for_scoring(customer_id):
+    """
+    Customer with its credit profile joined in: one query gives everything
+    the scoring, the EMI check and the debug breakdowns need
+    Raises Customer.DoesNotExist
+    """
+    return Customer.objects.select_related('credit_profile').get(id=customer_id)
+
+
+def lock_customer_for_lending(customer_id):
+    """
+    Customer row locked with SELECT ... FOR UPDATE until the surrounding
+    transaction ends; concurrent loan decisions for the same customer
+    queue here. Must be called inside transaction.atomic()
+    Raises Customer.DoesNotExist
+    """
+    return Customer.objects.select_for_update().get(id=customer_id)
+
+
 @api_view(['GET'])
 def view_loan(request, loan_id):
     """
@@ -19,39 +53,119 @@ def view_loan(request, loan_id):
     Returns: Loan details with customer info 
     """
     try : 
-        loan = Loan.objects.get(id=loan_id)
+        # Loan and customer in one query, serialized without LoanSerializer
+        data = serialize_loan(loan_id)
 
     except Loan.DoesNotExist:
         return Response(
             {"error": "Loan not found."},
             status=status.HTTP_404_NOT_FOUND
         )
-    
-    serializer = LoanSerializer(loan)
 
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response(data, status=status.HTTP_200_OK)
 @api_view(['GET'])
 def view_loans(request, customer_id):
     """
     API endpoint: /view-loan/<customer_id>
     Method: GET
     Returns: List of all loans for a customer 
+    Optional query parameters:
+        ?page_size=N&cursor=<last loan id>  one page in loan id order,
+            as {"results": [...], "next_cursor": <id or null>}
+        ?stream=1  the full list, written to the response loan by loan
     """
+    try:
+        cursor, page_size = loan_page_params(request.query_params)
+    except ValueError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
     try :
-        customer = Customer.objects.get(id=customer_id)
+        # Serialized once, shared by all the loans below
+        customer = get_customer_dict(customer_id)
 
     except Customer.DoesNotExist:
         return Response(
             {"error": "Customer not found."},
             status=status.HTTP_404_NOT_FOUND
         )
-    loans = customer.loans.all()  # Using related_name from ForeignKey
-    serializer = LoanListSerializer(loans, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    loans = Loan.objects.filter(customer_id=customer_id)
+
+    # Streaming: constant memory however many loans the customer has
+    if request.query_params.get('stream') == '1':
+        loans = loans.order_by('id')
+        if cursor is not None:
+            loans = loans.filter(id__gt=cursor)
+        return StreamingHttpResponse(stream_loans_json(loans, customer), content_type='application/json')
+
+    # Keyset pagination on loan id
+    if page_size is not None:
+        rows = list(loan_rows(loans.filter(id__gt=cursor or 0).order_by('id'))[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        return Response({
+            "results": [loan_dict(row, customer) for row in rows],
+            "next_cursor": rows[-1]['id'] if has_more else None,
+        }, status=status.HTTP_200_OK)
+
+    return Response(serialize_loans(loans, customer), status=status.HTTP_200_OK)
+
+
+def loan_page_params(query_params):
+    """
+    (cursor, page_size) from ?cursor=...&page_size=...
+    page_size is None when the client asked for no page; a cursor alone
+    means the default VIEW_LOANS_PAGE_SIZE
+    Raises ValueError with a message for the client
+    """
+    from django.conf import settings
+
+    cursor = query_params.get('cursor')
+    page_size = query_params.get('page_size')
+    try:
+        cursor = int(cursor) if cursor not in (None, '') else None
+        page_size = int(page_size) if page_size not in (None, '') else None
+    except ValueError:
+        raise ValueError("cursor and page_size must be integers")
+
+    max_page_size = getattr(settings, 'VIEW_LOANS_MAX_PAGE_SIZE', 1000)
+    if page_size is None and cursor is not None:
+        page_size = getattr(settings, 'VIEW_LOANS_PAGE_SIZE', 100)
+    if page_size is not None and not 1 <= page_size <= max_page_size:
+        raise ValueError(f"page_size must be between 1 and {max_page_size}")
+    if cursor is not None and cursor < 0:
+        raise ValueError("cursor must be a loan id")
+    return cursor, page_size
+
+
+def stream_loans_json(loans, customer):
+    """
+    The loans as one JSON array, produced chunk by chunk: the same bytes
+    as rendering LoanListSerializer(loans, many=True), without holding
+    more than VIEW_LOANS_STREAM_CHUNK_SIZE loans at a time
+    `customer` is the already serialized customer of the loans
+    """
+    from django.conf import settings
+
+    chunk_size = getattr(settings, 'VIEW_LOANS_STREAM_CHUNK_SIZE', 500)
+    renderer = ORJSONRenderer()
+    chunk = [b'[']
+    separator = b''
+    for count, row in enumerate(loan_rows(loans).iterator(chunk_size=chunk_size), start=1):
+        chunk.append(separator)
+        chunk.append(renderer.render(loan_dict(row, customer)))
+        separator = b','
+        if count % chunk_size == 0:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
 def round_to_nearest_lakh(amount):
     """Round amount to nearest lakh"""
     return round(amount / 100000) * 100000
 @api_view(['POST'])
+@idempotent('register')
 def register_customer(request):
     """
     API endpoint: /register
@@ -82,145 +196,6 @@ def register_customer(request):
     response_serializer = CustomerResponseSerializer(customer)
     return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
-def months_between(start_date, end_date):
-    """Calculate number of months between two dates"""
-    if end_date < start_date:
-        return 0
-    delta = relativedelta(end_date, start_date)
-    return delta.years * 12 + delta.months
-
-def calculate_credit_score(customer):
-    """
-    Calculate credit score (0-100) for a customer
-    Current date: 2026-02-09
-    """
-    current_date = get_current_date()
-    
-    # Get all customer loans
-    loans = customer.loans.all()
-    
-    if len(loans) == 0:
-        return 0  # No credit history
-    
-    # OVERRIDE: Check if current debt > approved limit
-    # Calculate current debt
-    # For each ACTIVE loan, calculate remaining amount
-    # remaining = loan_amount - (emis_paid * monthly_payment)
-    # Then sum all active loan remainings
-    
-    current_debt = Decimal(0)
-    for loan in loans:
-        # Check if loan is still active (end_date >= current_date)
-        # If active, calculate remaining debt
-        # Add to current_debt
-        if loan.end_date >= current_date:
-            remaining = loan.loan_amount - (loan.emis_paid_on_time * loan.monthly_payment)
-            current_debt += remaining
-
-        # pass
-    
-    if current_debt > customer.approved_limit:
-        return 0  # OVERRIDE CONDITION
-    
-    
-    # ========== COMPONENT 1: PAYMENT HISTORY (50 points) ==========
-    total_payment_score = 0
-    
-    for loan in loans:
-        # Calculate payment ratio for this loan
-        # 
-        # If loan ended before today:
-        #     payment_ratio = emis_paid / tenure
-        # Else (loan still active):
-        #     expected_emis = months_between(start_date, today)
-        #     payment_ratio = min(emis_paid / expected_emis, 1.0)
-        
-        # Write the logic here
-        if loan.end_date < current_date:
-            payment_ratio = loan.emis_paid_on_time / loan.tenure
-        else:
-            expected_emis = months_between(loan.date_of_approval, current_date)
-            if expected_emis > 0:
-                payment_ratio = min(loan.emis_paid_on_time / expected_emis, 1.0)
-            else:
-                payment_ratio = 1.0  # If loan just started, consider it good payment history
-        total_payment_score += payment_ratio
-
-    payment_history_score = (total_payment_score / len(loans)) * 50
-    
-    
-    # ========== COMPONENT 2: NUMBER OF LOANS (15 points) ==========
-    num_loans = len(loans)
-    
-    # Assign score based on number of loans
-    # 0 loans: 0 points
-    # 1-3 loans: 15 points
-    # 4-6 loans: 10 points
-    # 7+ loans: 5 points
-    
-    if num_loans == 0:
-        num_loans_score = 0
-    elif 1 <= num_loans <= 3:
-        num_loans_score = 15
-    elif 4 <= num_loans <= 6:
-        num_loans_score = 10
-    else:
-        num_loans_score = 5  # 7+ loans: 5 points
-    
-    
-    # ========== COMPONENT 3: LOAN VOLUME (20 points) ==========
-    # We already calculated current_debt above
-    
-    if customer.approved_limit > 0:
-        utilization_ratio = float(current_debt / customer.approved_limit)
-    else:
-        utilization_ratio = 0
-    
-    # Score based on utilization
-    # < 30%: 20 points
-    # 30-50%: 15 points
-    # 50-80%: 10 points
-    # > 80%: 5 points
-    
-    if utilization_ratio < 0.3:
-        volume_score = 20
-    elif 0.3 <= utilization_ratio < 0.5:
-        volume_score = 15
-    elif 0.5 <= utilization_ratio < 0.8:
-        volume_score = 10
-    else:
-        volume_score = 5  # > 80% utilization: 5 points
-    
-    
-    # ========== COMPONENT 4: CURRENT YEAR ACTIVITY (15 points) ==========
-    current_year = 2026
-    active_loans_2026 = 0
-    
-    for loan in loans:
-        # Check if loan is active in 2026
-        # loan started <= 2026 AND loan ends >= 2026
-        # Write the logic
-        if loan.date_of_approval.year <= current_year and loan.end_date.year >= current_year:
-            active_loans_2026 += 1
-        # pass
-    
-    # Score based on active loans
-    # 0 active: 15 points
-    # 1-2 active: 10 points
-    # 3+ active: 5 points
-    
-    if active_loans_2026 == 0:
-        activity_score = 15
-    elif 1 <= active_loans_2026 <= 2:
-        activity_score = 10
-    else:
-        activity_score = 5
-    
-    
-    # ========== TOTAL SCORE ==========
-    total_score = payment_history_score + num_loans_score + volume_score + activity_score
-    
-    return round(total_score)
 def calculate_emi(loan_amount, annual_interest_rate, tenure_months):
     """
     Calculate monthly EMI using compound interest formula
@@ -229,6 +204,9 @@ def calculate_emi(loan_amount, annual_interest_rate, tenure_months):
     P = loan amount
     r = monthly interest rate (annual rate / 12 / 100)
     n = tenure in months
+
+    This is the reference formula: the views use loans.emi.monthly_emi,
+    the same EMI from a memoized annuity-factor table, rounded to the paisa
     """
     # YOUR TASK: Implement the EMI formula
     # Hint 1: Convert annual interest rate to monthly: monthly_rate = annual_rate / 12 / 100
@@ -242,54 +220,70 @@ def calculate_emi(loan_amount, annual_interest_rate, tenure_months):
     
     # pass  # Remove and write your code
 
-@api_view(['POST'])
-def check_eligibility(request):
+def correct_interest_rate(credit_score, interest_rate):
     """
-    API endpoint: /check-eligibility
-    Method: POST
-    Input: customer_id, loan_amount, interest_rate, tenure
-    Output: approval decision with corrected interest rate and EMI
+    Determine approval and correct interest rate based on credit score
+    Returns (approval, corrected_interest_rate)
+
+    If credit_score > 50:
+        approval = True
+        corrected_rate = interest_rate (no change)
+
+    If 30 < credit_score <= 50:
+        if interest_rate < 12:
+            corrected_rate = 12
+        else:
+            corrected_rate = interest_rate
+        approval = True
+
+    If 10 < credit_score <= 30:
+        if interest_rate < 16:
+            corrected_rate = 16
+        else:
+            corrected_rate = interest_rate
+        approval = True
+
+    If credit_score <= 10:
+        approval = False
+    """
+    if credit_score > 50:
+        return True, interest_rate
+    elif 30 < credit_score <= 50:
+        if interest_rate < 12:
+            return True, Decimal(12)
+        return True, interest_rate
+    elif 10 < credit_score <= 30:
+        if interest_rate < 16:
+            return True, Decimal(16)
+        return True, interest_rate
+    else:  # credit_score <= 10
+        return False, interest_rate
+
+
+def eligibility_result(customer, credit, validated_data):
+    """
+    Eligibility decision for one validated /check-eligibility request
+    `credit` is the customer's snapshot from the score cache
+    Returns the response body
     """
-    
-    # Step 1: Validate input
-    serializer = LoanEligibilityRequestSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    validated_data = serializer.validated_data
     customer_id = validated_data['customer_id']
     loan_amount = validated_data['loan_amount']
     interest_rate = validated_data['interest_rate']
     tenure = validated_data['tenure']
+
+    # Credit score (cached, with the profile aggregates)
+    credit_score = credit['credit_score']
     
-    # Step 2: Get customer
-    try:
-        customer = Customer.objects.get(id=customer_id)
-    except Customer.DoesNotExist:
-        return Response(
-            {"error": "Customer not found"},
-            status=status.HTTP_404_NOT_FOUND
-        )
-    
-    # Step 3: Calculate credit score
-    credit_score = calculate_credit_score(customer)
-    
-    # Step 4: Check EMI constraint (sum of current EMIs > 50% salary?)
-    # YOUR TASK: Calculate sum of monthly payments for all active loans
-    # Hint: Loop through customer.loans.all(), check if active, sum monthly_payment
-    
-    current_emis = Decimal(0)
-    # TODO: Write the logic here
-    for loan in customer.loans.all():
-        if loan.end_date >= get_current_date():  # Check if loan is active
-            current_emis += loan.monthly_payment
+    # Check EMI constraint (sum of current EMIs > 50% salary?)
+    # Sum of monthly payments for all active loans, kept in the profile
+    current_emis = credit['active_emi_total']
     
     # Check if adding new EMI would exceed 50% of salary
-    new_emi = calculate_emi(loan_amount, interest_rate, tenure)
+    new_emi = monthly_emi(loan_amount, interest_rate, tenure)
     total_emis_with_new_loan = current_emis + Decimal(new_emi)
     
     if total_emis_with_new_loan > (customer.monthly_salary * Decimal(0.5)):
-        return Response({
+        return {
             "customer_id": customer_id,
             "approval": False,
             "interest_rate": float(interest_rate),
@@ -297,74 +291,31 @@ def check_eligibility(request):
             "tenure": tenure,
             "monthly_installment": float(new_emi),
             "message": "Sum of current EMIs exceeds 50% of monthly salary"
-        })
+        }
     
-    # Step 5: Determine approval and correct interest rate based on credit score
-    # YOUR TASK: Implement the approval logic
-    #
-    # If credit_score > 50:
-    #     approval = True
-    #     corrected_rate = interest_rate (no change)
-    #
-    # If 30 < credit_score <= 50:
-    #     if interest_rate < 12:
-    #         corrected_rate = 12
-    #     else:
-    #         corrected_rate = interest_rate
-    #     approval = True
-    #
-    # If 10 < credit_score <= 30:
-    #     if interest_rate < 16:
-    #         corrected_rate = 16
-    #     else:
-    #         corrected_rate = interest_rate
-    #     approval = True
-    #
-    # If credit_score <= 10:
-    #     approval = False
-    
-    # TODO: Write the logic here
-    if credit_score > 50:
-        approval = True
-        corrected_interest_rate = interest_rate
-    elif 30 < credit_score <= 50:
-        approval = True
-        if interest_rate < 12:
-            corrected_interest_rate = Decimal(12)
-        else:
-            corrected_interest_rate = interest_rate
-    elif 10 < credit_score <= 30:
-        approval = True
-        if interest_rate < 16:
-            corrected_interest_rate = Decimal(16)
-        else:
-            corrected_interest_rate = interest_rate
-    else:  # credit_score <= 10
-        approval = False
-        corrected_interest_rate = interest_rate
-
-    # approval = False
-    # corrected_interest_rate = interest_rate
+    # Determine approval and correct interest rate based on credit score
+    approval, corrected_interest_rate = correct_interest_rate(credit_score, interest_rate)
     
     # Recalculate EMI with corrected interest rate
-    final_emi = calculate_emi(loan_amount, corrected_interest_rate, tenure)
+    final_emi = monthly_emi(loan_amount, corrected_interest_rate, tenure)
     
-    # Return response
-    return Response({
+    return {
         "customer_id": customer_id,
         "approval": approval,
         "interest_rate": float(interest_rate),
         "corrected_interest_rate": float(corrected_interest_rate),
         "tenure": tenure,
         "monthly_installment": float(final_emi)
-    })
+    }
+
+
 @api_view(['POST'])
-def create_loan(request):
+def check_eligibility(request):
     """
-    API endpoint: /create-loan
+    API endpoint: /check-eligibility
     Method: POST
     Input: customer_id, loan_amount, interest_rate, tenure
-    Output: Created loan if approved, error message if rejected
+    Output: approval decision with corrected interest rate and EMI
     """
     
     # Step 1: Validate input
@@ -373,93 +324,234 @@ def create_loan(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     validated_data = serializer.validated_data
-    customer_id = validated_data['customer_id']
-    loan_amount = validated_data['loan_amount']
-    interest_rate = validated_data['interest_rate']
-    tenure = validated_data['tenure']
     
-    # Step 2: Get customer
+    # Step 2: Get customer (with its credit profile)
     try:
-        customer = Customer.objects.get(id=customer_id)
+        customer = get_customer_for_scoring(validated_data['customer_id'])
     except Customer.DoesNotExist:
         return Response(
             {"error": "Customer not found"},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Step 3: Calculate credit score
-    credit_score = calculate_credit_score(customer)
-    
-    # Step 4: Check EMI constraint
-    current_emis = Decimal(0)
-    current_date = get_current_date()
-    
-    for loan in customer.loans.all():
-        if loan.end_date >= current_date:
-            current_emis += loan.monthly_payment
-    
-    new_emi = calculate_emi(loan_amount, interest_rate, tenure)
-    total_emis_with_new_loan = current_emis + Decimal(new_emi)
-    
-    if total_emis_with_new_loan > (customer.monthly_salary * Decimal(0.5)):
-        return Response({
-            "loan_id": None,
-            "customer_id": customer_id,
-            "loan_approved": False,
-            "message": "Sum of current EMIs exceeds 50% of monthly salary",
-            "monthly_installment": float(new_emi)
-        })
-    
-    # Step 5: Determine approval and corrected interest rate
-    if credit_score > 50:
-        approval = True
-        corrected_interest_rate = interest_rate
-    elif 30 < credit_score <= 50:
-        approval = True
-        if interest_rate < 12:
-            corrected_interest_rate = Decimal(12)
+    # Step 3: Score and decide
+    credit = get_credit_snapshot(customer)
+    result = eligibility_result(customer, credit, validated_data)
+    metrics.record_decision('check_eligibility', result['approval'])
+    return Response(result)
+
+
+@api_view(['POST'])
+def check_eligibility_batch(request):
+    """
+    API endpoint: /check-eligibility-batch
+    Method: POST
+    Input: list of {customer_id, loan_amount, interest_rate, tenure}
+    Output: {"results": [{"status": ..., "body": ...}, ...]} in input order,
+            each body exactly what /check-eligibility returns for that item
+    Customers and credit scores are fetched for the whole batch at once
+    """
+    from django.conf import settings
+
+    items = request.data
+    if not isinstance(items, list):
+        return Response(
+            {"error": "Expected a list of applications"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    max_items = getattr(settings, 'ELIGIBILITY_BATCH_MAX_ITEMS', 5000)
+    if len(items) > max_items:
+        return Response(
+            {"error": f"At most {max_items} applications per batch"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Step 1: Validate every item
+    entries = []
+    for item in items:
+        serializer = LoanEligibilityRequestSerializer(data=item)
+        if serializer.is_valid():
+            entries.append((serializer.validated_data, None))
         else:
-            corrected_interest_rate = interest_rate
-    elif 10 < credit_score <= 30:
-        approval = True
-        if interest_rate < 16:
-            corrected_interest_rate = Decimal(16)
+            entries.append((None, serializer.errors))
+
+    # Step 2: All customers and their credit snapshots at once
+    customers = Customer.objects.select_related('credit_profile').in_bulk(
+        {data['customer_id'] for data, _ in entries if data is not None}
+    )
+    credits = get_credit_snapshots(customers.values())
+
+    # Step 3: Decide per item
+    results = []
+    for data, errors in entries:
+        if errors is not None:
+            results.append({"status": status.HTTP_400_BAD_REQUEST, "body": errors})
+        elif data['customer_id'] not in customers:
+            results.append({"status": status.HTTP_404_NOT_FOUND, "body": {"error": "Customer not found"}})
         else:
-            corrected_interest_rate = interest_rate
-    else:  # credit_score <= 10
-        approval = False
-        corrected_interest_rate = interest_rate
-    
-    # Step 6: If NOT approved, return rejection
+            customer = customers[data['customer_id']]
+            results.append({
+                "status": status.HTTP_200_OK,
+                "body": eligibility_result(customer, credits[customer.pk], data)
+            })
+    return Response({"results": results})
+
+
+@api_view(['POST'])
+def loan_offers(request):
+    """
+    API endpoint: /loan-offers
+    Method: POST
+    Input: customer_id, interest_rate, min_tenure (default 6), max_tenure (default 60)
+    Output: the largest loan amount /check-eligibility would approve for
+            each tenure in the range, with its EMI at the corrected rate
+    """
+
+    # Step 1: Validate input
+    serializer = LoanOfferRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    validated_data = serializer.validated_data
+    interest_rate = validated_data['interest_rate']
+
+    # Step 2: Get customer (with its credit profile)
+    try:
+        customer = get_customer_for_scoring(validated_data['customer_id'])
+    except Customer.DoesNotExist:
+        return Response(
+            {"error": "Customer not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Step 3: Score, correct the rate and work out the EMI capacity
+    credit = get_credit_snapshot(customer)
+    approval, corrected_interest_rate = correct_interest_rate(credit['credit_score'], interest_rate)
+    emi_capacity = customer.monthly_salary * Decimal(0.5) - credit['active_emi_total']
+
+    result = {
+        "customer_id": customer.id,
+        "credit_score": credit['credit_score'],
+        "interest_rate": float(interest_rate),
+        "corrected_interest_rate": float(corrected_interest_rate),
+        "emi_capacity": float(max(emi_capacity, 0)),
+        "offers": [],
+    }
     if not approval:
-        return Response({
-            "loan_id": None,
-            "customer_id": customer_id,
-            "loan_approved": False,
-            "message": f"Credit score too low (score: {credit_score})",
-            "monthly_installment": float(new_emi)
-        })
+        result["message"] = f"Credit score too low (score: {credit['credit_score']})"
+        return Response(result)
+    if emi_capacity <= 0:
+        result["message"] = "Sum of current EMIs exceeds 50% of monthly salary"
+        return Response(result)
+
+    # Step 4: Largest amount per tenure, all tenures at once
+    tenures = range(validated_data['min_tenure'], validated_data['max_tenure'] + 1)
+    for tenure, amount in zip(tenures, max_loan_amounts(emi_capacity, corrected_interest_rate, tenures)):
+        if amount > 0:
+            result["offers"].append({
+                "tenure": tenure,
+                "max_loan_amount": float(amount),
+                "monthly_installment": float(monthly_emi(amount, corrected_interest_rate, tenure)),
+            })
+    return Response(result)
+
+
+@api_view(['POST'])
+@idempotent('create-loan')
+def create_loan(request):
+    """
+    API endpoint: /create-loan
+    Method: POST
+    Input: customer_id, loan_amount, interest_rate, tenure
+    Output: Created loan if approved, error message if rejected
+    """
     
-    # Step 7: If APPROVED, create the loan!
-    final_emi = calculate_emi(loan_amount, corrected_interest_rate, tenure)
+    # Step 1: Validate input
+    serializer = LoanEligibilityRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    # Calculate dates
-    start_date = get_current_date()
-    end_date = start_date + relativedelta(months=tenure)
+    validated_data = serializer.validated_data
+    customer_id = validated_data['customer_id']
+    loan_amount = validated_data['loan_amount']
+    interest_rate = validated_data['interest_rate']
+    tenure = validated_data['tenure']
     
-    # Create loan object
-    new_loan = Loan.objects.create(
-        customer=customer,
-        loan_amount=loan_amount,
-        tenure=tenure,
-        interest_rate=corrected_interest_rate,
-        monthly_payment=final_emi,
-        emis_paid_on_time=0,
-        date_of_approval=start_date,
-        end_date=end_date
-    )
+    # Steps 2-7 run in one transaction holding a lock on the customer row,
+    # so concurrent requests for the same customer decide one at a time and
+    # each sees the loans the previous one inserted
+    with transaction.atomic():
+        # Step 2: Get customer (locked until commit)
+        try:
+            customer = lock_customer_for_lending(customer_id)
+        except Customer.DoesNotExist:
+            return Response(
+                {"error": "Customer not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Step 3: Calculate credit score from the credit profile, read after
+        # taking the lock (a cached score may predate a loan committed just
+        # before we got it)
+        credit = build_snapshot(get_credit_profile(customer), customer.approved_limit)
+        credit_score = credit['credit_score']
+        
+        # Step 4: Check EMI constraint
+        current_emis = credit['active_emi_total']
+        
+        new_emi = monthly_emi(loan_amount, interest_rate, tenure)
+        total_emis_with_new_loan = current_emis + Decimal(new_emi)
+        
+        if total_emis_with_new_loan > (customer.monthly_salary * Decimal(0.5)):
+            metrics.record_decision('create_loan', False)
+            return Response({
+                "loan_id": None,
+                "customer_id": customer_id,
+                "loan_approved": False,
+                "message": "Sum of current EMIs exceeds 50% of monthly salary",
+                "monthly_installment": float(new_emi)
+            })
+        
+        # Step 5: Determine approval and corrected interest rate
+        approval, corrected_interest_rate = correct_interest_rate(credit_score, interest_rate)
+        
+        # Step 6: If NOT approved, return rejection
+        if not approval:
+            metrics.record_decision('create_loan', False)
+            return Response({
+                "loan_id": None,
+                "customer_id": customer_id,
+                "loan_approved": False,
+                "message": f"Credit score too low (score: {credit_score})",
+                "monthly_installment": float(new_emi)
+            })
+        
+        # Step 7: If APPROVED, create the loan!
+        final_emi = monthly_emi(loan_amount, corrected_interest_rate, tenure)
+        
+        # Calculate dates
+        start_date = get_current_date()
+        end_date = start_date + relativedelta(months=tenure)
+        
+        # Create loan object (the credit profile is updated by the
+        # post_save signal, still inside this transaction)
+        new_loan = Loan.objects.create(
+            customer=customer,
+            loan_amount=loan_amount,
+            tenure=tenure,
+            interest_rate=corrected_interest_rate,
+            monthly_payment=final_emi,
+            emis_paid_on_time=0,
+            date_of_approval=start_date,
+            end_date=end_date
+        )
+
+        # A new loan is owed in full; the customer row is locked by
+        # lock_customer_for_lending, so the increment cannot be lost
+        Customer.objects.filter(pk=customer.pk).update(current_debt=F('current_debt') + loan_amount)
     
     # Step 8: Return success response
+    metrics.record_decision('create_loan', True)
     return Response({
         "loan_id": new_loan.id,
         "customer_id": customer_id,
@@ -467,10 +559,146 @@ def create_loan(request):
         "message": "Loan approved",
         "monthly_installment": float(final_emi)
     }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def loan_schedule(request, loan_id):
+    """
+    API endpoint: /loan-schedule/<loan_id>
+    Method: GET
+    Returns: Month-by-month amortization schedule (due date, payment,
+             principal, interest, balance) of the loan
+    ?mark_paid=1 flags the installments covered by emis_paid_on_time
+    """
+    try:
+        data = schedules.loan_schedule(loan_id, mark_paid=request.query_params.get('mark_paid') == '1')
+    except Loan.DoesNotExist:
+        return Response({"error": "Loan not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def loan_schedules_export(request):
+    """
+    API endpoint: /loan-schedules
+    Method: POST
+    Input: {"loan_ids": [...], "mark_paid": false}
+    Output: CSV of the schedules of all the loans, one row per installment
+            (loan_id, customer_id, installment, due_date, payment, principal,
+            interest, balance[, paid]), streamed
+    """
+    from django.conf import settings
+
+    loan_ids = request.data.get('loan_ids') if isinstance(request.data, dict) else None
+    # bool is an int subclass; reject true/false as the serializers' IntegerField does
+    if not isinstance(loan_ids, list) or not all(
+            isinstance(loan_id, int) and not isinstance(loan_id, bool) for loan_id in loan_ids):
+        return Response(
+            {"error": "Expected {\"loan_ids\": [...]} with integer loan ids"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    max_loans = getattr(settings, 'LOAN_SCHEDULE_BATCH_MAX_LOANS', 10000)
+    if len(loan_ids) > max_loans:
+        return Response(
+            {"error": f"At most {max_loans} loans per export"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    inputs, schedule = schedules.schedule_for_loans(
+        Loan.objects.filter(id__in=set(loan_ids)), mark_paid=request.data.get('mark_paid') is True
+    )
+    missing = sorted(set(loan_ids) - set(inputs['loan_id'].tolist()))
+    if missing:
+        return Response({"error": "Loans not found", "loan_ids": missing}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(schedules.schedule_csv_chunks(inputs, schedule), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="loan-schedules.csv"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def portfolio_export(request):
+    """
+    API endpoint: /portfolio-export
+    Method: GET
+    Input: ?output=csv (default) or parquet, ?approval_year=YYYY (optional)
+    Returns: every loan with its customer, credit score and repayments
+    left (customers without loans on a row of their own), streamed in
+    chunks; admin users only
+    """
+    from django.conf import settings
+
+    output = request.query_params.get('output', 'csv')
+    if output not in ('csv', 'parquet'):
+        return Response({"error": "output must be csv or parquet"}, status=status.HTTP_400_BAD_REQUEST)
+    if output == 'parquet' and export.pa is None:
+        return Response({"error": "Parquet export is not available (pyarrow is not installed)"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    approval_year = request.query_params.get('approval_year')
+    if approval_year is not None:
+        if not approval_year.isdigit():
+            return Response({"error": "approval_year must be a year"}, status=status.HTTP_400_BAD_REQUEST)
+        approval_year = int(approval_year)
+
+    chunk_size = getattr(settings, 'PORTFOLIO_EXPORT_CHUNK_SIZE', 5000)
+    rows = export.export_rows(chunk_size=chunk_size, approval_year=approval_year)
+    name = f"portfolio{f'-{approval_year}' if approval_year else ''}.{output}"
+    if output == 'csv':
+        response = StreamingHttpResponse(export.csv_chunks(rows, chunk_size), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(export.parquet_chunks(rows, chunk_size),
+                                         content_type='application/vnd.apache.parquet')
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def list_request_profiles(request):
+    """
+    API endpoint: /profiles
+    Method: GET
+    Returns: stored request profiles, newest first, with their duration
+    and time per tag (see loans/profiling.py); admin users only
+    """
+    return Response({"profiles": profiling.list_profiles()})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def download_request_profile(request, profile_id):
+    """
+    API endpoint: /profiles/<profile_id>
+    Method: GET
+    Input: ?report=1 for a text report instead of the .prof file
+    Returns: the profile in pstats format, as a download; admin users only
+    """
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+    if request.query_params.get('report') in ('1', 'true'):
+        return HttpResponse(profiling.profile_report(path), content_type='text/plain; charset=utf-8')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name,
+                        content_type='application/octet-stream')
+
 # ============================================================================
 # DEBUG ENDPOINTS (Remove these in production!)
 # ============================================================================
 
+@require_GET
+def prometheus_metrics(request):
+    """
+    API endpoint: /metrics
+    Method: GET
+    Returns: request latency, database and decision metrics in Prometheus
+    text format (see loans/metrics.py)
+    """
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @api_view(['GET'])
 def system_info(request):
     """
@@ -501,32 +729,28 @@ def debug_credit_score(request, customer_id):
     Returns: Detailed credit score breakdown
     """
     try:
-        customer = Customer.objects.get(id=customer_id)
+        customer = get_customer_for_scoring(customer_id)
     except Customer.DoesNotExist:
         return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
     
     # Calculate credit score
-    score = calculate_credit_score(customer)
+    credit = get_credit_snapshot(customer)
+    score = credit['credit_score']
     
-    # Get loan statistics
-    current_date = get_current_date()
-    total_loans = customer.loans.count()
-    active_loans = customer.loans.filter(end_date__gte=current_date).count()
-    completed_loans = customer.loans.filter(end_date__lt=current_date).count()
+    # Get loan statistics (from the credit profile)
+    total_loans = credit['loan_count']
+    active_loans = credit['active_loan_count']
+    completed_loans = total_loans - active_loans
     
-    # Calculate current debt
-    current_debt = Decimal(0)
-    for loan in customer.loans.all():
-        if loan.end_date >= current_date:
-            remaining = loan.loan_amount - (Decimal(loan.emis_paid_on_time) * loan.monthly_payment)
-            current_debt += remaining
+    # Current debt = remaining amount of all active loans
+    current_debt = credit['active_debt']
     
     return Response({
         "customer_id": customer_id,
         "customer_name": f"{customer.first_name} {customer.last_name}",
         "credit_score": score,
-        "approved_limit": float(customer.approved_limit),
-        "current_debt": float(current_debt),
+        "approved_limit": customer.approved_limit,
+        "current_debt": current_debt,
         "debt_utilization": f"{float((current_debt / customer.approved_limit) * 100):.2f}%" if customer.approved_limit > 0 else "0%",
         "loan_statistics": {
             "total_loans": total_loans,
@@ -558,19 +782,19 @@ def debug_customer_emis(request, customer_id):
     active_loans = []
     total_emis = Decimal(0)
     
-    for loan in customer.loans.all():
-        if loan.end_date >= current_date:
-            active_loans.append({
-                "loan_id": loan.id,
-                "loan_amount": float(loan.loan_amount),
-                "monthly_payment": float(loan.monthly_payment),
-                "emis_paid": loan.emis_paid_on_time,
-                "total_emis": loan.tenure,
-                "repayments_left": loan.tenure - loan.emis_paid_on_time,
-                "date_of_approval": str(loan.date_of_approval),
-                "end_date": str(loan.end_date)
-            })
-            total_emis += loan.monthly_payment
+    # One query for the active loans, filtered in the database
+    for loan in customer.loans.active(current_date).order_by('id'):
+        active_loans.append({
+            "loan_id": loan.id,
+            "loan_amount": loan.loan_amount,
+            "monthly_payment": loan.monthly_payment,
+            "emis_paid": loan.emis_paid_on_time,
+            "total_emis": loan.tenure,
+            "repayments_left": loan.tenure - loan.emis_paid_on_time,
+            "date_of_approval": loan.date_of_approval,
+            "end_date": loan.end_date
+        })
+        total_emis += loan.monthly_payment
     
     fifty_percent = customer.monthly_salary * Decimal(0.5)
     remaining_capacity = fifty_percent - total_emis
@@ -578,14 +802,53 @@ def debug_customer_emis(request, customer_id):
     return Response({
         "customer_id": customer_id,
         "customer_name": f"{customer.first_name} {customer.last_name}",
-        "monthly_salary": float(customer.monthly_salary),
-        "fifty_percent_salary": float(fifty_percent),
-        "current_total_emis": float(total_emis),
+        "monthly_salary": customer.monthly_salary,
+        "fifty_percent_salary": fifty_percent,
+        "current_total_emis": total_emis,
         "emi_utilization_percentage": f"{float((total_emis / customer.monthly_salary) * 100):.2f}%",
-        "remaining_emi_capacity": float(remaining_capacity),
+        "remaining_emi_capacity": remaining_capacity,
         "can_afford_new_loan": remaining_capacity > 0,
-        "max_new_emi_allowed": float(max(remaining_capacity, 0)),
+        "max_new_emi_allowed": max(remaining_capacity, 0),
         "active_loans_count": len(active_loans),
         "active_loans": active_loans,
         "status": "OVER LIMIT" if total_emis > fifty_percent else "WITHIN LIMIT"
-    })
\ No newline at end of file
+    })
+
+
+@api_view(['GET'])
+def debug_score_cache(request):
+    """
+    API endpoint: /debug-score-cache
+    Method: GET
+    Returns: Hit/miss counters of the credit score cache (this process)
+    """
+    from django.conf import settings
+
+    cache_name = getattr(settings, 'CREDIT_SCORE_CACHE', 'default')
+    return Response({
+        "cache": cache_name,
+        "options": settings.CACHES.get(cache_name, {}).get('OPTIONS', {}),
+        **cache_stats()
+    })
+
+@api_view(['GET'])
+def debug_db_pool(request):
+    """
+    API endpoint: /debug-db-pool
+    Method: GET
+    Returns: Connection settings of each database and, for pooled ones,
+             the pool counters of this process (checked out, waits, wait time)
+    """
+    from django.db import connections
+    from credit_system.db.pool import pool_stats
+
+    pools = pool_stats()
+    return Response({
+        alias: {
+            "engine": connections[alias].settings_dict['ENGINE'],
+            "conn_max_age": connections[alias].settings_dict['CONN_MAX_AGE'],
+            "conn_health_checks": connections[alias].settings_dict['CONN_HEALTH_CHECKS'],
+            "pool": pools.get(alias),
+        }
+        for alias in connections
+    })